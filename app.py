@@ -1,23 +1,73 @@
 """
 TradingView Webhook to Telegram Bot - نسخة مبسطة جداً
 """
-from flask import Flask, request, jsonify
-import requests
+from flask import Flask, request, jsonify, Response, stream_with_context
 import os
 import time
 import logging
 import json
-import re
 from datetime import datetime
+from functools import lru_cache, partial
 from dotenv import load_dotenv
 from pathlib import Path
+import queue
+from delivery_queue import DeliveryQueue, create_delivery_records
+from payload_parser import extract_payload, parse_bulk
+from dedup import create_dedup_store, SignalDeduplicator
+from coalescer import Coalescer, build_digests
+from config import DELIVERY_MODE, DELIVERY_QUEUE_SIZE, DELIVERY_WORKERS, DELIVERY_DB_FILE, DELIVERY_HISTORY_TTL, CHAT_HEALTH_PREFLIGHT
+from telegram_bot import rate_limiter, fan_out_message, chat_health, _is_membership_error, get_outbox
+from rate_limiter import parse_retry_after
+from telegram_client import TelegramClient
+from trade_store import create_trade_store, CLOSED_STATUSES
+from position_index import signal_direction
+from signals import create_registry, ACTION_OPEN
+from message_threads import create_message_threads, reply_parameters, ACTION_EDIT, ACTION_REPLY
+from message_templates import Template, render
+from startup import StartupTasks, default_deployment_id, on_sigterm
+from metrics import (
+    REGISTRY,
+    CONTENT_TYPE,
+    WEBHOOK_STAGE_SECONDS,
+    SIGNALS_TOTAL,
+    DUPLICATES_TOTAL,
+    MESSAGE_THREAD_EVENTS_TOTAL,
+    register_delivery_gauges
+)
+from config import (
+    TRADE_STORE_BACKEND,
+    TRADES_DB_FILE,
+    TRADES_JOURNAL_FILE,
+    TRADES_JOURNAL_FSYNC,
+    TRADES_COMPACT_MIN_EVENTS,
+    TRADES_PAGE_MAX_LIMIT,
+    TRADES_STREAM_BATCH,
+    DEDUP_ENTRY_WINDOW,
+    DEDUP_EXIT_WINDOW,
+    DEDUP_WINDOWS,
+    DEDUP_CAPACITY,
+    DEDUP_BACKEND,
+    DEDUP_DB_FILE,
+    COALESCE_WINDOW_MS,
+    COALESCE_MAX_MESSAGES,
+    BULK_MAX_ITEMS,
+    STARTUP_LOCK_FILE,
+    STARTUP_DEPLOYMENT_ID,
+    OUTBOX_DRAIN_TIMEOUT,
+    MESSAGE_THREAD_MODE,
+    MESSAGE_THREAD_CHATS,
+    MESSAGE_THREADS_DB_FILE,
+    MESSAGE_THREADS_TTL_DAYS
+)
 
 load_dotenv()
 
 # إعدادات
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '8361920962:AAFkWchaQStjaD09ayMI8VYm1vadr4p6zEY')
 CHAT_ID = os.getenv('TELEGRAM_CHAT_ID', '-1003214062626')  # Crypto Insight
-API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+
+# عميل Telegram (جلسة keep-alive مشتركة لكل worker)
+telegram_api = TelegramClient(BOT_TOKEN)
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -25,38 +75,27 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Rate limiting
-_last_msg_time = 0
-_min_delay = 2.0
-_recent_msgs = {}
-_last_signal = {}
+# Rate limiting (مشترك مع telegram_bot: دلو عام + دلو لكل مجموعة)
+_max_retries = 3
 
-# نظام حفظ الصفقات
+# نظام حفظ الصفقات: backend قابل للتبديل (TRADE_STORE_BACKEND = journal أو sqlite)
+# journal يستورد trades.json القديم مرة واحدة؛ لـ sqlite استخدم: python trade_store.py migrate trades.json --backend sqlite
 STORAGE_FILE = 'trades.json'
+trade_store = create_trade_store(
+    TRADE_STORE_BACKEND,
+    journal_path=TRADES_JOURNAL_FILE,
+    db_path=TRADES_DB_FILE,
+    legacy_path=STORAGE_FILE,
+    fsync=TRADES_JOURNAL_FSYNC,
+    compact_min_events=TRADES_COMPACT_MIN_EVENTS
+)
 
 def load_trades():
-    """تحميل الصفقات من الملف"""
-    if os.path.exists(STORAGE_FILE):
-        try:
-            with open(STORAGE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
-
-def save_trades(trades):
-    """حفظ الصفقات في الملف"""
-    try:
-        with open(STORAGE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(trades, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        logger.error(f"❌ خطأ في حفظ الصفقات: {e}")
-        return False
+    """تحميل جميع الصفقات"""
+    return trade_store.all()
 
 def add_trade(data, signal_type):
     """إضافة صفقة جديدة"""
-    trades = load_trades()
     symbol = data.get('symbol', 'UNKNOWN')
     entry_price = data.get('entry_price') or data.get('price', 0)
     timestamp = datetime.now().isoformat()
@@ -75,55 +114,58 @@ def add_trade(data, signal_type):
         'tp3': data.get('tp3'),
         'stop_loss': data.get('stop_loss'),
         'timeframe': data.get('timeframe', 'N/A'),
+        'direction': signal_direction(signal_type),
         'status': 'open',  # open, tp1, tp2, tp3, closed, sl
         'exit_price': None,
         'exit_time': None
     }
     
-    trades[trade_id] = trade
-    save_trades(trades)
+    trade_store.add(trade)
     logger.info(f"✅ تم حفظ الصفقة: {trade_id}")
     return trade_id
 
-def update_trade_status(symbol, signal_type, exit_price):
-    """تحديث حالة الصفقة"""
-    trades = load_trades()
-    updated = False
-    
-    # البحث عن آخر صفقة مفتوحة لهذا الرمز
-    open_trades = [t for t in trades.values() 
-                   if t['symbol'] == symbol and t['status'] == 'open']
-    
-    if open_trades:
-        # آخر صفقة مفتوحة
-        trade = open_trades[-1]
-        trade_id = trade['id']
-        
-        # تحديث الحالة
-        if signal_type in ['TP1_HIT', 'TP1']:
-            trade['status'] = 'tp1'
-        elif signal_type in ['TP2_HIT', 'TP2']:
-            trade['status'] = 'tp2'
-        elif signal_type in ['TP3_HIT', 'TP3']:
-            trade['status'] = 'closed'  # TP3 = إغلاق كامل
-        elif signal_type in ['STOP_LOSS', 'SL']:
-            trade['status'] = 'closed'  # SL = إغلاق
-        
-        trade['exit_price'] = exit_price
-        trade['exit_time'] = datetime.now().isoformat()
-        
-        trades[trade_id] = trade
-        save_trades(trades)
-        updated = True
-        logger.info(f"✅ تم تحديث الصفقة: {trade_id} -> {trade['status']}")
+def update_trade_status(symbol, signal_type, exit_price, timeframe=None, direction=None):
+    """
+    تحديث حالة الصفقة: open → tp1 → tp2 → tp3، أو sl من أي حالة حية
+    البحث عن الصفقة من فهرس الصفقات الحية (symbol, timeframe, direction) بدلاً من المرور على كل الصفقات
+
+    Returns:
+        معرف الصفقة المحدثة، أو False
+    """
+    spec = signal_registry.resolve(signal_type)
+    event = spec.trade_action if spec is not None else None
+    if event is None or event == ACTION_OPEN:
+        return False
+    if direction:
+        direction = signal_direction(direction) or str(direction).lower()
+    
+    # البحث والانتقال والتحديث ذرياً في التخزين (compare-and-set على الحالة بين workers)
+    trade, new_status = trade_store.apply_event(
+        symbol, event, {'exit_price': exit_price, 'exit_time': datetime.now().isoformat()},
+        timeframe=timeframe, direction=direction
+    )
+    if not trade:
+        logger.warning(f"⚠️ لا توجد صفقة حية لـ {symbol} ({timeframe}) لتطبيق {signal_type}")
+        return False
+    if new_status is None:
+        logger.warning(f"⚠️ انتقال غير مسموح للصفقة {trade['id']}: {trade['status']} -> {event}")
+        return False
     
-    return updated
+    logger.info(f"✅ تم تحديث الصفقة: {trade['id']} -> {new_status}")
+    return trade['id']
 
 # دوال مساعدة
 def escape_html(text):
     return str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
 
 def format_price(price):
+    try:
+        return _format_price(price)
+    except TypeError:  # قيمة غير قابلة للكاش (list/dict)
+        return str(price)
+
+@lru_cache(maxsize=4096)
+def _format_price(price):
     try:
         p = float(price)
         if p >= 1000:
@@ -138,6 +180,13 @@ def format_price(price):
         return str(price)
 
 def format_tf(tf):
+    try:
+        return _format_tf(tf)
+    except TypeError:
+        return str(tf)
+
+@lru_cache(maxsize=256)
+def _format_tf(tf):
     if not tf or tf == 'N/A':
         return 'N/A'
     try:
@@ -174,200 +223,380 @@ def calc_tp_sl(entry, is_long=True):
     except:
         return {}
 
-def send_telegram(msg, chat_id):
-    """إرسال رسالة إلى Telegram"""
-    global _last_msg_time, _min_delay
-    
-    # Rate limiting
-    now = time.time()
-    if now - _last_msg_time < _min_delay:
-        time.sleep(_min_delay - (now - _last_msg_time))
-    _last_msg_time = time.time()
+def _telegram_request(chat_id, request):
+    """
+    طلب إلى Telegram لمجموعة مع rate limiting وإعادة المحاولة بعد 429
+
+    Args:
+        request: () -> requests.Response
+
+    Returns:
+        result من رد Telegram (الرسالة) عند النجاح، أو None
+    """
+    # المجموعات التي طُرد منها البوت (من الكاش - بدون طلب HTTP)
+    if not chat_health.is_sendable(chat_id):
+        logger.error(f"❌ البوت غير موجود في المجموعة {chat_id} - لن يتم الإرسال")
+        return None
     
     try:
-        r = requests.post(API_URL, json={
-            "chat_id": str(chat_id),
-            "text": msg,
-            "parse_mode": "HTML"
-        }, timeout=10)
-        
-        if r.status_code == 200 and r.json().get('ok'):
-            logger.info(f"✅ تم الإرسال إلى {chat_id}")
-            return True
-        else:
+        for attempt in range(_max_retries + 1):
+            # Rate limiting
+            rate_limiter.acquire(chat_id)
+            
+            r = request()
+            
+            try:
+                result = r.json()
+            except ValueError:
+                result = {}
+            
+            if r.status_code == 200 and result.get('ok'):
+                chat_health.record_success(chat_id)
+                return result.get('result') or {}
+            
+            # Rate limit: الانتظار بالضبط حسب retry_after ثم إعادة المحاولة
+            if r.status_code == 429 and attempt < _max_retries:
+                retry_after = parse_retry_after(result)
+                rate_limiter.backoff(chat_id, retry_after if retry_after is not None else 1.0)
+                continue
+            
             logger.error(f"❌ فشل الإرسال: {r.text}")
-            return False
+            description = result.get('description', '')
+            if _is_membership_error(description):
+                chat_health.record_kicked(chat_id, description)
+            return None
+        return None
     except Exception as e:
         logger.error(f"❌ خطأ: {e}")
+        return None
+
+def _send_message(msg, chat_id, **extra):
+    """sendMessage مع إعادة المحاولة - الرسالة المرسلة (فيها message_id) أو None"""
+    sent = _telegram_request(chat_id, lambda: telegram_api.send_message(chat_id, msg, **extra))
+    if sent is not None:
+        logger.info(f"✅ تم الإرسال إلى {chat_id}")
+    return sent
+
+def send_telegram(msg, chat_id):
+    """إرسال رسالة إلى Telegram"""
+    return _send_message(msg, chat_id) is not None
+
+# ربط أحداث الصفقة ببطاقة الدخول في كل مجموعة (معطل عند MESSAGE_THREAD_MODE=off بدون MESSAGE_THREAD_CHATS)
+message_threads = create_message_threads(MESSAGE_THREAD_MODE, MESSAGE_THREAD_CHATS, MESSAGE_THREADS_DB_FILE,
+                                         ttl=MESSAGE_THREADS_TTL_DAYS * 86400)
+
+def send_entry_card(trade_id, msg, chat_id):
+    """إرسال إشارة الدخول وحفظ message_id لتُعدل أو يُرد عليها عند TP/SL"""
+    sent = _send_message(msg, chat_id)
+    if sent is None:
         return False
+    message_threads.record(trade_id, chat_id, sent.get('message_id'), msg)
+    return True
 
-# تنسيق الرسائل
-def format_buy(data):
-    symbol = data.get('symbol', 'N/A')
-    entry = data.get('entry_price') or data.get('price', 0)
-    tp1, tp2, tp3, sl = data.get('tp1'), data.get('tp2'), data.get('tp3'), data.get('stop_loss')
+def send_trade_update(trade_id, msg, chat_id):
+    """
+    إرسال حدث TP/SL: تعديل بطاقة الدخول أو الرد عليها حسب وضع المجموعة
+    إذا فشل التعديل (حُذفت البطاقة أو النص لم يتغير) يُرسل كرد
+    """
+    action, message_id, text = message_threads.plan(trade_id, chat_id, msg)
+    if action == ACTION_EDIT:
+        edited = _telegram_request(
+            chat_id, lambda: telegram_api.edit_message_text(chat_id, message_id, text)
+        )
+        if edited is not None:
+            logger.info(f"✏️ تم تعديل بطاقة الصفقة {trade_id} في {chat_id}")
+            message_threads.update_text(trade_id, chat_id, text)
+            MESSAGE_THREAD_EVENTS_TOTAL.inc('edited')
+            return True
+        MESSAGE_THREAD_EVENTS_TOTAL.inc('edit_failed')
+        action = ACTION_REPLY
+    if action == ACTION_REPLY:
+        MESSAGE_THREAD_EVENTS_TOTAL.inc('replied')
+        return _send_message(msg, chat_id, **reply_parameters(message_id)) is not None
+    MESSAGE_THREAD_EVENTS_TOTAL.inc('unthreaded')
+    return send_telegram(msg, chat_id)
+
+def trade_sender(spec, trade_id):
+    """
+    دالة الإرسال لمجموعة واحدة (msg, chat_id) لإشارة صفقة، أو None للإرسال العادي
+    بطاقة الدخول تُرسل قبل أحداثها في نفس المجموعة (مسار FIFO لكل مجموعة) فتكون محفوظة عند البحث
+    """
+    if message_threads is None or not trade_id or not spec.trade_action:
+        return None
+    if spec.trade_action == ACTION_OPEN:
+        return partial(send_entry_card, trade_id)
+    return partial(send_trade_update, trade_id)
+
+# كل (رسالة، مجموعة) تُسجل قبل الإرسال - الفاشلة يُعاد إرسالها في الخلفية وبعد إعادة التشغيل
+outbox = get_outbox()
+
+def broadcast(msg, chat_ids, wait=True, send_fn=None):
+    """
+    إرسال رسالة لعدة مجموعات بالتوازي (مسار FIFO لكل مجموعة) - نفس شكل النتيجة في send_message_to_all_groups
+    wait=False: الرجوع بـ Future فور وضع الرسالة في المسارات
+    send_fn: دالة الإرسال لمجموعة واحدة بدلاً من send_telegram (trade_sender)
+    """
+    if outbox is not None:
+        return outbox.send(msg, chat_ids, wait=wait, send_fn=send_fn or send_telegram)
+    return fan_out_message(send_fn or send_telegram, msg, chat_ids, wait=wait)
+
+# محرك الإرسال في الخلفية (يُستخدم عند DELIVERY_MODE=async)
+delivery_queue = DeliveryQueue(partial(broadcast, wait=False), maxsize=DELIVERY_QUEUE_SIZE, workers=DELIVERY_WORKERS,
+                               records=create_delivery_records(DELIVERY_DB_FILE, ttl=DELIVERY_HISTORY_TTL))
+
+# دمج الإشارات المتقاربة لنفس المجموعة في رسالة واحدة (معطل عند COALESCE_WINDOW_MS=0)
+coalescer = Coalescer(partial(broadcast, wait=False), window_ms=COALESCE_WINDOW_MS,
+                      max_messages=COALESCE_MAX_MESSAGES) if COALESCE_WINDOW_MS > 0 else None
+register_delivery_gauges(delivery_queue, coalescer, outbox)
+
+# تنسيق الرسائل: قوالب مُجمَّعة مرة واحدة (h = escape_html, p = format_price, t = format_tf)
+_CONVERTERS = {'h': escape_html, 'p': format_price, 't': lambda tf: escape_html(format_tf(tf))}
+
+_ENTRY_BODY = Template(
+    "📊 الرمز: {symbol!h}\n"
+    "💰 سعر الدخول: <code>{entry!p}</code>\n"
+    "⏰ الوقت: {time!h}\n"
+    "📈 الإطار الزمني: {timeframe!t}\n"
+    "\n",
+    _CONVERTERS
+)
+
+_ENTRY_TARGETS = Template(
+    "🎯 <b>أهداف الربح:</b>\n"
+    "?🎯 TP1: <code>{tp1!p}</code>\n"
+    "?🎯 TP2: <code>{tp2!p}</code>\n"
+    "?🎯 TP3: <code>{tp3!p}</code>\n"
+    "\n"
+    "?🛑 وقف الخسارة: <code>{sl!p}</code>",
+    _CONVERTERS
+)
+
+def _exit_template(header, target_label):
+    return Template(
+        header + "\n"
+        "\n"
+        "📊 الرمز: {symbol!h}\n"
+        "?💰 سعر الدخول: <code>{entry!p}</code>\n"
+        "?💰 سعر الخروج: <code>{exit!p}</code>\n"
+        "?" + target_label + ": <code>{target!p}</code>\n"
+        "⏰ الوقت: {time!h}",
+        _CONVERTERS
+    )
+
+_TP1 = _exit_template("🎯✅ <b>تم ضرب الهدف الأول (TP1)</b> ✅🎯", "🎯 TP1")
+_TP2 = _exit_template("🎯✅ <b>تم ضرب الهدف الثاني (TP2)</b> ✅🎯", "🎯 TP2")
+_TP3 = _exit_template("🚀🚀🚀 <b>تم ضرب الهدف الثالث (TP3)</b> 🚀🚀🚀", "🎯 TP3")
+_SL = _exit_template("🛑😔 <b>تم ضرب وقف الخسارة (Stop Loss)</b> 😔🛑", "🛑 Stop Loss")
+
+def _format_entry(data, header, is_long):
+    values = {
+        'symbol': data.get('symbol', 'N/A'),
+        'entry': data.get('entry_price') or data.get('price', 0),
+        'time': data.get('time', 'N/A'),
+        'timeframe': data.get('timeframe', 'N/A'),
+        'tp1': data.get('tp1'), 'tp2': data.get('tp2'), 'tp3': data.get('tp3'), 'sl': data.get('stop_loss'),
+    }
     
     # حساب تلقائي إذا لم تكن موجودة
-    if not (tp1 or tp2 or tp3 or sl) and entry:
-        calc = calc_tp_sl(entry, True)
-        tp1, tp2, tp3, sl = calc.get('tp1'), calc.get('tp2'), calc.get('tp3'), calc.get('sl')
+    if not (values['tp1'] or values['tp2'] or values['tp3'] or values['sl']) and values['entry']:
+        values.update(calc_tp_sl(values['entry'], is_long))
     
-    msg = f"🟢 <b>صفقة لونج (LONG)</b> 🟢\n\n"
-    msg += f"📊 الرمز: {escape_html(symbol)}\n"
-    msg += f"💰 سعر الدخول: <code>{format_price(entry)}</code>\n"
-    msg += f"⏰ الوقت: {escape_html(data.get('time', 'N/A'))}\n"
-    msg += f"📈 الإطار الزمني: {escape_html(format_tf(data.get('timeframe', 'N/A')))}\n\n"
-    
-    if tp1 or tp2 or tp3 or sl:
-        msg += f"🎯 <b>أهداف الربح:</b>\n"
-        if tp1: msg += f"🎯 TP1: <code>{format_price(tp1)}</code>\n"
-        if tp2: msg += f"🎯 TP2: <code>{format_price(tp2)}</code>\n"
-        if tp3: msg += f"🎯 TP3: <code>{format_price(tp3)}</code>\n"
-        msg += "\n"
-        if sl: msg += f"🛑 وقف الخسارة: <code>{format_price(sl)}</code>"
-    
-    return msg
+    if values['tp1'] or values['tp2'] or values['tp3'] or values['sl']:
+        return header + render(values, _ENTRY_BODY, _ENTRY_TARGETS)
+    return header + _ENTRY_BODY.render(values)
+
+def format_buy(data):
+    return _format_entry(data, "🟢 <b>صفقة لونج (LONG)</b> 🟢\n\n", True)
 
 def format_sell(data):
-    symbol = data.get('symbol', 'N/A')
-    entry = data.get('entry_price') or data.get('price', 0)
-    tp1, tp2, tp3, sl = data.get('tp1'), data.get('tp2'), data.get('tp3'), data.get('stop_loss')
-    
-    if not (tp1 or tp2 or tp3 or sl) and entry:
-        calc = calc_tp_sl(entry, False)
-        tp1, tp2, tp3, sl = calc.get('tp1'), calc.get('tp2'), calc.get('tp3'), calc.get('sl')
-    
-    msg = f"🔴 <b>صفقة شورت (SHORT)</b> 🔴\n\n"
-    msg += f"📊 الرمز: {escape_html(symbol)}\n"
-    msg += f"💰 سعر الدخول: <code>{format_price(entry)}</code>\n"
-    msg += f"⏰ الوقت: {escape_html(data.get('time', 'N/A'))}\n"
-    msg += f"📈 الإطار الزمني: {escape_html(format_tf(data.get('timeframe', 'N/A')))}\n\n"
-    
-    if tp1 or tp2 or tp3 or sl:
-        msg += f"🎯 <b>أهداف الربح:</b>\n"
-        if tp1: msg += f"🎯 TP1: <code>{format_price(tp1)}</code>\n"
-        if tp2: msg += f"🎯 TP2: <code>{format_price(tp2)}</code>\n"
-        if tp3: msg += f"🎯 TP3: <code>{format_price(tp3)}</code>\n"
-        msg += "\n"
-        if sl: msg += f"🛑 وقف الخسارة: <code>{format_price(sl)}</code>"
-    
-    return msg
+    return _format_entry(data, "🔴 <b>صفقة شورت (SHORT)</b> 🔴\n\n", False)
 
-def format_tp1(data):
-    symbol = data.get('symbol', 'N/A')
+def format_buy_reverse(data):
+    return _format_entry(data, "🟠 <b>صفقة لونج عكسي (LONG REVERSE)</b> 🟠\n⚠️ <b>تم عكس الصفقة</b>\n\n", True)
+
+def format_sell_reverse(data):
+    return _format_entry(data, "🟠 <b>صفقة شورت عكسي (SHORT REVERSE)</b> 🟠\n⚠️ <b>تم عكس الصفقة</b>\n\n", False)
+
+def _format_tp(data, template, key):
     entry = data.get('entry_price', 0)
     exit = data.get('exit_price') or data.get('price', 0)
-    tp1 = data.get('tp1')
+    tp = data.get(key)
     
-    # إذا لم يكن TP1 موجوداً، احسبه من entry_price
-    if not tp1 and entry:
-        calc = calc_tp_sl(entry, True)  # افترض Long (يمكن تحسينه)
-        tp1 = calc.get('tp1')
+    # إذا لم يكن الهدف موجوداً، احسبه من entry_price
+    if not tp and entry:
+        tp = calc_tp_sl(entry, True).get(key)  # افترض Long (يمكن تحسينه)
     
-    # إذا لم يكن exit_price موجوداً أو كان قريباً من entry، استخدم TP1
+    # إذا لم يكن exit_price موجوداً أو كان قريباً من entry، استخدم الهدف
     if not exit or (entry and abs(float(exit) - float(entry)) < 0.01):
-        exit = tp1 or exit
-    
-    time_str = data.get('time', 'N/A')
+        exit = tp or exit
     
-    msg = f"🎯✅ <b>تم ضرب الهدف الأول (TP1)</b> ✅🎯\n\n"
-    msg += f"📊 الرمز: {escape_html(symbol)}\n"
-    if entry: msg += f"💰 سعر الدخول: <code>{format_price(entry)}</code>\n"
-    if exit: msg += f"💰 سعر الخروج: <code>{format_price(exit)}</code>\n"
-    if tp1: msg += f"🎯 TP1: <code>{format_price(tp1)}</code>\n"
-    msg += f"⏰ الوقت: {escape_html(time_str)}"
-    return msg
+    return template.render({'symbol': data.get('symbol', 'N/A'), 'entry': entry, 'exit': exit,
+                            'target': tp, 'time': data.get('time', 'N/A')})
+
+def format_tp1(data):
+    return _format_tp(data, _TP1, 'tp1')
 
 def format_tp2(data):
-    symbol = data.get('symbol', 'N/A')
-    entry = data.get('entry_price', 0)
-    exit = data.get('exit_price') or data.get('price', 0)
-    tp2 = data.get('tp2')
-    
-    # إذا لم يكن TP2 موجوداً، احسبه من entry_price
-    if not tp2 and entry:
-        calc = calc_tp_sl(entry, True)  # افترض Long
-        tp2 = calc.get('tp2')
-    
-    # إذا لم يكن exit_price موجوداً أو كان قريباً من entry، استخدم TP2
-    if not exit or (entry and abs(float(exit) - float(entry)) < 0.01):
-        exit = tp2 or exit
-    
-    time_str = data.get('time', 'N/A')
-    
-    msg = f"🎯✅ <b>تم ضرب الهدف الثاني (TP2)</b> ✅🎯\n\n"
-    msg += f"📊 الرمز: {escape_html(symbol)}\n"
-    if entry: msg += f"💰 سعر الدخول: <code>{format_price(entry)}</code>\n"
-    if exit: msg += f"💰 سعر الخروج: <code>{format_price(exit)}</code>\n"
-    if tp2: msg += f"🎯 TP2: <code>{format_price(tp2)}</code>\n"
-    msg += f"⏰ الوقت: {escape_html(time_str)}"
-    return msg
+    return _format_tp(data, _TP2, 'tp2')
 
 def format_tp3(data):
-    symbol = data.get('symbol', 'N/A')
-    entry = data.get('entry_price', 0)
-    exit = data.get('exit_price') or data.get('price', 0)
-    tp3 = data.get('tp3')
-    
-    # إذا لم يكن TP3 موجوداً، احسبه من entry_price
-    if not tp3 and entry:
-        calc = calc_tp_sl(entry, True)  # افترض Long
-        tp3 = calc.get('tp3')
-    
-    # إذا لم يكن exit_price موجوداً أو كان قريباً من entry، استخدم TP3
-    if not exit or (entry and abs(float(exit) - float(entry)) < 0.01):
-        exit = tp3 or exit
-    
-    time_str = data.get('time', 'N/A')
-    
-    msg = f"🚀🚀🚀 <b>تم ضرب الهدف الثالث (TP3)</b> 🚀🚀🚀\n\n"
-    msg += f"📊 الرمز: {escape_html(symbol)}\n"
-    if entry: msg += f"💰 سعر الدخول: <code>{format_price(entry)}</code>\n"
-    if exit: msg += f"💰 سعر الخروج: <code>{format_price(exit)}</code>\n"
-    if tp3: msg += f"🎯 TP3: <code>{format_price(tp3)}</code>\n"
-    msg += f"⏰ الوقت: {escape_html(time_str)}"
-    return msg
+    return _format_tp(data, _TP3, 'tp3')
 
 def format_sl(data):
-    symbol = data.get('symbol', 'N/A')
-    entry = data.get('entry_price', 0)
     exit = data.get('exit_price') or data.get('price', 0)
-    sl = data.get('stop_loss') or exit
-    time_str = data.get('time', 'N/A')
-    
-    msg = f"🛑😔 <b>تم ضرب وقف الخسارة (Stop Loss)</b> 😔🛑\n\n"
-    msg += f"📊 الرمز: {escape_html(symbol)}\n"
-    if entry: msg += f"💰 سعر الدخول: <code>{format_price(entry)}</code>\n"
-    if exit: msg += f"💰 سعر الخروج: <code>{format_price(exit)}</code>\n"
-    if sl: msg += f"🛑 Stop Loss: <code>{format_price(sl)}</code>\n"
-    msg += f"⏰ الوقت: {escape_html(time_str)}"
-    return msg
-
-# منع التكرار
-def is_duplicate(data):
-    signal = data.get('signal', '').upper()
-    symbol = data.get('symbol', '')
-    key = f"{signal}_{symbol}"
-    now = datetime.now()
-    
-    # تنظيف القديم
-    expired = [k for k, t in _recent_msgs.items() if (now - t).total_seconds() > 600]
-    for k in expired:
-        del _recent_msgs[k]
-    
-    # التحقق
-    if key in _last_signal:
-        last = _last_signal[key]
-        if (now - last).total_seconds() < (60 if signal in ['BUY', 'SELL', 'BUY_REVERSE', 'SELL_REVERSE'] else 30):
-            return True
+    return _SL.render({'symbol': data.get('symbol', 'N/A'), 'entry': data.get('entry_price', 0), 'exit': exit,
+                       'target': data.get('stop_loss') or exit, 'time': data.get('time', 'N/A')})
+
+# سجل الإشارات: كل اسم بديل → النوع الموحد ودالة التنسيق ونافذة منع التكرار وإجراء الصفقة
+signal_registry = create_registry(
+    {
+        'BUY': format_buy,
+        'SELL': format_sell,
+        'BUY_REVERSE': format_buy_reverse,
+        'SELL_REVERSE': format_sell_reverse,
+        'TP1': format_tp1,
+        'TP2': format_tp2,
+        'TP3': format_tp3,
+        'SL': format_sl,
+    },
+    entry_window=DEDUP_ENTRY_WINDOW,
+    exit_window=DEDUP_EXIT_WINDOW,
+    windows=DEDUP_WINDOWS
+)
+
+# منع التكرار (نافذة لكل نوع إشارة) - DEDUP_BACKEND=sqlite لمشاركته بين gunicorn workers
+signal_dedup = SignalDeduplicator(
+    create_dedup_store(DEDUP_BACKEND, capacity=DEDUP_CAPACITY, db_path=DEDUP_DB_FILE),
+    signal_registry
+)
+
+def is_duplicate(spec, data):
+    return signal_dedup.check(spec, data.get('symbol', '')) is not None
+
+def record_trade(spec, data):
+    """
+    حفظ صفقة جديدة أو تحديث حالتها حسب إجراء نوع الإشارة في السجل
+
+    Returns:
+        معرف الصفقة الجديدة أو المحدثة (None إذا لم تتغير صفقة)
+    """
+    if spec.trade_action == ACTION_OPEN:
+        return add_trade(data, spec.name)
+    if spec.trade_action:
+        exit_price = data.get('exit_price') or data.get('price', 0)
+        return update_trade_status(data.get('symbol', ''), spec.trade_action, exit_price,
+                                   timeframe=data.get('timeframe'), direction=data.get('direction')) or None
+    return None
+
+def process_bulk_item(data):
+    """
+    منع التكرار وحفظ الصفقة والتنسيق لعنصر واحد من الدفعة
+
+    Returns:
+        (item_status, msg) - msg = None إذا لم يتم قبول العنصر
+    """
+    if not isinstance(data, dict):
+        return {"status": "error", "error": "Invalid JSON"}, None
+    signal = str(data.get('signal', '')).upper()
+    if not signal:
+        return {"status": "error", "error": "Signal required"}, None
+    item = {"signal": signal, "symbol": data.get('symbol', 'N/A')}
+    spec = signal_registry.resolve(signal)
+    if spec is None:
+        item.update(status="error", error=f"Unknown signal: {signal}")
+        return item, None
+    SIGNALS_TOTAL.inc(spec.name, str(item["symbol"]))
+    try:
+        if is_duplicate(spec, data):
+            DUPLICATES_TOTAL.inc(spec.name)
+            item["status"] = "ignored"
+            return item, None
+        record_trade(spec, data)
+        msg = spec.render(data)
+    except Exception as e:
+        logger.error(f"❌ خطأ في معالجة عنصر من الدفعة: {e}", exc_info=True)
+        item.update(status="error", error=str(e))
+        return item, None
+    item["status"] = "accepted"
+    return item, msg
+
+@app.route('/webhook/bulk', methods=['POST'])
+@app.route('/personal/<chat_id>/webhook/bulk', methods=['POST'])
+def webhook_bulk(chat_id=None):
+    """
+    عدة إشارات في طلب واحد: مصفوفة JSON أو NDJSON
+    كل إشارة تمر بمنع التكرار وحفظ الصفقة والتنسيق، ثم تُسلَّم الرسائل المقبولة للإرسال كوحدة واحدة
+    """
+    try:
+        entries = parse_bulk(request.get_data(as_text=True))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid JSON: {e}"}), 400
+    if not entries:
+        return jsonify({"error": "No data"}), 400
+    if len(entries) > BULK_MAX_ITEMS:
+        return jsonify({"error": f"Too many items (max {BULK_MAX_ITEMS})"}), 413
+    
+    from config import TELEGRAM_CHAT_IDS
+    targets = [chat_id] if chat_id else TELEGRAM_CHAT_IDS
+    if not targets:
+        logger.error("❌ No chat IDs available - يجب تحديد Chat IDs في config.py")
+        return jsonify({"error": "No chat IDs available"}), 500
+    
+    items, msgs = [], []
+    for index, (data, error) in enumerate(entries):
+        if error:
+            item, msg = {"status": "error", "error": error}, None
+        else:
+            item, msg = process_bulk_item(data)
+        item["index"] = index
+        items.append(item)
+        if msg:
+            msgs.append(msg)
     
-    _last_signal[key] = now
-    _recent_msgs[key] = now
-    return False
+    response = {
+        "status": "success",
+        "total": len(items),
+        "accepted": len(msgs),
+        "ignored": sum(1 for item in items if item["status"] == "ignored"),
+        "errors": sum(1 for item in items if item["status"] == "error"),
+        "items": items,
+    }
+    logger.info(f"📥 دفعة: {response['accepted']}/{response['total']} إشارة مقبولة")
+    if not msgs:
+        return jsonify(response), 200
+    
+    if coalescer is not None:
+        for msg in msgs:
+            coalescer.submit(msg, targets)
+        response["delivery"] = {"mode": "coalesced", "window_ms": COALESCE_WINDOW_MS}
+        return jsonify(response), 202
+    
+    digests = build_digests(msgs)
+    if DELIVERY_MODE == 'async':
+        try:
+            delivery_ids = [
+                delivery_queue.submit(digest, targets, signal='BULK', count=len(msgs))
+                for digest in digests
+            ]
+        except queue.Full:
+            logger.error("❌ طابور الإرسال ممتلئ")
+            return jsonify({"status": "error", "message": "Delivery queue is full", "items": items}), 503
+        response["delivery"] = {"mode": "queued", "delivery_ids": delivery_ids, "messages": len(digests)}
+        return jsonify(response), 202
+    
+    sent = 0
+    for digest in digests:
+        sent += broadcast(digest, targets)['success']
+    response["delivery"] = {"mode": "sync", "messages": len(digests), "sent": sent, "total": len(digests) * len(targets)}
+    if sent == 0:
+        response["status"] = "error"
+        return jsonify(response), 500
+    return jsonify(response), 200
 
 # Webhook endpoint
 @app.route('/webhook', methods=['GET', 'POST'])
 @app.route('/personal/<chat_id>/webhook', methods=['GET', 'POST'])
+@WEBHOOK_STAGE_SECONDS.timed('total')
 def webhook(chat_id=None):
     if request.method == 'GET':
         return jsonify({"status": "ok", "message": "Webhook active"}), 200
@@ -379,67 +608,82 @@ def webhook(chat_id=None):
             return jsonify({"error": "No data"}), 400
         
         # تنظيف JSON
-        start = raw.find('{')
-        if start == -1:
+        if '{' not in raw:
             return jsonify({"error": "Invalid JSON"}), 400
         
-        # استخراج JSON
-        brace = 0
-        end = start
-        for i in range(start, len(raw)):
-            if raw[i] == '{':
-                brace += 1
-            elif raw[i] == '}':
-                brace -= 1
-                if brace == 0:
-                    end = i + 1
-                    break
-        
-        json_str = raw[start:end]
-        json_str = re.sub(r'\{\{plot\([^)]+\)\}\}', 'null', json_str)
-        json_str = re.sub(r'\{\{[^}]+\}\}', 'null', json_str)
-        
-        data = json.loads(json_str)
+        # استخراج JSON (مرور واحد + استبدال placeholders)
+        started = time.perf_counter()
+        data = extract_payload(raw, is_json=request.is_json)
+        WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'extract')
+        if not isinstance(data, dict):
+            return jsonify({"error": "Invalid JSON"}), 400
         signal = data.get('signal', '').upper()
         
         if not signal:
             return jsonify({"error": "Signal required"}), 400
+        spec = signal_registry.resolve(signal)
+        if spec is None:
+            return jsonify({"error": f"Unknown signal: {signal}"}), 400
+        SIGNALS_TOTAL.inc(spec.name, str(data.get('symbol', 'N/A')))
         
         # منع التكرار
-        if is_duplicate(data):
+        started = time.perf_counter()
+        duplicate = is_duplicate(spec, data)
+        WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'dedup')
+        if duplicate:
+            DUPLICATES_TOTAL.inc(spec.name)
             logger.warning(f"⚠️ تكرار: {signal} - {data.get('symbol')}")
             return jsonify({"status": "ignored"}), 200
         
-        # حفظ الصفقات في الذاكرة
-        if signal in ['BUY', 'LONG', 'SELL', 'SHORT', 'BUY_REVERSE', 'SELL_REVERSE']:
-            add_trade(data, signal)
-        elif signal in ['TP1_HIT', 'TP1', 'TP2_HIT', 'TP2', 'TP3_HIT', 'TP3', 'STOP_LOSS', 'SL']:
-            exit_price = data.get('exit_price') or data.get('price', 0)
-            update_trade_status(data.get('symbol', ''), signal, exit_price)
+        # حفظ الصفقات
+        started = time.perf_counter()
+        trade_id = record_trade(spec, data)
+        WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'store')
         
         # تنسيق الرسالة
-        msg = None
-        if signal in ['BUY', 'LONG']:
-            msg = format_buy(data)
-        elif signal in ['SELL', 'SHORT']:
-            msg = format_sell(data)
-        elif signal in ['BUY_REVERSE', 'LONG_REVERSE']:
-            msg = format_buy(data)  # نفس format_buy
-            msg = msg.replace('لونج', 'لونج عكسي').replace('LONG', 'LONG REVERSE')
-            msg = "🟠 " + msg.replace("🟢", "🟠", 1)
-        elif signal in ['SELL_REVERSE', 'SHORT_REVERSE']:
-            msg = format_sell(data)  # نفس format_sell
-            msg = msg.replace('شورت', 'شورت عكسي').replace('SHORT', 'SHORT REVERSE')
-        elif signal in ['TP1_HIT', 'TP1']:
-            msg = format_tp1(data)
-        elif signal in ['TP2_HIT', 'TP2']:
-            msg = format_tp2(data)
-        elif signal in ['TP3_HIT', 'TP3']:
-            msg = format_tp3(data)
-        elif signal in ['STOP_LOSS', 'SL']:
-            msg = format_sl(data)
-        else:
-            return jsonify({"error": f"Unknown signal: {signal}"}), 400
+        started = time.perf_counter()
+        msg = spec.render(data)
+        WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'format')
+        
+        # تعديل بطاقة الدخول أو الرد عليها (الرسائل المدمجة تُرسل كرسائل جديدة)
+        sender = trade_sender(spec, trade_id)
+        
+        # دمج الإشارات: الرد فوراً والإرسال كرسالة مدمجة بعد انتهاء النافذة
+        if msg and coalescer is not None:
+            from config import TELEGRAM_CHAT_IDS
+            targets = [chat_id] if chat_id else TELEGRAM_CHAT_IDS
+            if not targets:
+                logger.error("❌ No chat IDs available - يجب تحديد Chat IDs في config.py")
+                return jsonify({"error": "No chat IDs available"}), 500
+            coalescer.submit(msg, targets)
+            return jsonify({
+                "status": "coalesced",
+                "signal": signal,
+                "total": len(targets),
+                "window_ms": COALESCE_WINDOW_MS
+            }), 202
+        
+        # وضع الطابور: الرد فوراً والإرسال في الخلفية
+        if msg and DELIVERY_MODE == 'async':
+            from config import TELEGRAM_CHAT_IDS
+            targets = [chat_id] if chat_id else TELEGRAM_CHAT_IDS
+            if not targets:
+                logger.error("❌ No chat IDs available - يجب تحديد Chat IDs في config.py")
+                return jsonify({"error": "No chat IDs available"}), 500
+            try:
+                delivery_id = delivery_queue.submit(
+                    msg, targets, send_fn=partial(broadcast, wait=False, send_fn=sender) if sender else None,
+                    signal=signal, symbol=data.get('symbol', 'N/A')
+                )
+            except queue.Full:
+                logger.error("❌ طابور الإرسال ممتلئ")
+                return jsonify({"status": "error", "message": "Delivery queue is full"}), 503
+            return jsonify({
+                "status": "queued",
+                "signal": signal,
+                "delivery_id": delivery_id,
+                "total": len(targets)
+            }), 202
         
         # إرسال
         if msg:
@@ -448,7 +692,8 @@ def webhook(chat_id=None):
             if chat_id:
                 # إرسال لمجموعة واحدة (من URL)
                 logger.info(f"📤 إرسال لمجموعة واحدة من URL: {chat_id}")
-                if send_telegram(msg, chat_id):
+                # عبر الـ outbox ومسار المجموعة (نفس ترتيب الرسائل المرسلة لكل المجموعات)
+                if broadcast(msg, [chat_id], send_fn=sender)['success'] > 0:
                     return jsonify({"status": "success", "signal": signal, "chat_id": chat_id}), 200
                 else:
                     return jsonify({"status": "error"}), 500
@@ -463,17 +708,14 @@ def webhook(chat_id=None):
                     }), 500
                 
                 logger.info(f"📤 إرسال لجميع المجموعات ({len(TELEGRAM_CHAT_IDS)} مجموعة)")
-                success_count = 0
-                for group_chat_id in TELEGRAM_CHAT_IDS:
-                    if send_telegram(msg, group_chat_id):
-                        success_count += 1
+                result = broadcast(msg, TELEGRAM_CHAT_IDS, send_fn=sender)
                 
-                if success_count > 0:
+                if result['success'] > 0:
                     return jsonify({
                         "status": "success",
                         "signal": signal,
-                        "sent_to": success_count,
-                        "total": len(TELEGRAM_CHAT_IDS)
+                        "sent_to": result['success'],
+                        "total": result['total']
                     }), 200
                 else:
                     return jsonify({"status": "error"}), 500
@@ -488,57 +730,142 @@ def webhook(chat_id=None):
 def health():
     return jsonify({"status": "ok"}), 200
 
+@app.route('/rate-limits', methods=['GET'])
+def get_rate_limits():
+    """الميزانية الحالية لمحدد المعدل (عام ولكل مجموعة)"""
+    return jsonify({"status": "success", "rate_limits": rate_limiter.budget()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """مقاييس Prometheus لهذا الـ worker"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/deliveries/<delivery_id>', methods=['GET'])
+def get_delivery(delivery_id):
+    """الاستعلام عن حالة عملية إرسال من الطابور"""
+    record = delivery_queue.get(delivery_id)
+    if not record:
+        return jsonify({"error": "Delivery not found"}), 404
+    return jsonify({"status": "success", "delivery": record}), 200
+
+def _page_args(args):
+    """limit و after و fields من الرابط - request.args (ValueError إذا كان limit غير صالح)"""
+    limit = args.get('limit')
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        limit = min(limit, TRADES_PAGE_MAX_LIMIT)
+    fields = args.get('fields')
+    if fields:
+        fields = tuple(f.strip() for f in fields.split(',') if f.strip())
+    return limit, args.get('after'), fields or None
+
+def _project(trade, fields):
+    """إرجاع الحقول المطلوبة فقط من الصفقة"""
+    if not fields:
+        return trade
+    return {f: trade[f] for f in fields if f in trade}
+
+def _trades_response(statuses=None, symbol=None, extra=None):
+    """
+    ?limit=N: صفحة واحدة + next_cursor (يُمرر كـ ?after= للصفحة التالية)
+    بدون limit: كل الصفقات تُبث على دفعات (TRADES_STREAM_BATCH) حتى تبقى الذاكرة ثابتة مهما كان عددها
+    """
+    try:
+        limit, after, fields = _page_args(request.args)
+        trades, cursor = trade_store.page(statuses, symbol, after, limit or TRADES_STREAM_BATCH)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    extra = extra or {}
+    
+    if limit is not None:
+        return jsonify({
+            "status": "success",
+            **extra,
+            "count": len(trades),
+            "trades": {t['id']: _project(t, fields) for t in trades},
+            "next_cursor": cursor
+        }), 200
+    
+    def generate(batch, cursor):
+        head = json.dumps({"status": "success", **extra})
+        yield head[:-1] + ', "trades": {'
+        count = 0
+        while batch:
+            yield ('' if count == 0 else ', ') + ', '.join(
+                f"{json.dumps(t['id'])}: {json.dumps(_project(t, fields))}" for t in batch
+            )
+            count += len(batch)
+            if cursor is None:
+                break
+            batch, cursor = trade_store.page(statuses, symbol, cursor, TRADES_STREAM_BATCH)
+        yield f'}}, "count": {count}}}'
+    
+    return Response(stream_with_context(generate(trades, cursor)), mimetype='application/json')
+
 @app.route('/trades', methods=['GET'])
 def get_trades():
-    """الحصول على جميع الصفقات"""
-    trades = load_trades()
+    """الحصول على جميع الصفقات (?limit=&after= للصفحات، ?fields=id,symbol,status لتحديد الحقول)"""
     status = request.args.get('status', 'all')  # all, open, closed
     
     if status == 'open':
-        trades = {k: v for k, v in trades.items() if v['status'] == 'open'}
+        return _trades_response(['open'])
     elif status == 'closed':
-        trades = {k: v for k, v in trades.items() if v['status'] in ['closed', 'tp3', 'sl']}
-    
-    return jsonify({
-        "status": "success",
-        "count": len(trades),
-        "trades": trades
-    }), 200
+        return _trades_response(CLOSED_STATUSES)
+    return _trades_response()
 
 @app.route('/trades/<symbol>', methods=['GET'])
 def get_trades_by_symbol(symbol):
     """الحصول على صفقات رمز معين"""
-    trades = load_trades()
-    symbol_trades = {k: v for k, v in trades.items() if v['symbol'] == symbol.upper()}
-    
-    return jsonify({
-        "status": "success",
-        "symbol": symbol.upper(),
-        "count": len(symbol_trades),
-        "trades": symbol_trades
-    }), 200
+    symbol = symbol.upper()
+    return _trades_response(symbol=symbol, extra={"symbol": symbol})
 
 @app.route('/trades/stats', methods=['GET'])
 def get_trades_stats():
-    """إحصائيات الصفقات"""
-    trades = load_trades()
+    """إحصائيات الصفقات (من العدادات التراكمية - ?verify=1 لإعادة الحساب من التخزين والمقارنة)"""
+    response = {"status": "success"}
+    if request.args.get('verify') in ('1', 'true'):
+        response["verify"] = trade_store.verify_stats()
+    response["stats"] = trade_store.stats()
     
-    stats = {
-        "total": len(trades),
-        "open": len([t for t in trades.values() if t['status'] == 'open']),
-        "tp1": len([t for t in trades.values() if t['status'] == 'tp1']),
-        "tp2": len([t for t in trades.values() if t['status'] == 'tp2']),
-        "tp3": len([t for t in trades.values() if t['status'] == 'tp3']),
-        "closed": len([t for t in trades.values() if t['status'] == 'closed']),
-        "sl": len([t for t in trades.values() if t['status'] == 'sl'])
-    }
-    
-    return jsonify({
-        "status": "success",
-        "stats": stats
-    }), 200
+    return jsonify(response), 200
+
+# مهام بدء التشغيل في الخلفية (لا شيء يُنفذ عند الاستيراد)
+def _chat_preflight():
+    """فحص جميع المجموعات مرة واحدة عند البدء"""
+    from config import TELEGRAM_CHAT_IDS
+    chat_health.preflight(TELEGRAM_CHAT_IDS)
+
+startup_tasks = StartupTasks(STARTUP_LOCK_FILE, STARTUP_DEPLOYMENT_ID)
+if CHAT_HEALTH_PREFLIGHT:
+    startup_tasks.add('chat_preflight', _chat_preflight)
+if outbox is not None:
+    startup_tasks.add('outbox_replay', outbox.replay)
+
+@app.before_request
+def _ensure_startup():
+    # احتياط لخوادم بدون post_worker_init (gunicorn.conf.py)
+    startup_tasks.start()
+
+def start_background_tasks(standalone=False):
+    """نقطة التشغيل من gunicorn.conf.py (post_worker_init) أو __main__"""
+    return startup_tasks.start(
+        STARTUP_DEPLOYMENT_ID or (default_deployment_id(standalone=True) if standalone else None)
+    )
+
+def stop_background_tasks(timeout=OUTBOX_DRAIN_TIMEOUT):
+    """نقطة الإيقاف من gunicorn.conf.py (worker_exit) أو SIGTERM في __main__"""
+    deadline = time.monotonic() + timeout
+    if coalescer is not None:
+        coalescer.flush(timeout)
+    delivery_queue.join(max(0.0, deadline - time.monotonic()))
+    if outbox is not None:
+        outbox.drain(max(0.0, deadline - time.monotonic()))
 
 if __name__ == '__main__':
+    start_background_tasks(standalone=True)
+    on_sigterm(stop_background_tasks)
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
 
@@ -0,0 +1,575 @@
+"""
+TradingView Webhook to Telegram Bot - نسخة asyncio (aiohttp)
+نفس مسارات app.py ونفس التنسيق وحفظ الصفقات ومنع التكرار والـ outbox، لكن الإرسال لا يحجز خيطاً:
+انتظار Telegram و rate limit و retry_after يتم بـ await، فعملية واحدة تخدم مئات التنبيهات والإرسالات المتزامنة
+العمليات الحاجبة (SQLite / ملفات الصفقات) تعمل في مجمع الخيوط الافتراضي حتى لا توقف الحلقة
+
+التشغيل: python async_app.py  أو  gunicorn async_app:app -k aiohttp.GunicornWebWorker
+غير مدعوم هنا: دمج الإشارات (COALESCE_WINDOW_MS) و GET /deliveries/<id>
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from functools import partial
+
+from aiohttp import web
+
+from app import (
+    BOT_TOKEN,
+    signal_registry,
+    is_duplicate,
+    record_trade,
+    process_bulk_item,
+    message_threads,
+    trade_store,
+    outbox,
+    startup_tasks,
+    start_background_tasks,
+    stop_background_tasks,
+    _page_args,
+    _project
+)
+from async_telegram_client import AsyncTelegramClient
+from coalescer import build_digests
+from message_threads import reply_parameters, ACTION_EDIT, ACTION_REPLY
+from delivery_lanes import AsyncChatLanes
+from payload_parser import extract_payload, parse_bulk
+from rate_limiter import parse_retry_after
+from signals import ACTION_OPEN
+from telegram_bot import (
+    rate_limiter,
+    chat_health,
+    delivery_lanes,
+    command_reply,
+    _collect_results,
+    _is_membership_error,
+    _log_send_summary
+)
+from telegram_client import encode_message
+from trade_store import CLOSED_STATUSES
+from metrics import (
+    REGISTRY,
+    CONTENT_TYPE,
+    WEBHOOK_STAGE_SECONDS,
+    SIGNALS_TOTAL,
+    DUPLICATES_TOTAL,
+    MESSAGE_THREAD_EVENTS_TOTAL
+)
+from config import (
+    DELIVERY_MODE,
+    BULK_MAX_ITEMS,
+    TRADES_STREAM_BATCH,
+    OUTBOX_DRAIN_TIMEOUT,
+    TELEGRAM_CHAT_IDS
+)
+
+logger = logging.getLogger(__name__)
+
+_max_retries = 3
+
+# عميل Telegram غير متزامن (جلسة aiohttp واحدة) + مسار FIFO لكل مجموعة داخل الحلقة
+telegram_api = AsyncTelegramClient(BOT_TOKEN)
+lanes = AsyncChatLanes()
+
+# إرسالات DELIVERY_MODE=async الجارية (الرد 202 قبل انتهائها)
+_background = set()
+
+
+async def _in_executor(fn, *args):
+    """تشغيل عملية حاجبة (SQLite / ملفات) في مجمع الخيوط الافتراضي"""
+    return await asyncio.get_running_loop().run_in_executor(None, partial(fn, *args))
+
+
+def _lane_stats() -> dict:
+    """مسارات الحلقة + مسارات الخيوط (إعادة محاولات الـ outbox تمر عبر fan_out_message)"""
+    stats = delivery_lanes.stats()
+    for chat_id, lane in lanes.stats().items():
+        other = stats.get(chat_id)
+        stats[chat_id] = lane if other is None else {
+            'depth': lane['depth'] + other['depth'],
+            'lag': max(lane['lag'], other['lag'])
+        }
+    return stats
+
+
+# نفس أسماء المقاييس في app.py و main.py (التسجيل يستبدل نسخ app.py)
+REGISTRY.gauge('delivery_queue_depth', "Deliveries waiting in the async queue", lambda: len(_background))
+REGISTRY.gauge('coalescer_pending_messages', "Messages waiting for their coalescing window", lambda: 0)
+REGISTRY.gauge('outbox_pending_messages', "(message, chat) deliveries not yet sent",
+               lambda: outbox.pending() if outbox is not None else 0)
+REGISTRY.gauge('delivery_lane_depth', "Messages queued or in flight in each chat's delivery lane",
+               lambda: {(chat_id,): lane['depth'] for chat_id, lane in _lane_stats().items()}, ('chat_id',))
+REGISTRY.gauge('delivery_lane_lag_seconds', "Age of the oldest unfinished message in each chat's delivery lane",
+               lambda: {(chat_id,): lane['lag'] for chat_id, lane in _lane_stats().items()}, ('chat_id',))
+
+
+async def _telegram_request(chat_id, request):
+    """
+    نفس _telegram_request في app.py: rate limit و retry_after بـ asyncio.sleep بدلاً من time.sleep
+
+    Args:
+        request: () -> coroutine بنتيجة (status, result)
+
+    Returns:
+        result من رد Telegram (الرسالة) عند النجاح، أو None
+    """
+    # المجموعات التي طُرد منها البوت (من الكاش - بدون طلب HTTP)
+    if not chat_health.is_sendable(chat_id):
+        logger.error(f"❌ البوت غير موجود في المجموعة {chat_id} - لن يتم الإرسال")
+        return None
+
+    try:
+        for attempt in range(_max_retries + 1):
+            wait_time = rate_limiter.reserve(chat_id)
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            wait_time = rate_limiter.reserve_global()
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+
+            status, result = await request()
+
+            if status == 200 and result.get('ok'):
+                chat_health.record_success(chat_id)
+                return result.get('result') or {}
+
+            # Rate limit: الانتظار بالضبط حسب retry_after ثم إعادة المحاولة
+            if status == 429 and attempt < _max_retries:
+                retry_after = parse_retry_after(result)
+                rate_limiter.backoff(chat_id, retry_after if retry_after is not None else 1.0)
+                continue
+
+            description = result.get('description', '')
+            logger.error(f"❌ فشل الإرسال ({status}): {description}")
+            if _is_membership_error(description):
+                chat_health.record_kicked(chat_id, description)
+            return None
+        return None
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e!r}")
+        return None
+
+
+async def _send_message(msg, chat_id, **extra):
+    """sendMessage مع إعادة المحاولة - الرسالة المرسلة (فيها message_id) أو None"""
+    chat_id = str(chat_id)
+    body = None if extra else encode_message(chat_id, msg)
+    sent = await _telegram_request(chat_id, lambda: telegram_api.send_message(chat_id, msg, body=body, **extra))
+    if sent is not None:
+        logger.info(f"✅ تم الإرسال إلى {chat_id}")
+    return sent
+
+
+async def send_telegram(msg, chat_id):
+    """نفس send_telegram في app.py"""
+    return await _send_message(msg, chat_id) is not None
+
+
+async def send_entry_card(trade_id, msg, chat_id):
+    """نفس app.send_entry_card: الإرسال ثم حفظ message_id (في executor)"""
+    sent = await _send_message(msg, chat_id)
+    if sent is None:
+        return False
+    await _in_executor(message_threads.record, trade_id, str(chat_id), sent.get('message_id'), msg)
+    return True
+
+
+async def send_trade_update(trade_id, msg, chat_id):
+    """نفس app.send_trade_update: تعديل بطاقة الدخول أو الرد عليها، والرد إذا فشل التعديل"""
+    chat_id = str(chat_id)
+    action, message_id, text = await _in_executor(message_threads.plan, trade_id, chat_id, msg)
+    if action == ACTION_EDIT:
+        edited = await _telegram_request(
+            chat_id, lambda: telegram_api.edit_message_text(chat_id, message_id, text)
+        )
+        if edited is not None:
+            logger.info(f"✏️ تم تعديل بطاقة الصفقة {trade_id} في {chat_id}")
+            await _in_executor(message_threads.update_text, trade_id, chat_id, text)
+            MESSAGE_THREAD_EVENTS_TOTAL.inc('edited')
+            return True
+        MESSAGE_THREAD_EVENTS_TOTAL.inc('edit_failed')
+        action = ACTION_REPLY
+    if action == ACTION_REPLY:
+        MESSAGE_THREAD_EVENTS_TOTAL.inc('replied')
+        return await _send_message(msg, chat_id, **reply_parameters(message_id)) is not None
+    MESSAGE_THREAD_EVENTS_TOTAL.inc('unthreaded')
+    return await send_telegram(msg, chat_id)
+
+
+def trade_sender(spec, trade_id):
+    """نفس app.trade_sender: دالة الإرسال لمجموعة واحدة لإشارة صفقة، أو None للإرسال العادي"""
+    if message_threads is None or not trade_id or not spec.trade_action:
+        return None
+    if spec.trade_action == ACTION_OPEN:
+        return partial(send_entry_card, trade_id)
+    return partial(send_trade_update, trade_id)
+
+
+async def _record(msg, chat_ids) -> dict:
+    """تسجيل الرسالة في الـ outbox - {} عند الخطأ (لا نوقف الإرسال بسبب الـ outbox)"""
+    try:
+        return await _in_executor(outbox.record, msg, chat_ids)
+    except sqlite3.Error as e:
+        logger.error(f"❌ خطأ في تسجيل الرسالة في الـ outbox: {e}")
+        return {}
+
+
+async def _deliver(msg, chat_id, rows, send_fn=send_telegram):
+    """
+    إرسال لمجموعة واحدة من مسارها: النتيجة تُسجل في الـ outbox (حذف، أو إعادة محاولة من خيط الـ outbox)
+    rows = Future بسجلات record (يُنتظر هنا حتى يتحدد ترتيب الرسالة في المسار لحظة الاستقبال)
+    """
+    row = (await rows).get(chat_id) if rows is not None else None
+    if row is None:
+        return await send_fn(msg, chat_id)
+    row_id, created_at = row
+    # حجز ذري لحظة الإرسال: False إذا بدأ drain أو أخذت عملية أخرى السجل بعد انتهاء حجزه في المسار
+    if not await _in_executor(outbox.begin, row_id, chat_id, created_at):
+        return False
+    error = None
+    try:
+        ok = await send_fn(msg, chat_id)
+    except asyncio.CancelledError:
+        # إيقاف أثناء الإرسال: السجل يبقى pending ويُعاد إرساله لاحقاً (بدون انتظار - المهمة أُلغيت)
+        asyncio.get_running_loop().run_in_executor(
+            None, partial(outbox.settle, row_id, chat_id, 0, False, 'cancelled')
+        )
+        raise
+    except Exception as e:
+        # مثل Outbox._attempt: أي خطأ = محاولة فاشلة (وإلا يبقى السجل في _active ولا يُعاد إرساله)
+        logger.error(f"❌ خطأ في الإرسال إلى {chat_id}: {e!r}")
+        ok, error = False, str(e)
+    return await _in_executor(outbox.settle, row_id, chat_id, 0, ok, error)
+
+
+async def broadcast(msg, chat_ids, send_fn=None):
+    """
+    إرسال رسالة لعدة مجموعات بالتوازي (مسار FIFO لكل مجموعة) - نفس شكل النتيجة في app.broadcast
+    send_fn: دالة الإرسال لمجموعة واحدة بدلاً من send_telegram (trade_sender)
+    """
+    targets = []
+    for chat_id in chat_ids:
+        chat_id = str(chat_id).strip()
+        if chat_id and chat_id not in targets:
+            targets.append(chat_id)
+    rows = asyncio.ensure_future(_record(msg, targets)) if outbox is not None else None
+    send_fn = send_fn or send_telegram
+    futures = {chat_id: lanes.submit(chat_id, _deliver, msg, chat_id, rows, send_fn) for chat_id in targets}
+    if futures:
+        await asyncio.wait(futures.values())
+    return _collect_results(futures)
+
+
+def _on_sent(task):
+    if not task.cancelled() and task.exception() is None:
+        _log_send_summary(task.result())
+
+
+def _spawn(coro):
+    """إرسال في الخلفية (DELIVERY_MODE=async): الرد فوراً والإرسال يكمل داخل الحلقة"""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    task.add_done_callback(_on_sent)
+    return task
+
+
+def _targets(chat_id):
+    return [chat_id] if chat_id else TELEGRAM_CHAT_IDS
+
+
+def _is_json(request) -> bool:
+    return request.content_type == 'application/json' or request.content_type.endswith('+json')
+
+
+def _process(spec, data):
+    """
+    منع التكرار وحفظ الصفقة والتنسيق (حاجبة - تعمل في executor)
+
+    Returns:
+        (duplicate, msg, trade_id)
+    """
+    started = time.perf_counter()
+    duplicate = is_duplicate(spec, data)
+    WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'dedup')
+    if duplicate:
+        return True, None, None
+
+    started = time.perf_counter()
+    trade_id = record_trade(spec, data)
+    WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'store')
+
+    started = time.perf_counter()
+    msg = spec.render(data)
+    WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'format')
+    return False, msg, trade_id
+
+
+async def webhook(request):
+    started = time.perf_counter()
+    try:
+        if request.method == 'GET':
+            return web.json_response({"status": "ok", "message": "Webhook active"})
+        return await _handle_signal(request, request.match_info.get('chat_id'))
+    except Exception as e:
+        logger.error(f"❌ Error: {e}", exc_info=True)
+        return web.json_response({"error": str(e)}, status=500)
+    finally:
+        WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'total')
+
+
+async def _handle_signal(request, chat_id):
+    raw = await request.text()
+    if not raw:
+        return web.json_response({"error": "No data"}, status=400)
+    if '{' not in raw:
+        return web.json_response({"error": "Invalid JSON"}, status=400)
+
+    # استخراج JSON (مرور واحد + استبدال placeholders)
+    started = time.perf_counter()
+    data = extract_payload(raw, is_json=_is_json(request))
+    WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'extract')
+    if not isinstance(data, dict):
+        return web.json_response({"error": "Invalid JSON"}, status=400)
+    signal = str(data.get('signal', '')).upper()
+
+    if not signal:
+        return web.json_response({"error": "Signal required"}, status=400)
+    spec = signal_registry.resolve(signal)
+    if spec is None:
+        return web.json_response({"error": f"Unknown signal: {signal}"}, status=400)
+    SIGNALS_TOTAL.inc(spec.name, str(data.get('symbol', 'N/A')))
+
+    duplicate, msg, trade_id = await _in_executor(_process, spec, data)
+    if duplicate:
+        DUPLICATES_TOTAL.inc(spec.name)
+        logger.warning(f"⚠️ تكرار: {signal} - {data.get('symbol')}")
+        return web.json_response({"status": "ignored"})
+    if not msg:
+        return web.json_response({"status": "error"}, status=500)
+
+    targets = _targets(chat_id)
+    if not targets:
+        logger.error("❌ No chat IDs available - يجب تحديد Chat IDs في config.py")
+        return web.json_response({
+            "error": "No chat IDs available",
+            "message": "يجب تحديد Chat IDs في config.py أو استخدام /personal/<chat_id>/webhook"
+        }, status=500)
+
+    # تعديل بطاقة الدخول أو الرد عليها
+    sender = trade_sender(spec, trade_id)
+
+    # وضع الطابور: الرد فوراً والإرسال في الخلفية
+    if DELIVERY_MODE == 'async':
+        _spawn(broadcast(msg, targets, sender))
+        return web.json_response({"status": "queued", "signal": signal, "total": len(targets)}, status=202)
+
+    logger.info(f"📤 إرسال إلى {len(targets)} مجموعة")
+    result = await broadcast(msg, targets, sender)
+    if result['success'] == 0:
+        return web.json_response({"status": "error"}, status=500)
+    if chat_id:
+        return web.json_response({"status": "success", "signal": signal, "chat_id": chat_id})
+    return web.json_response({
+        "status": "success",
+        "signal": signal,
+        "sent_to": result['success'],
+        "total": result['total']
+    })
+
+
+def _process_bulk(entries):
+    items, msgs = [], []
+    for index, (data, error) in enumerate(entries):
+        if error:
+            item, msg = {"status": "error", "error": error}, None
+        else:
+            item, msg = process_bulk_item(data)
+        item["index"] = index
+        items.append(item)
+        if msg:
+            msgs.append(msg)
+    return items, msgs
+
+
+async def webhook_bulk(request):
+    """عدة إشارات في طلب واحد: مصفوفة JSON أو NDJSON (نفس app.webhook_bulk)"""
+    try:
+        entries = parse_bulk(await request.text())
+    except ValueError as e:
+        return web.json_response({"error": f"Invalid JSON: {e}"}, status=400)
+    if not entries:
+        return web.json_response({"error": "No data"}, status=400)
+    if len(entries) > BULK_MAX_ITEMS:
+        return web.json_response({"error": f"Too many items (max {BULK_MAX_ITEMS})"}, status=413)
+
+    targets = _targets(request.match_info.get('chat_id'))
+    if not targets:
+        logger.error("❌ No chat IDs available - يجب تحديد Chat IDs في config.py")
+        return web.json_response({"error": "No chat IDs available"}, status=500)
+
+    items, msgs = await _in_executor(_process_bulk, entries)
+    response = {
+        "status": "success",
+        "total": len(items),
+        "accepted": len(msgs),
+        "ignored": sum(1 for item in items if item["status"] == "ignored"),
+        "errors": sum(1 for item in items if item["status"] == "error"),
+        "items": items,
+    }
+    logger.info(f"📥 دفعة: {response['accepted']}/{response['total']} إشارة مقبولة")
+    if not msgs:
+        return web.json_response(response)
+
+    digests = build_digests(msgs)
+    if DELIVERY_MODE == 'async':
+        for digest in digests:
+            _spawn(broadcast(digest, targets))
+        response["delivery"] = {"mode": "queued", "messages": len(digests)}
+        return web.json_response(response, status=202)
+
+    sent = 0
+    for digest in digests:
+        sent += (await broadcast(digest, targets))['success']
+    response["delivery"] = {"mode": "sync", "messages": len(digests), "sent": sent, "total": len(digests) * len(targets)}
+    if sent == 0:
+        response["status"] = "error"
+        return web.json_response(response, status=500)
+    return web.json_response(response)
+
+
+async def telegram_webhook(request):
+    """Webhook endpoint للبوت - للرد على الأوامر مثل /start"""
+    try:
+        data = await request.json()
+        if not data:
+            return web.json_response({"status": "ok"})
+
+        message = data.get('message', {})
+        chat_id = str(message.get('chat', {}).get('id', ''))
+        reply = command_reply(message.get('text', ''))
+        if reply:
+            await send_telegram(reply, chat_id)
+        return web.json_response({"status": "ok"})
+    except Exception as e:
+        logger.error(f"Error in telegram webhook: {e}")
+        return web.json_response({"status": "ok"})  # دائماً نرد OK حتى لا يحاول Telegram إعادة الإرسال
+
+
+async def _trades_response(request, statuses=None, symbol=None, extra=None):
+    """نفس app._trades_response: صفحة مع ?limit=، وإلا بث كل الصفقات على دفعات"""
+    try:
+        limit, after, fields = _page_args(request.query)
+        trades, cursor = await _in_executor(trade_store.page, statuses, symbol, after, limit or TRADES_STREAM_BATCH)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    extra = extra or {}
+
+    if limit is not None:
+        return web.json_response({
+            "status": "success",
+            **extra,
+            "count": len(trades),
+            "trades": {t['id']: _project(t, fields) for t in trades},
+            "next_cursor": cursor
+        })
+
+    response = web.StreamResponse()
+    response.content_type = 'application/json'
+    await response.prepare(request)
+    head = json.dumps({"status": "success", **extra})
+    await response.write((head[:-1] + ', "trades": {').encode())
+    count = 0
+    while trades:
+        await response.write((('' if count == 0 else ', ') + ', '.join(
+            f"{json.dumps(t['id'])}: {json.dumps(_project(t, fields))}" for t in trades
+        )).encode())
+        count += len(trades)
+        if cursor is None:
+            break
+        trades, cursor = await _in_executor(trade_store.page, statuses, symbol, cursor, TRADES_STREAM_BATCH)
+    await response.write(f'}}, "count": {count}}}'.encode())
+    await response.write_eof()
+    return response
+
+
+async def get_trades(request):
+    """الحصول على جميع الصفقات (?status=open|closed، ?limit=&after= للصفحات، ?fields=)"""
+    status = request.query.get('status', 'all')
+    if status == 'open':
+        return await _trades_response(request, ['open'])
+    elif status == 'closed':
+        return await _trades_response(request, CLOSED_STATUSES)
+    return await _trades_response(request)
+
+
+async def get_trades_by_symbol(request):
+    """الحصول على صفقات رمز معين"""
+    symbol = request.match_info['symbol'].upper()
+    return await _trades_response(request, symbol=symbol, extra={"symbol": symbol})
+
+
+async def get_trades_stats(request):
+    """إحصائيات الصفقات (?verify=1 لإعادة الحساب من التخزين والمقارنة)"""
+    response = {"status": "success"}
+    if request.query.get('verify') in ('1', 'true'):
+        response["verify"] = await _in_executor(trade_store.verify_stats)
+    response["stats"] = await _in_executor(trade_store.stats)
+    return web.json_response(response)
+
+
+async def health(request):
+    return web.json_response({"status": "ok"})
+
+
+async def get_rate_limits(request):
+    """الميزانية الحالية لمحدد المعدل (عام ولكل مجموعة)"""
+    return web.json_response({"status": "success", "rate_limits": rate_limiter.budget()})
+
+
+async def metrics(request):
+    """مقاييس Prometheus لهذه العملية"""
+    return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+
+async def _on_startup(application):
+    # احتياط لخوادم بدون post_worker_init (gunicorn.conf.py)
+    startup_tasks.start()
+
+
+async def _on_shutdown(application):
+    """انتظار الإرسالات في الخلفية ثم تحرير سجلات الـ outbox غير المرسلة (خلال OUTBOX_DRAIN_TIMEOUT)"""
+    deadline = time.monotonic() + OUTBOX_DRAIN_TIMEOUT
+    if _background:
+        await asyncio.wait(set(_background), timeout=OUTBOX_DRAIN_TIMEOUT)
+    await _in_executor(stop_background_tasks, max(0.0, deadline - time.monotonic()))
+
+
+async def _on_cleanup(application):
+    await telegram_api.close()
+
+
+app = web.Application()
+for path in ('/webhook', '/personal/{chat_id}/webhook'):
+    app.router.add_get(path, webhook)
+    app.router.add_post(path, webhook)
+app.router.add_post('/webhook/bulk', webhook_bulk)
+app.router.add_post('/personal/{chat_id}/webhook/bulk', webhook_bulk)
+app.router.add_post('/telegram-webhook', telegram_webhook)
+app.router.add_get('/trades', get_trades)
+app.router.add_get('/trades/stats', get_trades_stats)  # قبل /trades/{symbol}
+app.router.add_get('/trades/{symbol}', get_trades_by_symbol)
+app.router.add_get('/health', health)
+app.router.add_get('/rate-limits', get_rate_limits)
+app.router.add_get('/metrics', metrics)
+app.on_startup.append(_on_startup)
+app.on_shutdown.append(_on_shutdown)
+app.on_cleanup.append(_on_cleanup)
+
+if __name__ == '__main__':
+    start_background_tasks(standalone=True)
+    port = int(os.getenv('PORT', 5000))
+    web.run_app(app, host='0.0.0.0', port=port)
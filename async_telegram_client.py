@@ -0,0 +1,108 @@
+"""
+Async Telegram API Client - نفس TelegramClient فوق aiohttp (لـ async_app.py)
+جلسة aiohttp واحدة لكل حلقة asyncio مع مجمع اتصالات keep-alive؛ الطلب لا يحجز خيطاً أثناء انتظار الرد
+"""
+import logging
+import time
+
+import aiohttp
+
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_API_BASE_URL,
+    TELEGRAM_POOL_SIZE,
+    TELEGRAM_CONNECT_TIMEOUT,
+    TELEGRAM_READ_TIMEOUT
+)
+from telegram_client import encode_payload, encode_message, _observe, _JSON_HEADERS
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTelegramClient:
+    """
+    عميل Bot API غير متزامن (يُستخدم من داخل حلقة asyncio واحدة فقط)
+
+    Args:
+        token: توكن البوت
+        base_url: عنوان الـ API (يمكن توجيهه إلى خادم محلي للاختبار)
+        timeout: (connect, read) بالثواني
+        pool_size: أقصى عدد اتصالات متزامنة إلى Telegram
+    """
+
+    def __init__(self, token: str = TELEGRAM_BOT_TOKEN, base_url: str = TELEGRAM_API_BASE_URL,
+                 timeout: tuple = (TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT),
+                 pool_size: int = TELEGRAM_POOL_SIZE):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        self.pool_size = pool_size
+        self._session = None
+        self._method_urls = {}
+
+    def method_url(self, method: str) -> str:
+        url = self._method_urls.get(method)
+        if url is None:
+            url = f"{self.base_url}/bot{self.token}/{method}"
+            self._method_urls[method] = url
+        return url
+
+    def session(self) -> aiohttp.ClientSession:
+        """الجلسة المشتركة (تُنشأ عند أول طلب داخل الحلقة الجارية)"""
+        if self._session is None or self._session.closed:
+            # trust_env: نفس سلوك requests مع HTTP(S)_PROXY / NO_PROXY
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=self.timeout,
+                trust_env=True
+            )
+            logger.info(f"🔌 تم إنشاء جلسة Telegram غير متزامنة (pool={self.pool_size})")
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _call(self, method: str, chat_id, http_method: str, **kwargs) -> tuple:
+        """
+        Returns:
+            (status, result) - result = JSON الرد أو {} إذا لم يكن JSON
+        """
+        started = time.perf_counter()
+        status = None
+        try:
+            async with self.session().request(http_method, self.method_url(method), **kwargs) as response:
+                status = response.status
+                try:
+                    result = await response.json(content_type=None)
+                except ValueError:
+                    result = {}
+                return status, result if isinstance(result, dict) else {}
+        finally:
+            if chat_id is not None:
+                _observe(method, chat_id, started, status)
+
+    async def post(self, method: str, payload: dict = None, body: bytes = None) -> tuple:
+        """استدعاء method عبر POST (body = JSON جاهز مسبقاً)"""
+        if body is None:
+            body = encode_payload(payload or {})
+        return await self._call(method, None, 'POST', data=body, headers=_JSON_HEADERS)
+
+    async def send_message(self, chat_id: str, text: str, parse_mode: str = 'HTML', body: bytes = None,
+                           **extra) -> tuple:
+        """sendMessage → (status, result)"""
+        if body is None:
+            if extra:
+                body = encode_payload({"chat_id": str(chat_id), "text": text, "parse_mode": parse_mode, **extra})
+            else:
+                body = encode_message(chat_id, text, parse_mode)
+        return await self._call('sendMessage', chat_id, 'POST', data=body, headers=_JSON_HEADERS)
+
+    async def edit_message_text(self, chat_id: str, message_id: int, text: str, parse_mode: str = 'HTML') -> tuple:
+        """editMessageText → (status, result)"""
+        body = encode_payload({"chat_id": str(chat_id), "message_id": message_id, "text": text, "parse_mode": parse_mode})
+        return await self._call('editMessageText', chat_id, 'POST', data=body, headers=_JSON_HEADERS)
+
+    async def get_chat(self, chat_id: str) -> tuple:
+        """getChat → (status, result)"""
+        return await self._call('getChat', chat_id, 'GET', params={"chat_id": str(chat_id)})
@@ -0,0 +1,353 @@
+"""
+Benchmark - حمل من طرف إلى طرف: تنبيهات TradingView بمعدل وتوازي محددين ضد main:app أو app:app
+أو async_app:app تحت gunicorn، مع Bot API محلي (mock_telegram.py عبر TELEGRAM_API_BASE_URL) بدل api.telegram.org
+
+يقيس:
+- الإنتاجية (طلبات/ثانية) وتوزيع الحالات
+- زمن الـ webhook: p50/p95/p99/max (مع --rate يُحسب من الموعد المجدول وليس من لحظة الإرسال الفعلية،
+  حتى لا يخفي تأخر المولّد نفسه بطء الخادم - coordinated omission)
+- زمن التسليم من طرف إلى طرف: من إرسال التنبيه حتى وصول الرسالة لكل مجموعة في الـ mock
+  (كل تنبيه يحمل "time" فريداً يظهر في نص الرسالة - يعمل أيضاً مع الرسائل المدمجة)
+- ذاكرة الـ workers (RSS): القمة والقيمة النهائية لكل worker
+
+حدود rate limit ترفع افتراضياً (الهدف قياس الخادم وليس الانتظار المتعمد) - يمكن استبدالها بـ --env
+
+    python benchmarks/bench_load.py --app main --requests 2000 --concurrency 16
+    python benchmarks/bench_load.py --app app --workers 4 --rate 200 --env DELIVERY_MODE=async --json load.json
+    python benchmarks/bench_load.py --server werkzeug   # بدون gunicorn (خادم خيوط واحد)
+    python benchmarks/bench_load.py --app async_app --server aiohttp --rate 200   # عملية asyncio واحدة
+    python benchmarks/bench_load.py --fault '*:rate_limit=0.05,reset=0.01' --fault=-1002:kicked=1   # مع أعطال
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_telegram import MockTelegram, add_fault_arguments, fault_plan  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alert_corpus.json')
+
+# كل تنبيه يحمل time فريداً: "⏰ الوقت: bench-123" في نص الرسالة
+_ALERT_ID = re.compile(r'⏰ الوقت: bench-(\d+)')
+
+_BENCH_ENV = {
+    'TELEGRAM_BOT_TOKEN': '0:BENCHMARK',
+    'TELEGRAM_GLOBAL_RATE': '1000000',
+    'TELEGRAM_GLOBAL_BURST': '1000000',
+    'TELEGRAM_GROUP_RATE_PER_MIN': '1000000',
+    'TELEGRAM_PRIVATE_RATE_PER_MIN': '1000000',
+    'TELEGRAM_CHAT_BURST': '1000000',
+    'STARTUP_ANNOUNCE': 'False',
+    'NO_PROXY': '127.0.0.1',
+}
+
+_WERKZEUG_SERVER = (
+    "import sys\n"
+    "from werkzeug.serving import run_simple\n"
+    "import {module}\n"
+    "{module}.start_background_tasks()\n"
+    "run_simple('127.0.0.1', {port}, {module}.app, threaded=True)\n"
+)
+
+_AIOHTTP_SERVER = (
+    "from aiohttp import web\n"
+    "import {module}\n"
+    "{module}.start_background_tasks()\n"
+    "web.run_app({module}.app, host='127.0.0.1', port={port}, print=None)\n"
+)
+
+
+def load_alerts(count: int) -> list:
+    """
+    أجسام تنبيهات من alert_corpus.json بالتناوب (بما فيها placeholders ونص قبل/بعد الـ JSON)
+    مع رمز فريد لكل تنبيه حتى لا يتجاهلها منع التكرار
+    """
+    with open(CORPUS, 'r', encoding='utf-8') as f:
+        corpus = [item for item in json.load(f)
+                  if item['expected'] and f'"{item["expected"].get("symbol")}"' in item['body']
+                  and str(item['expected'].get('time')) in item['body']]
+    alerts = []
+    for i in range(count):
+        item = corpus[i % len(corpus)]
+        symbol, sent_time = item['expected']['symbol'], item['expected']['time']
+        body = item['body'].replace(f'"{symbol}"', f'"{symbol}.{i}"', 1).replace(sent_time, f"bench-{i}", 1)
+        alerts.append(body)
+    return alerts
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, port: int, env: dict, workdir: str, log) -> subprocess.Popen:
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(args.root, 'gunicorn.conf.py'),
+                   '-w', str(args.workers), '--threads', str(args.threads), '-b', f"127.0.0.1:{port}",
+                   f"{args.app}:app"]
+        if args.app == 'async_app':
+            command[-1:-1] = ['-k', 'aiohttp.GunicornWebWorker']
+    elif args.server == 'aiohttp':
+        command = [sys.executable, '-c', _AIOHTTP_SERVER.format(module=args.app, port=port)]
+    else:
+        command = [sys.executable, '-c', _WERKZEUG_SERVER.format(module=args.app, port=port)]
+    pythonpath = os.pathsep.join(filter(None, (args.root, env.get('PYTHONPATH'))))
+    return subprocess.Popen(command, cwd=workdir, env=dict(env, PYTHONPATH=pythonpath), stdout=log, stderr=log)
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            requests.get(f"{url}/webhook", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError("server did not become ready")
+
+
+def _children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", 'r') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler(threading.Thread):
+    """ذاكرة الـ workers كل interval ثانية (أبناء عملية gunicorn الرئيسية، أو العملية نفسها مع werkzeug)"""
+
+    def __init__(self, pid: int, workers_are_children: bool, interval: float = 0.25):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.pid = pid
+        self.workers_are_children = workers_are_children
+        self.interval = interval
+        self.peak = {}  # pid → KB
+        self.last = {}
+        self._done = threading.Event()
+
+    def sample(self):
+        pids = _children(self.pid) if self.workers_are_children else [self.pid]
+        current = {pid: _rss_kb(pid) for pid in pids}
+        for pid, kb in current.items():
+            self.peak[pid] = max(self.peak.get(pid, 0), kb)
+        self.last = current
+
+    def run(self):
+        while not self._done.is_set():
+            self.sample()
+            self._done.wait(self.interval)
+
+    def stop(self) -> dict:
+        self.sample()
+        self._done.set()
+        return {
+            'workers': len(self.last),
+            'peak_mb': round(max(self.peak.values(), default=0) / 1024, 1),
+            'final_mb': {str(pid): round(kb / 1024, 1) for pid, kb in sorted(self.last.items())},
+            'final_total_mb': round(sum(self.last.values()) / 1024, 1),
+        }
+
+
+def run_load(url: str, alerts: list, rate: float, concurrency: int) -> tuple:
+    """
+    Returns:
+        (results [(alert index, scheduled/sent epoch, latency, HTTP status, JSON status)], elapsed)
+    """
+    results = [None] * len(alerts)
+    counter = iter(range(len(alerts)))
+    counter_lock = threading.Lock()
+    started = time.time()
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            scheduled = started + i / rate if rate else time.time()
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                response = session.post(f"{url}/webhook", data=alerts[i].encode('utf-8'),
+                                        headers={'Content-Type': 'text/plain'}, timeout=60)
+                try:
+                    status = response.json().get('status')
+                except ValueError:
+                    status = None
+                code = response.status_code
+            except requests.RequestException:
+                code, status = 0, 'connection-error'
+            results[i] = (i, scheduled, time.time() - scheduled, code, status)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.time() - started
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99),
+            'max_ms': round(ordered[-1] * 1000, 2), 'mean_ms': round(statistics.fmean(ordered) * 1000, 2)}
+
+
+def collect_deliveries(mock: MockTelegram, sent_at: dict, expected: int, timeout: float) -> list:
+    """انتظار وصول الرسائل (الطابور/الدمج يرسلان بعد رد الـ webhook) ثم حساب زمن كل تسليم"""
+    deadline = time.monotonic() + timeout
+    while True:
+        delivered = {}
+        for message in mock.messages():
+            for alert in _ALERT_ID.findall(message['text']):
+                key = (int(alert), message['chat_id'])
+                delivered.setdefault(key, message['received_at'])
+        if len(delivered) >= expected or time.monotonic() > deadline:
+            break
+        time.sleep(0.1)
+    return [received - sent_at[alert] for (alert, _), received in delivered.items() if alert in sent_at]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="end-to-end webhook → Telegram load benchmark")
+    parser.add_argument('--root', default=ROOT, help="مجلد المشروع المراد قياسه")
+    parser.add_argument('--app', default='main', choices=['main', 'app', 'async_app'])
+    parser.add_argument('--server', default='gunicorn', choices=['gunicorn', 'werkzeug', 'aiohttp'],
+                        help="aiohttp = عملية asyncio واحدة (مع --app async_app فقط)")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn -w")
+    parser.add_argument('--threads', type=int, default=4, help="gunicorn --threads")
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=0, help="تنبيهات/ثانية (0 = أقصى سرعة)")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--chats', type=int, default=3, help="عدد المجموعات في TELEGRAM_CHAT_IDS")
+    parser.add_argument('--latency-ms', type=float, default=50, help="زمن استجابة Bot API الوهمي")
+    parser.add_argument('--drain-timeout', type=float, default=30, help="ثواني انتظار الرسائل بعد انتهاء الحمل")
+    add_fault_arguments(parser)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="متغيرات بيئة للخادم (DELIVERY_MODE=async, COALESCE_WINDOW_MS=200, ...)")
+    parser.add_argument('--log', help="ملف لسجلات الخادم (الافتراضي: تجاهلها)")
+    parser.add_argument('--json', help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args()
+    args.root = os.path.abspath(args.root)
+    if (args.server == 'aiohttp') != (args.app == 'async_app') and args.server != 'gunicorn':
+        parser.error("--app async_app runs on --server aiohttp or gunicorn; --server aiohttp needs --app async_app")
+
+    mock = MockTelegram(latency=args.latency_ms / 1000.0, faults=fault_plan(args)).start()
+    env = dict(os.environ, **_BENCH_ENV)
+    env.update(
+        TELEGRAM_CHAT_IDS=','.join(str(-1000 - i) for i in range(args.chats)),
+        TELEGRAM_API_BASE_URL=mock.url,
+    )
+    env.update(item.split('=', 1) for item in args.env)
+
+    alerts = load_alerts(args.requests)
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    log = open(args.log, 'w') if args.log else subprocess.DEVNULL
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(args, port, env, workdir, log)
+        try:
+            wait_ready(url, server)
+            mock.reset()  # getChat الخاص بالـ preflight ليس جزءاً من القياس
+            sampler = RssSampler(server.pid, workers_are_children=args.server == 'gunicorn')
+            sampler.start()
+
+            results, elapsed = run_load(url, alerts, args.rate, args.concurrency)
+            accepted = {i: sent for i, sent, _, code, status in results
+                        if 200 <= code < 300 and status in ('success', 'queued', 'coalesced')}
+            delivery = collect_deliveries(mock, accepted, len(accepted) * args.chats, args.drain_timeout)
+            rss = sampler.stop()
+        finally:
+            server.terminate()
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            mock.stop()
+            if log is not subprocess.DEVNULL:
+                log.close()
+
+    statuses = {}
+    for _, _, _, code, status in results:
+        key = f"{code} {status}"
+        statuses[key] = statuses.get(key, 0) + 1
+
+    report = {
+        'app': args.app,
+        'server': args.server,
+        'workers': args.workers if args.server == 'gunicorn' else 1,
+        'threads': args.threads if args.server == 'gunicorn' and args.app != 'async_app' else None,
+        'requests': args.requests,
+        'rate': args.rate,
+        'concurrency': args.concurrency,
+        'chats': args.chats,
+        'api_latency_ms': args.latency_ms,
+        'env': dict(item.split('=', 1) for item in args.env),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'statuses': statuses,
+        'webhook_latency': percentiles([latency for _, _, latency, _, _ in results]),
+        'delivery': dict(
+            expected=len(accepted) * args.chats,
+            delivered=len(delivery),
+            **percentiles(delivery),
+        ),
+        'telegram_requests': dict(mock.requests),
+        'faults': {'rates': args.fault, 'seed': args.fault_seed, 'injected': dict(mock.injected)},
+        'rss': rss,
+    }
+
+    print(f"{args.app}:app on {args.server} ({report['workers']} workers), {args.requests} alerts, "
+          f"concurrency {args.concurrency}, rate {args.rate or 'max'}, {args.chats} chats, "
+          f"API latency {args.latency_ms:.0f}ms")
+    print(f"throughput: {report['throughput_rps']} req/s in {elapsed:.2f}s  statuses: {statuses}")
+    for name, row in (('webhook', report['webhook_latency']), ('delivery', report['delivery'])):
+        if 'p50_ms' in row:
+            print(f"{name:>9}: p50 {row['p50_ms']}ms  p95 {row['p95_ms']}ms  p99 {row['p99_ms']}ms  max {row['max_ms']}ms")
+    print(f"delivered {report['delivery']['delivered']}/{report['delivery']['expected']} messages, "
+          f"Telegram requests {report['telegram_requests']}")
+    if args.fault:
+        print(f"injected faults: {report['faults']['injected']}")
+    print(f"worker RSS: peak {rss['peak_mb']}MB, final total {rss['final_total_mb']}MB ({rss['workers']} workers)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
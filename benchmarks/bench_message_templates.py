@@ -0,0 +1,227 @@
+"""
+Benchmark - تنسيق الرسائل: قوالب message_templates + كاش format_price/format_timeframe
+مقابل الطريقة القديمة (+= لكل سطر واستدعاء escape_html/format_price/format_timeframe في كل مرة)
+
+    python benchmarks/bench_message_templates.py
+    python benchmarks/bench_message_templates.py --iterations 20000 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:BENCHMARK')
+
+import telegram_bot  # noqa: E402
+
+
+# نسخة من الدوال القديمة في telegram_bot (للمقارنة فقط)
+def legacy_escape_html(text):
+    if not isinstance(text, str):
+        text = str(text)
+    text = text.replace('&', '&amp;')
+    text = text.replace('<', '&lt;')
+    text = text.replace('>', '&gt;')
+    return text
+
+
+def legacy_format_price(price):
+    if price == 0:
+        return "0.00"
+    if price >= 1000:
+        return f"{price:,.2f}"
+    elif price >= 1:
+        return f"{price:,.2f}"
+    elif price >= 0.01:
+        return f"{price:.4f}"
+    else:
+        return f"{price:.8f}".rstrip('0').rstrip('.')
+
+
+def legacy_format_timeframe(timeframe):
+    if not timeframe or timeframe == 'N/A':
+        return 'N/A'
+    try:
+        minutes = int(timeframe)
+        if minutes < 60:
+            return f"{minutes} د"
+        elif minutes < 1440:
+            hours = minutes // 60
+            remaining_minutes = minutes % 60
+            if remaining_minutes == 0:
+                return f"{hours} س"
+            else:
+                return f"{hours} س {remaining_minutes} د"
+        else:
+            days = minutes // 1440
+            remaining_hours = (minutes % 1440) // 60
+            if remaining_hours == 0:
+                return f"{days} ي"
+            else:
+                return f"{days} ي {remaining_hours} س"
+    except (ValueError, TypeError):
+        timeframe_upper = str(timeframe).upper()
+        if timeframe_upper.endswith('D'):
+            return f"{int(timeframe_upper.replace('D', ''))} ي"
+        elif timeframe_upper.endswith('H'):
+            return f"{int(timeframe_upper.replace('H', ''))} س"
+        elif timeframe_upper.endswith('M'):
+            return f"{int(timeframe_upper.replace('M', ''))} د"
+        elif timeframe_upper.endswith('W'):
+            return f"{int(timeframe_upper.replace('W', ''))} أ"
+        return str(timeframe)
+
+
+def legacy_format_buy_signal(data):
+    symbol = data.get('symbol', 'N/A')
+    entry_price = data.get('entry_price') or data.get('price', 0)
+    tp1 = data.get('tp1')
+    tp2 = data.get('tp2')
+    tp3 = data.get('tp3')
+    stop_loss = data.get('stop_loss')
+    time_ = data.get('time', 'N/A')
+    timeframe = data.get('timeframe', 'N/A')
+
+    if not (tp1 or tp2 or tp3 or stop_loss) and entry_price:
+        try:
+            calculated = telegram_bot.calculate_tp_sl(float(entry_price), is_long=True)
+            tp1 = calculated['tp1']
+            tp2 = calculated['tp2']
+            tp3 = calculated['tp3']
+            stop_loss = calculated['stop_loss']
+        except:  # noqa: E722
+            pass
+
+    message = f"🟢 <b>صفقة لونج (LONG)</b> 🟢\n\n"
+    message += f"📊 الرمز: {legacy_escape_html(symbol)}\n"
+    message += f"💰 سعر الدخول: <code>{legacy_format_price(entry_price)}</code>\n"
+    message += f"⏰ الوقت: {legacy_escape_html(time_)}\n"
+    message += f"📈 الإطار الزمني: {legacy_escape_html(legacy_format_timeframe(timeframe))}\n\n"
+
+    has_tp_sl = tp1 or tp2 or tp3 or stop_loss
+    if has_tp_sl:
+        message += f"🎯 <b>أهداف الربح:</b>\n"
+        if tp1:
+            message += f"🎯 TP1: <code>{legacy_format_price(float(tp1))}</code>\n"
+        if tp2:
+            message += f"🎯 TP2: <code>{legacy_format_price(float(tp2))}</code>\n"
+        if tp3:
+            message += f"🎯 TP3: <code>{legacy_format_price(float(tp3))}</code>\n"
+        message += "\n"
+        if stop_loss:
+            message += f"🛑 وقف الخسارة: <code>{legacy_format_price(float(stop_loss))}</code>"
+    else:
+        message += f"⚠️ <i>ملاحظة: TP/SL غير متاحة</i>\n"
+        message += f"💡 <i>الحل: تأكد من أسماء الـ plots في التنبيه</i>\n"
+        message += f"📝 <i>الأسماء الشائعة: \"TP Line 1\", \"TP1\", \"SL Line\", \"Stop Loss\"</i>"
+
+    return message
+
+
+def legacy_format_tp1_hit(data):
+    symbol = data.get('symbol', 'N/A')
+    entry_price = data.get('entry_price', 0)
+    tp1 = data.get('tp1')
+    exit_price = data.get('exit_price') or data.get('price', 0)
+    time_ = data.get('time', 'N/A')
+
+    if exit_price and entry_price:
+        try:
+            if abs(float(exit_price) - float(entry_price)) < 0.01:
+                if tp1:
+                    exit_price = tp1
+                    telegram_bot.logger.info(f"✅ TP1 Hit: تم استخدام TP1 كسعر خروج لأن exit_price = entry_price")
+        except (ValueError, TypeError):
+            pass
+
+    message = f"🎯✅ <b>تم ضرب الهدف الأول (TP1)</b> ✅🎯\n\n"
+    message += f"📊 الرمز: {legacy_escape_html(symbol)}\n"
+    if entry_price:
+        message += f"💰 سعر الدخول: <code>{legacy_format_price(entry_price)}</code>\n"
+    if exit_price:
+        message += f"💰 سعر الخروج: <code>{legacy_format_price(exit_price)}</code>\n"
+    if tp1:
+        message += f"🎯 TP1: <code>{legacy_format_price(float(tp1))}</code>\n"
+    elif exit_price:
+        message += f"🎯 TP1: <code>{legacy_format_price(exit_price)}</code>\n"
+    message += f"⏰ الوقت: {legacy_escape_html(time_)}"
+    return message
+
+
+def build_corpus(size: int, seed: int = 7) -> dict:
+    """
+    إشارات اصطناعية بتوزيع قريب من الإنتاج: عدد محدود من الرموز والأطر الزمنية،
+    ونفس مستويات TP/SL تتكرر بين إشارة الدخول وإشارات TP التالية
+    """
+    rng = random.Random(seed)
+    symbols = {'BTCUSDT': 65000.0, 'ETHUSDT': 3400.0, 'SOLUSDT': 150.0, 'XRPUSDT': 0.52,
+               'DOGEUSDT': 0.12, 'PEPEUSDT': 0.0000123, 'EURUSD': 1.08, 'XAUUSD': 2350.0}
+    timeframes = ['5', '15', '60', '240', '1D']
+    entries, exits = [], []
+    for _ in range(size):
+        symbol, base = rng.choice(list(symbols.items()))
+        entry = round(base * (1 + rng.uniform(-0.002, 0.002)), 8)
+        step = entry * 0.025
+        signal = {
+            'symbol': symbol, 'price': entry, 'entry_price': entry, 'time': '2024-05-01T12:00:00Z',
+            'timeframe': rng.choice(timeframes),
+            'tp1': round(entry + step, 8), 'tp2': round(entry + 2 * step, 8), 'tp3': round(entry + 3 * step, 8),
+            'stop_loss': round(entry - step, 8),
+        }
+        entries.append(signal)
+        exits.append(dict(signal, exit_price=signal['tp1']))
+    return {'entry': entries, 'tp1': exits}
+
+
+def throughput(formatter, signals, iterations: int) -> float:
+    """رسائل/ثانية"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for data in signals:
+            formatter(data)
+    elapsed = time.perf_counter() - started
+    return iterations * len(signals) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="message_templates benchmark")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--signals', type=int, default=500)
+    parser.add_argument('--json', help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.signals)
+    formatters = {
+        'entry': (legacy_format_buy_signal, telegram_bot.format_buy_signal),
+        'tp1': (legacy_format_tp1_hit, telegram_bot.format_tp1_hit),
+    }
+
+    results = {'signals': args.signals, 'iterations': args.iterations, 'mismatches': {}, 'throughput': {}}
+    for group, (legacy, current) in formatters.items():
+        signals = corpus[group]
+        results['mismatches'][group] = sum(legacy(data) != current(data) for data in signals)
+        results['throughput'][group] = {
+            'legacy': round(throughput(legacy, signals, args.iterations)),
+            'templates': round(throughput(current, signals, args.iterations)),
+        }
+
+    print(f"{args.signals} signals x {args.iterations} iterations")
+    print(f"\n{'messages/s':>10} {'legacy':>10} {'templates':>10} {'speedup':>8} {'mismatches':>11}")
+    for group in formatters:
+        row = results['throughput'][group]
+        print(f"{group:>10} {row['legacy']:>10} {row['templates']:>10} "
+              f"{row['templates'] / row['legacy']:>7.1f}x {results['mismatches'][group]:>11}")
+    info = telegram_bot.format_price.cache_info()
+    print(f"\nformat_price cache: {info.hits} hits / {info.misses} misses")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark - استخراج JSON من أجسام التنبيهات: payload_parser مقابل الطريقة القديمة
+(حلقة Python حرف بحرف لمطابقة الأقواس + re.sub مرتين)
+
+    python benchmarks/bench_payload_parser.py
+    python benchmarks/bench_payload_parser.py --iterations 20000 --json results.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from payload_parser import extract_payload  # noqa: E402
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alert_corpus.json')
+
+
+def legacy_extract_payload(raw: str):
+    """نسخة من التنظيف القديم في app.webhook / main.webhook (للمقارنة فقط)"""
+    start = raw.find('{')
+    if start == -1:
+        return json.loads(raw)
+    brace = 0
+    end = start
+    for i in range(start, len(raw)):
+        if raw[i] == '{':
+            brace += 1
+        elif raw[i] == '}':
+            brace -= 1
+            if brace == 0:
+                end = i + 1
+                break
+    json_str = raw[start:end]
+    json_str = re.sub(r'\{\{plot\([^)]+\)\}\}', 'null', json_str)
+    json_str = re.sub(r'\{\{[^}]+\}\}', 'null', json_str)
+    return json.loads(json_str)
+
+
+def check(parser, corpus) -> list:
+    """أسماء الأجسام التي لا يطابق ناتجها القيمة المتوقعة"""
+    failures = []
+    for item in corpus:
+        try:
+            ok = parser(item['body']) == item['expected']
+        except ValueError:
+            ok = False
+        if not ok:
+            failures.append(item['name'])
+    return failures
+
+
+def throughput(parser, bodies, iterations: int) -> float:
+    """أجسام/ثانية (الأجسام التي يفشل فيها المحلل تُحسب أيضاً - الوقت حتى الاستثناء)"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for body in bodies:
+            try:
+                parser(body)
+            except ValueError:
+                pass
+    elapsed = time.perf_counter() - started
+    return iterations * len(bodies) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="payload_parser benchmark")
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--json', help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args()
+
+    with open(CORPUS_FILE, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    groups = {
+        'clean': [c['body'] for c in corpus if '{{' not in c['body'] and c['body'].lstrip().startswith('{')],
+        'dirty': [c['body'] for c in corpus if '{{' in c['body'] or not c['body'].lstrip().startswith('{')],
+        'all': [c['body'] for c in corpus],
+    }
+    parsers = {'legacy': legacy_extract_payload, 'payload_parser': extract_payload}
+
+    results = {'corpus': len(corpus), 'iterations': args.iterations, 'failures': {}, 'throughput': {}}
+    for name, fn in parsers.items():
+        results['failures'][name] = check(fn, corpus)
+        results['throughput'][name] = {
+            group: round(throughput(fn, bodies, args.iterations)) for group, bodies in groups.items()
+        }
+
+    print(f"corpus: {len(corpus)} bodies, {args.iterations} iterations")
+    for name in parsers:
+        failures = results['failures'][name]
+        print(f"{name:>15}: {len(corpus) - len(failures)}/{len(corpus)} correct"
+              + (f" (failed: {', '.join(failures)})" if failures else ''))
+    print(f"\n{'bodies/s':>15} " + ' '.join(f"{group:>10}" for group in groups))
+    for name in parsers:
+        print(f"{name:>15} " + ' '.join(f"{results['throughput'][name][group]:>10}" for group in groups))
+    print(f"{'speedup':>15} " + ' '.join(
+        f"{results['throughput']['payload_parser'][g] / results['throughput']['legacy'][g]:>9.1f}x" for g in groups
+    ))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark - محدد المعدل: استقلال المجموعات + تكلفة الحجز
+مجموعة استهلكت دفعتها أو تحت retry_after يجب ألا تؤخر الدلو العام لبقية المجموعات،
+والانتظار الوحيد المشترك هو حد البوت العام (~30 رسالة/ثانية)
+
+    python benchmarks/bench_rate_limiter.py
+    python benchmarks/bench_rate_limiter.py --iterations 200000 --json results.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rate_limiter import RateLimiter  # noqa: E402
+
+# أقصى انتظار مقبول لمجموعة لم تتجاوز حدها (هامش لتوقيت الاختبار)
+TOLERANCE = 0.05
+
+
+def _wait(limiter: RateLimiter, chat_id: str) -> float:
+    """الانتظار الكلي لرسالة واحدة (موعد المجموعة ثم الرمز العام) بدون sleep"""
+    return max(0.0, limiter.reserve(chat_id)) + max(0.0, limiter.reserve_global())
+
+
+def check() -> dict:
+    """
+    Returns:
+        {اسم الحالة: (الانتظار الفعلي، هل نجحت)}
+    """
+    results = {}
+
+    # مجموعة استهلكت دفعتها: رسالتها التالية تنتظر، والمجموعة الأخرى لا
+    limiter = RateLimiter(global_rate=30, global_burst=30, group_rate_per_min=20, chat_burst=3)
+    for _ in range(3):
+        _wait(limiter, '-100A')
+    waited = _wait(limiter, '-100A')
+    results['burst: A waits'] = (waited, waited > 1.0)
+    waited = _wait(limiter, '-100B')
+    results['burst: idle B'] = (waited, waited <= TOLERANCE)
+
+    # retry_after لمجموعة واحدة لا يوقف الباقي
+    limiter = RateLimiter(global_rate=30, global_burst=30, group_rate_per_min=20, chat_burst=3)
+    limiter.backoff('-100A', 30)
+    waited = _wait(limiter, '-100A')
+    results['backoff: A waits'] = (waited, waited > 29.0)
+    for chat_id in ('-100B', '-100C'):
+        waited = _wait(limiter, chat_id)
+        results[f'backoff: {chat_id}'] = (waited, waited <= TOLERANCE)
+
+    # الحد العام ما زال يُطبق: 31 رسالة لـ 31 مجموعة مختلفة - الأخيرة تنتظر رمزاً عاماً
+    limiter = RateLimiter(global_rate=30, global_burst=30, group_rate_per_min=20, chat_burst=3)
+    waits = [_wait(limiter, f'-100{i}') for i in range(31)]
+    results['global: 31st message'] = (waits[-1], 0.0 < waits[-1] <= 1 / 30 + TOLERANCE)
+    return results
+
+
+def throughput(iterations: int) -> float:
+    """حجوزات/ثانية (مجموعة + عام) على 100 مجموعة بمعدلات بلا حد فعلي"""
+    limiter = RateLimiter(global_rate=1e9, global_burst=1e9, group_rate_per_min=1e9, chat_burst=1e9)
+    chats = [f'-100{i}' for i in range(100)]
+    started = time.perf_counter()
+    for i in range(iterations):
+        _wait(limiter, chats[i % 100])
+    return iterations / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="rate_limiter benchmark")
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--json', help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args()
+
+    results = check()
+    failed = [name for name, (_, ok) in results.items() if not ok]
+    for name, (waited, ok) in results.items():
+        print(f"{name:>22}: {waited:7.3f}s {'ok' if ok else 'FAIL'}")
+    rate = throughput(args.iterations)
+    print(f"\n{'reservations/s':>22}: {rate:,.0f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'checks': {name: {'wait': waited, 'ok': ok} for name, (waited, ok) in results.items()},
+                       'reservations_per_sec': round(rate)}, f, indent=2)
+    if failed:
+        sys.exit(f"failed: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
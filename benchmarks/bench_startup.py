@@ -0,0 +1,112 @@
+"""
+Benchmark - زمن إقلاع الـ worker: من بدء الاستيراد حتى يصبح التطبيق جاهزاً لاستقبال الـ webhooks
+كل تشغيل في عملية جديدة، مع خادم Bot API محلي (TELEGRAM_API_BASE_URL) يرد بنجاح وبزمن استجابة ثابت
+حتى لا تعتمد النتيجة على الشبكة
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --module app --runs 10 --latency-ms 50
+    python benchmarks/bench_startup.py --root /path/to/old/checkout   # للمقارنة مع نسخة سابقة
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = (
+    "import time, sys\n"
+    "started = time.perf_counter()\n"
+    "import {module}\n"
+    "sys.stdout.write(repr(time.perf_counter() - started))\n"
+)
+
+
+def start_fake_api(latency: float) -> ThreadingHTTPServer:
+    """Bot API وهمي: كل طلب ينجح بعد latency ثانية"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(latency)
+            body = b'{"ok":true,"result":{"message_id":1,"status":"administrator","id":1}}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = _reply
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def boot_time(root: str, module: str, env: dict) -> float:
+    """ثواني استيراد الوحدة في عملية جديدة (مجلد عمل مؤقت: ملفات الصفقات/الأقفال لا تختلط)"""
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(module=module)],
+            cwd=workdir, env=dict(env, PYTHONPATH=root), capture_output=True, text=True, timeout=120
+        )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'import failed')
+    return float(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="worker boot time benchmark")
+    parser.add_argument('--root', default=ROOT, help="مجلد المشروع المراد قياسه")
+    parser.add_argument('--module', default='main', choices=['main', 'app'])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--chats', type=int, default=3, help="عدد المجموعات في TELEGRAM_CHAT_IDS")
+    parser.add_argument('--latency-ms', type=float, default=100, help="زمن استجابة Bot API الوهمي")
+    parser.add_argument('--json', help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args()
+
+    server = start_fake_api(args.latency_ms / 1000.0)
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN='0:BENCHMARK',
+        TELEGRAM_CHAT_IDS=','.join(str(-1000 - i) for i in range(args.chats)),
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{server.server_port}",
+        NO_PROXY='127.0.0.1',
+    )
+
+    samples = [boot_time(os.path.abspath(args.root), args.module, env) for _ in range(args.runs)]
+    server.shutdown()
+
+    results = {
+        'root': os.path.abspath(args.root),
+        'module': args.module,
+        'runs': args.runs,
+        'chats': args.chats,
+        'latency_ms': args.latency_ms,
+        'boot_seconds': {
+            'min': round(min(samples), 4),
+            'median': round(statistics.median(samples), 4),
+            'max': round(max(samples), 4),
+        },
+    }
+    print(f"{args.module} ({results['root']}): {args.runs} runs, {args.chats} chats, API latency {args.latency_ms:.0f}ms")
+    print(f"boot time: min {min(samples):.3f}s  median {statistics.median(samples):.3f}s  max {max(samples):.3f}s")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+"""
+Mock Telegram Bot API - بديل محلي لـ api.telegram.org للاختبار والقياس
+يكفي توجيه التطبيق إليه: TELEGRAM_API_BASE_URL=http://127.0.0.1:8081
+(telegram_bot.send_message و probe_chat و app.send_telegram كلها تمر عبر TelegramClient)
+
+- sendMessage / editMessageText / getChat / getMe بردود بنفس شكل Bot API
+  (كل رسالة تحفظ reply_to من reply_parameters وعدد مرات تعديلها)
+- زمن استجابة ثابت قابل للضبط (محاكاة الشبكة)
+- أعطال بنسب لكل مجموعة (FaultPlan): 429 مع retry_after، طرد البوت، chat not found،
+  رد بطيء، مهلة بدون رد، قطع الاتصال (RST) - عشوائية بـ seed ثابت لكل مجموعة لنتائج قابلة للتكرار
+- كل رسالة تُسجل مع وقت وصولها (time.time()) لقياس زمن التسليم من طرف إلى طرف:
+  GET /_mock/messages  → الرسائل المسجلة + الطلبات + الأعطال
+  GET /_mock/calls     → كل طلب (method, chat_id, fault, received_at) - لفحص سلوك إعادة المحاولة
+  POST /_mock/faults   → استبدال خطة الأعطال: {"rates": {"-1001": {"rate_limit": 0.2}}, "script": {"-1002": ["kicked"]}}
+  POST /_mock/reset    → مسح السجل
+
+    python benchmarks/mock_telegram.py --port 8081 --latency-ms 50
+    python benchmarks/mock_telegram.py --fault '*:rate_limit=0.1' --fault=-1002:kicked=1 --retry-after 2
+"""
+import argparse
+import json
+import random
+import re
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_METHOD_PATH = re.compile(r'^/bot[^/]+/(\w+)$')
+
+# 'ok' في script = طلب بدون عطل
+FAULTS = ('rate_limit', 'kicked', 'not_found', 'slow', 'timeout', 'reset')
+
+# الأعطال التي يرد عليها Bot API بخطأ JSON (نفس النصوص التي يرسلها Telegram)
+_FAULT_ERRORS = {
+    'kicked': (403, "Forbidden: bot was kicked from the supergroup chat"),
+    'not_found': (400, "Bad Request: chat not found"),
+}
+
+
+class FaultPlan:
+    """
+    خطة الأعطال لكل مجموعة
+
+    Args:
+        rates: {chat_id أو '*': {fault: احتمال}} - '*' لكل المجموعات غير المحددة
+        seed: بذرة العشوائية (مولد مستقل لكل مجموعة: ترتيب الطلبات بين المجموعات لا يغير النتيجة)
+        retry_after: ثواني retry_after في ردود 429
+        slow_delay: تأخير إضافي للرد البطيء
+        hang_delay: مدة الانتظار قبل قطع الاتصال في 'timeout' (أكبر من TELEGRAM_READ_TIMEOUT)
+    """
+
+    def __init__(self, rates: dict = None, seed: int = 0, retry_after: int = 1,
+                 slow_delay: float = 2.0, hang_delay: float = 30.0):
+        self.rates = {str(chat): dict(faults) for chat, faults in (rates or {}).items()}
+        for faults in self.rates.values():
+            unknown = set(faults) - set(FAULTS)
+            if unknown:
+                raise ValueError(f"unknown faults: {sorted(unknown)}")
+        self.seed = seed
+        self.retry_after = retry_after
+        self.slow_delay = slow_delay
+        self.hang_delay = hang_delay
+        self._scripts = {}  # chat_id → [fault, ...] تُستهلك قبل النسب العشوائية
+        self._random = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, specs: list, **kwargs) -> 'FaultPlan':
+        """من سطر الأوامر: ['*:rate_limit=0.1,slow=0.05', '-1002:kicked=1']"""
+        rates = {}
+        for spec in specs or ():
+            chat, _, items = spec.rpartition(':')
+            faults = rates.setdefault(chat or '*', {})
+            for item in items.split(','):
+                name, _, rate = item.partition('=')
+                faults[name.strip()] = float(rate or 1)
+        return cls(rates, **kwargs)
+
+    def script(self, chat_id, *faults):
+        """أعطال محددة لأول طلبات المجموعة بالترتيب (مثلاً 'rate_limit', 'rate_limit', 'ok')"""
+        unknown = set(faults) - set(FAULTS) - {'ok'}
+        if unknown:
+            raise ValueError(f"unknown faults: {sorted(unknown)}")
+        with self._lock:
+            self._scripts.setdefault(str(chat_id), []).extend(faults)
+
+    def choose(self, chat_id: str):
+        """العطل للطلب التالي لهذه المجموعة (None = رد طبيعي)"""
+        chat_id = str(chat_id)
+        with self._lock:
+            script = self._scripts.get(chat_id)
+            if script:
+                fault = script.pop(0)
+                return None if fault == 'ok' else fault
+            rates = self.rates.get(chat_id, self.rates.get('*'))
+            if not rates:
+                return None
+            rng = self._random.get(chat_id)
+            if rng is None:
+                rng = self._random[chat_id] = random.Random(f"{self.seed}:{chat_id}")
+            roll = rng.random()
+        for fault, rate in rates.items():
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+
+class MockTelegram:
+    """
+    Args:
+        host, port: عنوان الاستماع (port=0 = منفذ عشوائي)
+        latency: ثواني قبل كل رد
+        faults: خطة الأعطال (None = كل الطلبات تنجح)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, faults: FaultPlan = None):
+        self.latency = latency
+        self.faults = faults or FaultPlan()
+        self._lock = threading.Lock()
+        self._messages = []  # {chat_id, text, received_at, message_id, reply_to, edits}
+        self._by_id = {}  # (chat_id, message_id) → الرسالة (لـ editMessageText)
+        self._calls = []  # {method, chat_id, fault, received_at}
+        self._next_message_id = 1
+        self.requests = {}  # method → عدد الطلبات
+        self.injected = {}  # fault → عدد المرات
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockTelegram':
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-telegram", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def messages(self) -> list:
+        with self._lock:
+            return list(self._messages)
+
+    def calls(self) -> list:
+        with self._lock:
+            return list(self._calls)
+
+    def reset(self):
+        with self._lock:
+            self._messages.clear()
+            self._by_id.clear()
+            self._calls.clear()
+            self.requests.clear()
+            self.injected.clear()
+
+    def record_call(self, method: str, chat_id: str) -> str:
+        """تسجيل الطلب واختيار العطل (getMe بدون chat_id لا يتأثر بالأعطال)"""
+        fault = self.faults.choose(chat_id) if chat_id else None
+        with self._lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            if fault:
+                self.injected[fault] = self.injected.get(fault, 0) + 1
+            self._calls.append({'method': method, 'chat_id': chat_id, 'fault': fault, 'received_at': time.time()})
+        return fault
+
+    def error(self, fault: str) -> tuple:
+        """رد Bot API لعطل بخطأ JSON"""
+        if fault == 'rate_limit':
+            retry_after = self.faults.retry_after
+            return 429, {"ok": False, "error_code": 429,
+                         "description": f"Too Many Requests: retry after {retry_after}",
+                         "parameters": {"retry_after": retry_after}}
+        status, description = _FAULT_ERRORS[fault]
+        return status, {"ok": False, "error_code": status, "description": description}
+
+    def handle(self, method: str, params: dict) -> tuple:
+        """
+        رد Bot API لطلب واحد
+
+        Returns:
+            (HTTP status, JSON body dict)
+        """
+        chat_id = str(params.get('chat_id', ''))
+        if method == 'sendMessage':
+            reply_to = (params.get('reply_parameters') or {}).get('message_id')
+            with self._lock:
+                message_id = self._next_message_id
+                self._next_message_id += 1
+                message = {
+                    'chat_id': chat_id,
+                    'text': params.get('text', ''),
+                    'received_at': time.time(),
+                    'message_id': message_id,
+                    'reply_to': reply_to,
+                    'edits': 0,
+                }
+                self._messages.append(message)
+                self._by_id[(chat_id, message_id)] = message
+            return 200, {"ok": True, "result": {
+                "message_id": message_id, "date": int(time.time()),
+                "chat": {"id": int(chat_id) if chat_id.lstrip('-').isdigit() else chat_id},
+                "text": params.get('text', ''),
+            }}
+        if method == 'editMessageText':
+            with self._lock:
+                message = self._by_id.get((chat_id, params.get('message_id')))
+                if message is not None and message['text'] != params.get('text', ''):
+                    message['text'] = params.get('text', '')
+                    message['edits'] += 1
+                    return 200, {"ok": True, "result": {
+                        "message_id": message['message_id'], "date": int(message['received_at']),
+                        "edit_date": int(time.time()), "text": message['text'],
+                    }}
+            description = ("Bad Request: message to edit not found" if message is None else
+                           "Bad Request: message is not modified")
+            return 400, {"ok": False, "error_code": 400, "description": description}
+        if method == 'getChat':
+            return 200, {"ok": True, "result": {"id": chat_id, "type": "supergroup", "title": f"mock {chat_id}"}}
+        if method == 'getMe':
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "username": "mock_bot"}}
+        return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive مثل api.telegram.org
+            disable_nagle_algorithm = True  # بدونها: الرأس والجسم في كتابتين + delayed ACK = ~40ms إضافية لكل رد
+
+            def _send(self, status: int, payload: dict):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _reset(self):
+                """قطع الاتصال بـ RST بدون رد (SO_LINGER=0)"""
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                self.connection.close()
+                self.close_connection = True
+
+            def _params(self) -> dict:
+                url = urlsplit(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    raw = self.rfile.read(length)
+                    if 'json' in (self.headers.get('Content-Type') or ''):
+                        params.update(json.loads(raw or b'{}'))
+                    else:
+                        params.update({k: v[-1] for k, v in parse_qs(raw.decode('utf-8')).items()})
+                return params
+
+            def _dispatch(self):
+                path = urlsplit(self.path).path
+                params = self._params()
+                if path == '/_mock/messages':
+                    return self._send(200, {"messages": mock.messages(), "requests": dict(mock.requests),
+                                            "faults": dict(mock.injected)})
+                if path == '/_mock/calls':
+                    return self._send(200, {"calls": mock.calls()})
+                if path == '/_mock/faults':
+                    try:
+                        plan = FaultPlan(params.get('rates'), **{k: params[k] for k in (
+                            'seed', 'retry_after', 'slow_delay', 'hang_delay') if k in params})
+                        for chat_id, faults in (params.get('script') or {}).items():
+                            plan.script(chat_id, *faults)
+                    except (TypeError, ValueError) as e:
+                        return self._send(400, {"ok": False, "description": str(e)})
+                    mock.faults = plan
+                    return self._send(200, {"ok": True})
+                if path == '/_mock/reset':
+                    mock.reset()
+                    return self._send(200, {"ok": True})
+                match = _METHOD_PATH.match(path)
+                if not match:
+                    return self._send(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                method = match.group(1)
+                fault = mock.record_call(method, str(params.get('chat_id', '')))
+                if mock.latency:
+                    time.sleep(mock.latency)
+                if fault == 'timeout':
+                    time.sleep(mock.faults.hang_delay)
+                if fault in ('timeout', 'reset'):
+                    return self._reset()
+                if fault == 'slow':
+                    time.sleep(mock.faults.slow_delay)
+                elif fault:
+                    return self._send(*mock.error(fault))
+                status, payload = mock.handle(method, params)
+                self._send(status, payload)
+
+            do_GET = do_POST = _dispatch
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    """خيارات الأعطال المشتركة بين mock_telegram.py و bench_load.py"""
+    parser.add_argument('--fault', action='append', default=[], metavar='CHAT:FAULT=RATE,...',
+                        help=f"نسب الأعطال لمجموعة أو '*' للكل ({', '.join(FAULTS)}) - لمعرفات سالبة: --fault=-1001:kicked=1")
+    parser.add_argument('--fault-seed', type=int, default=0)
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after في ردود 429")
+    parser.add_argument('--slow-ms', type=float, default=2000, help="تأخير الرد البطيء")
+    parser.add_argument('--hang-ms', type=float, default=30000, help="مدة التعليق قبل قطع الاتصال في timeout")
+
+
+def fault_plan(args) -> FaultPlan:
+    return FaultPlan.parse(args.fault, seed=args.fault_seed, retry_after=args.retry_after,
+                           slow_delay=args.slow_ms / 1000.0, hang_delay=args.hang_ms / 1000.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mock Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    mock = MockTelegram(args.host, args.port, args.latency_ms / 1000.0, faults=fault_plan(args)).start()
+    print(f"mock Telegram API on {mock.url} (TELEGRAM_API_BASE_URL={mock.url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == '__main__':
+    main()
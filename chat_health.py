@@ -0,0 +1,142 @@
+"""
+Chat Health Registry - سجل حالة البوت في المجموعات
+كاش بمدة صلاحية (TTL) لنتائج getChat + قاطع دائرة (circuit breaker) للمجموعات التي طُرد منها البوت
+مسار الإرسال لا يقوم بأي طلب HTTP إضافي: الفحوصات تتم في الخلفية فقط
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+STATUS_UNKNOWN = 'unknown'
+STATUS_OK = 'ok'
+STATUS_KICKED = 'kicked'
+
+
+class ChatHealthRegistry:
+    """
+    Args:
+        probe_fn: دالة الفحص (chat_id) -> (status, error)؛ status = 'ok' أو 'kicked' أو None عند فشل الشبكة
+        ttl: مدة صلاحية نتيجة الفحص بالثواني
+        backoff_base: أول مهلة قبل إعادة فحص مجموعة محظورة
+        backoff_max: الحد الأقصى للمهلة (تتضاعف مع كل فشل)
+    """
+
+    def __init__(self, probe_fn, ttl: float = 600, backoff_base: float = 60, backoff_max: float = 3600):
+        self._probe_fn = probe_fn
+        self._ttl = ttl
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._chats = {}
+        self._probing = set()
+        self._lock = threading.Lock()
+
+    def _entry(self, chat_id: str) -> dict:
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = {
+                'status': STATUS_UNKNOWN,
+                'checked_at': 0.0,
+                'failures': 0,
+                'next_probe_at': 0.0,
+                'error': None,
+            }
+            self._chats[chat_id] = entry
+        return entry
+
+    def is_sendable(self, chat_id: str) -> bool:
+        """
+        هل يمكن الإرسال إلى المجموعة؟ (من الكاش فقط - بدون HTTP)
+        المجموعات غير المعروفة أو المنتهية الصلاحية يُسمح بها ويتم فحصها في الخلفية
+        """
+        chat_id_str = str(chat_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entry(chat_id_str)
+            if entry['status'] == STATUS_KICKED:
+                # الدائرة مفتوحة: لا إرسال حتى ينجح فحص لاحق
+                if now >= entry['next_probe_at']:
+                    self._schedule_probe(chat_id_str)
+                return False
+            if now - entry['checked_at'] > self._ttl:
+                self._schedule_probe(chat_id_str)
+            return True
+
+    def record_success(self, chat_id: str):
+        """تسجيل إرسال ناجح (يغلق الدائرة ويجدد الصلاحية)"""
+        chat_id_str = str(chat_id)
+        with self._lock:
+            entry = self._entry(chat_id_str)
+            if entry['status'] == STATUS_KICKED:
+                logger.info(f"✅ البوت تم إضافته مرة أخرى إلى {chat_id_str}")
+            entry.update(status=STATUS_OK, checked_at=time.time(), failures=0, next_probe_at=0.0, error=None)
+
+    def record_kicked(self, chat_id: str, error: str = None):
+        """تسجيل أن البوت غير موجود في المجموعة (يفتح الدائرة مع مهلة متضاعفة)"""
+        chat_id_str = str(chat_id)
+        with self._lock:
+            entry = self._entry(chat_id_str)
+            now = time.time()
+            entry['failures'] += 1
+            backoff = min(self._backoff_base * (2 ** (entry['failures'] - 1)), self._backoff_max)
+            entry.update(status=STATUS_KICKED, checked_at=now, next_probe_at=now + backoff, error=error)
+        logger.error(f"❌ البوت غير موجود في المجموعة {chat_id_str}: {error} (إعادة الفحص بعد {backoff:.0f} ثانية)")
+
+    def _schedule_probe(self, chat_id: str):
+        """تشغيل فحص في الخلفية (فحص واحد فقط لكل مجموعة في نفس الوقت) - يُستدعى تحت القفل"""
+        if chat_id in self._probing:
+            return
+        self._probing.add(chat_id)
+        threading.Thread(target=self._probe, args=(chat_id,), name=f"chat-probe-{chat_id}", daemon=True).start()
+
+    def _probe(self, chat_id: str):
+        try:
+            status, error = self._probe_fn(chat_id)
+            if status == STATUS_OK:
+                self.record_success(chat_id)
+            elif status == STATUS_KICKED:
+                self.record_kicked(chat_id, error)
+            else:
+                # فشل الشبكة: لا نغير الحالة، فقط نؤجل الفحص التالي
+                with self._lock:
+                    entry = self._entry(chat_id)
+                    entry['next_probe_at'] = time.time() + self._backoff_base
+                    if entry['status'] != STATUS_KICKED:
+                        entry['checked_at'] = time.time() - self._ttl + self._backoff_base
+        except Exception as e:
+            logger.warning(f"⚠️ فشل التحقق من حالة البوت في {chat_id}: {e}")
+        finally:
+            with self._lock:
+                self._probing.discard(chat_id)
+
+    def preflight(self, chat_ids: list, max_workers: int = 8) -> dict:
+        """فحص جميع المجموعات بالتوازي (مرة واحدة عند بدء التشغيل)"""
+        targets = [str(c).strip() for c in chat_ids if str(c).strip()]
+        if not targets:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets))),
+                                thread_name_prefix="chat-preflight") as executor:
+            list(executor.map(self._probe, targets))
+        snapshot = self.snapshot()
+        ok = sum(1 for cid in targets if snapshot.get(cid, {}).get('status') == STATUS_OK)
+        logger.info(f"🩺 فحص المجموعات عند البدء: {ok}/{len(targets)} جاهزة")
+        return snapshot
+
+    def start_preflight(self, chat_ids: list, max_workers: int = 8) -> threading.Thread:
+        """تشغيل preflight في خيط خلفي حتى لا يتأخر بدء التشغيل"""
+        t = threading.Thread(target=self.preflight, args=(list(chat_ids), max_workers),
+                             name="chat-preflight", daemon=True)
+        t.start()
+        return t
+
+    def snapshot(self) -> dict:
+        """نسخة من حالة جميع المجموعات"""
+        with self._lock:
+            return {cid: dict(entry) for cid, entry in self._chats.items()}
+
+    def kicked_chats(self) -> set:
+        """المجموعات التي دائرتها مفتوحة حالياً"""
+        with self._lock:
+            return {cid for cid, entry in self._chats.items() if entry['status'] == STATUS_KICKED}
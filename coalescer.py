@@ -0,0 +1,196 @@
+"""
+Coalescer - دمج الإشارات المتقاربة لنفس المجموعة في رسالة واحدة (digest)
+عند إغلاق شمعة على عدة رموز تصل عشرات الإشارات في ثانية واحدة؛ بدلاً من رسالة لكل إشارة لكل مجموعة
+تُجمع رسائل كل مجموعة خلال نافذة قصيرة (COALESCE_WINDOW_MS) وتُرسل كرسالة واحدة
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SEPARATOR = "\n\n➖➖➖➖➖➖➖➖➖➖\n\n"
+TELEGRAM_MAX_LENGTH = 4096
+
+
+def build_digests(messages: list, max_length: int = TELEGRAM_MAX_LENGTH) -> list:
+    """
+    دمج الرسائل (الناتجة من format_*) في أقل عدد من الرسائل ضمن حد طول Telegram
+
+    Returns:
+        قائمة الرسائل النهائية (رسالة واحدة تُرسل كما هي بدون عنوان)
+    """
+    if len(messages) == 1:
+        return list(messages)
+
+    digests = []
+    chunk = []
+    length = 0
+    for message in messages:
+        extra = len(message) + (len(DIGEST_SEPARATOR) if chunk else 0)
+        if chunk and length + extra > max_length - 64:  # مساحة للعنوان
+            digests.append(chunk)
+            chunk, length = [], 0
+            extra = len(message)
+        chunk.append(message)
+        length += extra
+    if chunk:
+        digests.append(chunk)
+
+    result = []
+    for chunk in digests:
+        if len(chunk) == 1:
+            result.append(chunk[0])
+        else:
+            result.append(f"📦 <b>{len(chunk)} إشارات</b>\n\n" + DIGEST_SEPARATOR.join(chunk))
+    return result
+
+
+class Coalescer:
+    """
+    Args:
+        send_fn: دالة الإرسال (message, chat_ids) -> dict بنفس شكل send_message_to_all_groups (أو Future بنفس النتيجة)
+        window_ms: مدة تجميع الرسائل لكل مجموعة من أول رسالة
+        max_messages: إرسال فوري عند وصول هذا العدد من الرسائل لنفس المجموعة
+    """
+
+    def __init__(self, send_fn, window_ms: float, max_messages: int = 20):
+        self._send_fn = send_fn
+        self._window = window_ms / 1000.0
+        self._max_messages = max(1, max_messages)
+        self._cond = threading.Condition()
+        self._pending = {}  # chat_id → (deadline, [messages])
+        self._deadlines = []  # heap (deadline, chat_id)
+        self._submitted = 0
+        self._sent = 0
+        self._sending = False
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        """تشغيل خيط الإرسال عند أول استخدام (داخل كل worker بعد fork)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._cond:
+            if self._pid == pid:
+                return
+            self._pending.clear()
+            self._deadlines = []
+            self._thread = threading.Thread(target=self._run, name="coalescer", daemon=True)
+            self._thread.start()
+            self._pid = pid
+            logger.info(f"📦 تم تشغيل دمج الرسائل (نافذة {self._window * 1000:.0f}ms)")
+
+    def submit(self, message: str, chat_ids: list) -> int:
+        """
+        إضافة رسالة لكل مجموعة - تُرسل بعد انتهاء نافذة المجموعة
+
+        Returns:
+            عدد المجموعات
+        """
+        self._ensure_started()
+        now = time.monotonic()
+        with self._cond:
+            for chat_id in chat_ids:
+                chat_id = str(chat_id)
+                entry = self._pending.get(chat_id)
+                if entry is None:
+                    entry = (now + self._window, [])
+                    self._pending[chat_id] = entry
+                    heapq.heappush(self._deadlines, (entry[0], chat_id))
+                entry[1].append(message)
+                if len(entry[1]) >= self._max_messages and entry[0] > now:
+                    self._pending[chat_id] = (now, entry[1])
+                    heapq.heappush(self._deadlines, (now, chat_id))
+            self._submitted += len(chat_ids)
+            self._cond.notify()
+        return len(chat_ids)
+
+    def _take_due(self) -> dict:
+        """انتظار أول نافذة منتهية وإخراج كل المجموعات الجاهزة: {tuple(messages): [chat_ids]}"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._deadlines and self._deadlines[0][0] <= now:
+                    break
+                timeout = self._deadlines[0][0] - now if self._deadlines else None
+                self._cond.wait(timeout)
+
+            groups = {}
+            self._sending = True
+            while self._deadlines and self._deadlines[0][0] <= now:
+                deadline, chat_id = heapq.heappop(self._deadlines)
+                entry = self._pending.get(chat_id)
+                # عنصر قديم (المجموعة أُرسلت مبكراً عند الوصول إلى max_messages)
+                if entry is None or entry[0] != deadline:
+                    continue
+                del self._pending[chat_id]
+                # المجموعات التي تلقت نفس الرسائل تُرسل معاً (fan-out واحد بنفس الجسم)
+                groups.setdefault(tuple(entry[1]), []).append(chat_id)
+            return groups
+
+    def _run(self):
+        while True:
+            groups = self._take_due()
+            for messages, chat_ids in groups.items():
+                for digest in build_digests(list(messages)):
+                    try:
+                        result = self._send_fn(digest, chat_ids)
+                        if isinstance(result, Future):
+                            result.add_done_callback(partial(self._log_sent, len(messages)))
+                        else:
+                            self._log_sent(len(messages), result)
+                    except Exception as e:
+                        logger.error(f"❌ خطأ في إرسال الرسالة المدمجة: {e}", exc_info=True)
+                    with self._cond:
+                        self._sent += len(chat_ids)
+            with self._cond:
+                self._sending = False
+                self._cond.notify_all()
+
+    @staticmethod
+    def _log_sent(count: int, result):
+        try:
+            if isinstance(result, Future):
+                result = result.result()
+            logger.info(f"📦 تم إرسال {count} إشارة كرسالة مدمجة ({result['success']}/{result['total']} مجموعة)")
+        except Exception as e:
+            logger.error(f"❌ خطأ في إرسال الرسالة المدمجة: {e}", exc_info=True)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        إرسال كل الرسائل المنتظرة فوراً بدون انتظار نوافذها (عند الإيقاف)
+
+        Returns:
+            False إذا انتهت المهلة قبل اكتمال الإرسال
+        """
+        if self._pid != os.getpid():
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            now = time.monotonic()
+            for chat_id, (_, messages) in list(self._pending.items()):
+                self._pending[chat_id] = (now, messages)
+                heapq.heappush(self._deadlines, (now, chat_id))
+            self._cond.notify_all()
+            while self._pending or self._sending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'window_ms': self._window * 1000,
+                'pending_chats': len(self._pending),
+                'pending_messages': sum(len(entry[1]) for entry in self._pending.values()),
+                'submitted': self._submitted,  # رسائل واردة × مجموعات
+                'sent': self._sent,  # رسائل صادرة × مجموعات
+            }
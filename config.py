@@ -41,6 +41,115 @@ WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Optional: for security
 WEBHOOK_PORT = int(os.getenv('PORT', 5000))
 WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # URL للبوت (اختياري)
 
+# Telegram API Client Configuration
+# عنوان الـ API (يمكن توجيهه إلى خادم محلي للاختبار)، حجم مجمع الاتصالات، والمهلات (اتصال، قراءة)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org')
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', 16))
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', 3.05))
+TELEGRAM_READ_TIMEOUT = float(os.getenv('TELEGRAM_READ_TIMEOUT', 10))
+
+# Delivery Configuration
+# sync: الإرسال داخل طلب الـ webhook (السلوك القديم)
+# async: وضع الرسالة في طابور والرد فوراً بـ 202 مع delivery_id
+DELIVERY_MODE = os.getenv('DELIVERY_MODE', 'sync').lower()
+DELIVERY_QUEUE_SIZE = int(os.getenv('DELIVERY_QUEUE_SIZE', 1000))
+# خيوط نقل الرسائل من الطابور إلى مسارات المجموعات (1 = الترتيب بين الرسائل مضمون؛ الإرسال نفسه في FANOUT_MAX_WORKERS)
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', 1))
+# سجل حالة الإرسال (GET /deliveries/<id>) مشترك بين workers في SQLite، ومدة الاحتفاظ به بالثواني
+# (فارغ = داخل كل worker فقط: يعمل مع gunicorn -w 1 فقط)
+DELIVERY_DB_FILE = os.getenv('DELIVERY_DB_FILE', 'deliveries.db')
+DELIVERY_HISTORY_TTL = float(os.getenv('DELIVERY_HISTORY_TTL', 86400))
+
+# Fan-out Configuration
+# مسار FIFO لكل مجموعة: عدد الخيوط المشتركة القصوى (= مجموعات يُرسل إليها في نفس اللحظة)
+FANOUT_MAX_WORKERS = int(os.getenv('FANOUT_MAX_WORKERS', 8))
+
+# Rate Limiting Configuration (token bucket)
+# الحد العام لـ Telegram: ~30 رسالة/ثانية لكل البوت
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+TELEGRAM_GLOBAL_BURST = float(os.getenv('TELEGRAM_GLOBAL_BURST', 30))
+# حد كل مجموعة: ~20 رسالة/دقيقة، والمحادثات الخاصة ~60 رسالة/دقيقة
+TELEGRAM_GROUP_RATE_PER_MIN = float(os.getenv('TELEGRAM_GROUP_RATE_PER_MIN', 20))
+TELEGRAM_PRIVATE_RATE_PER_MIN = float(os.getenv('TELEGRAM_PRIVATE_RATE_PER_MIN', 60))
+TELEGRAM_CHAT_BURST = float(os.getenv('TELEGRAM_CHAT_BURST', 3))
+
+# Coalescing Configuration
+# نافذة دمج الإشارات لنفس المجموعة في رسالة واحدة بالملي ثانية (0 = معطل)، والإرسال فوراً عند بلوغ الحد الأقصى للرسائل
+COALESCE_WINDOW_MS = float(os.getenv('COALESCE_WINDOW_MS', 0))
+COALESCE_MAX_MESSAGES = int(os.getenv('COALESCE_MAX_MESSAGES', 20))
+
+# Bulk Webhook Configuration
+# الحد الأقصى لعدد الإشارات في طلب /webhook/bulk واحد
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', 500))
+
+# Chat Health Configuration
+# مدة صلاحية نتيجة فحص getChat، ومهلة إعادة فحص المجموعات التي طُرد منها البوت (تتضاعف حتى الحد الأقصى)
+CHAT_HEALTH_TTL = float(os.getenv('CHAT_HEALTH_TTL', 600))
+CHAT_HEALTH_BACKOFF_BASE = float(os.getenv('CHAT_HEALTH_BACKOFF_BASE', 60))
+CHAT_HEALTH_BACKOFF_MAX = float(os.getenv('CHAT_HEALTH_BACKOFF_MAX', 3600))
+CHAT_HEALTH_PREFLIGHT = os.getenv('CHAT_HEALTH_PREFLIGHT', 'True').lower() == 'true'
+
+# Outbox Configuration
+# سجل دائم لكل (رسالة، مجموعة) قبل الإرسال: إعادة المحاولة في الخلفية وبعد إعادة التشغيل
+OUTBOX_ENABLED = os.getenv('OUTBOX_ENABLED', 'True').lower() == 'true'
+OUTBOX_DB_FILE = os.getenv('OUTBOX_DB_FILE', 'outbox.db')
+OUTBOX_MAX_AGE = float(os.getenv('OUTBOX_MAX_AGE', 600))  # الرسائل الأقدم لا تُرسل
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', 2))
+OUTBOX_RETRY_MAX = float(os.getenv('OUTBOX_RETRY_MAX', 120))
+OUTBOX_LEASE = float(os.getenv('OUTBOX_LEASE', 120))  # بعدها يعيد worker آخر إرسال رسالة worker متوقف
+# مهلة الإرسالات الجارية عند SIGTERM (أقل من graceful_timeout في gunicorn = 30)
+OUTBOX_DRAIN_TIMEOUT = float(os.getenv('OUTBOX_DRAIN_TIMEOUT', 20))
+
+# Message Threading Configuration
+# أحداث الصفقة (TP1/TP2/TP3/SL) في كل مجموعة: off = رسالة جديدة، reply = رد على بطاقة الدخول،
+# edit = تعديل بطاقة الدخول نفسها (editMessageText - بدون رسالة جديدة)
+MESSAGE_THREAD_MODE = os.getenv('MESSAGE_THREAD_MODE', 'off').lower()
+# وضع مجموعات معينة، مثال: MESSAGE_THREAD_CHATS=-1001234567890=edit,-1009876543210=reply
+MESSAGE_THREAD_CHATS = {
+    chat_id.strip(): mode.strip().lower()
+    for chat_id, _, mode in (item.rpartition('=') for item in os.getenv('MESSAGE_THREAD_CHATS', '').split(','))
+    if chat_id.strip() and mode.strip()
+}
+# جدول (صفقة، مجموعة) → message_id لبطاقة الدخول، ومدة الاحتفاظ به بالأيام
+MESSAGE_THREADS_DB_FILE = os.getenv('MESSAGE_THREADS_DB_FILE', 'message_threads.db')
+MESSAGE_THREADS_TTL_DAYS = float(os.getenv('MESSAGE_THREADS_TTL_DAYS', 30))
+
+# Startup Configuration
+# رسالة بدء التشغيل: مرة واحدة لكل نشر (deployment) من worker واحد فقط (قفل ملف مشترك بين workers)
+STARTUP_ANNOUNCE = os.getenv('STARTUP_ANNOUNCE', 'True').lower() == 'true'
+STARTUP_LOCK_FILE = os.getenv('STARTUP_LOCK_FILE', 'startup.lock')
+# معرف النشر (فارغ = عملية gunicorn الرئيسية؛ على Railway يُستخدم RAILWAY_DEPLOYMENT_ID تلقائياً)
+STARTUP_DEPLOYMENT_ID = os.getenv('STARTUP_DEPLOYMENT_ID') or os.getenv('RAILWAY_DEPLOYMENT_ID', '')
+
+# Dedup Configuration
+# نافذة منع تكرار الإشارة (نفس النوع + نفس الرمز): إشارات الدخول و TP/SL
+DEDUP_ENTRY_WINDOW = float(os.getenv('DEDUP_ENTRY_WINDOW', 60))
+DEDUP_EXIT_WINDOW = float(os.getenv('DEDUP_EXIT_WINDOW', 30))
+# تجاوز النافذة لأنواع معينة، مثال: DEDUP_WINDOWS=SL=45,TP1_HIT=10 (0 = بدون منع تكرار)
+DEDUP_WINDOWS = {
+    name.strip().upper(): float(value)
+    for name, _, value in (item.partition('=') for item in os.getenv('DEDUP_WINDOWS', '').split(','))
+    if name.strip() and value.strip()
+}
+# الحد الأقصى لعدد المفاتيح المحفوظة في الذاكرة
+DEDUP_CAPACITY = int(os.getenv('DEDUP_CAPACITY', 10000))
+# backend: memory (لكل worker) أو sqlite (مشترك بين كل workers على نفس الجهاز - يُفضل مسار على /dev/shm)
+DEDUP_BACKEND = os.getenv('DEDUP_BACKEND', 'memory').lower()
+DEDUP_DB_FILE = os.getenv('DEDUP_DB_FILE', 'dedup.db')
+
+# Trade Storage Configuration
+# backend التخزين: journal (سجل JSONL إلحاقي) أو sqlite (قاعدة مفهرسة)
+TRADE_STORE_BACKEND = os.getenv('TRADE_STORE_BACKEND', 'journal').lower()
+TRADES_DB_FILE = os.getenv('TRADES_DB_FILE', 'trades.db')
+# سجل الصفقات الإلحاقي (JSONL)، fsync بعد كل دفعة، والحد الأدنى للأسطر قبل الضغط في الخلفية
+TRADES_JOURNAL_FILE = os.getenv('TRADES_JOURNAL_FILE', 'trades.jsonl')
+TRADES_JOURNAL_FSYNC = os.getenv('TRADES_JOURNAL_FSYNC', 'True').lower() == 'true'
+TRADES_COMPACT_MIN_EVENTS = int(os.getenv('TRADES_COMPACT_MIN_EVENTS', 1000))
+# صفحات /trades: الحد الأقصى لـ limit، وعدد الصفقات التي تُقرأ في كل دفعة عند البث (streaming)
+TRADES_PAGE_MAX_LIMIT = int(os.getenv('TRADES_PAGE_MAX_LIMIT', 1000))
+TRADES_STREAM_BATCH = int(os.getenv('TRADES_STREAM_BATCH', 200))
+
 # Flask Configuration
 FLASK_ENV = os.getenv('FLASK_ENV', 'production')
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
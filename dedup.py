@@ -0,0 +1,187 @@
+"""
+Dedup - منع تكرار الإشارات بنافذة زمنية لكل نوع إشارة
+memory: heap مرتب حسب وقت الانتهاء + dict للبحث: كل فحص بتكلفة O(1) تقريباً (بدلاً من المرور على كل المفاتيح)
+        مع حد أقصى لعدد المفاتيح حتى لا تنمو الذاكرة مع كل رمز/إشارة جديدة
+sqlite: جدول مشترك بين كل workers على نفس الجهاز (gunicorn -w N) - الفحص والتسجيل في عبارة واحدة ذرية
+"""
+import heapq
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from signals import SignalSpec
+
+logger = logging.getLogger(__name__)
+
+
+class DedupStore:
+    """الواجهة المشتركة لجميع backends (يمكن إضافة backend شبكي مثل Redis لاحقاً بنفس الواجهة)"""
+
+    def check(self, key: str, window: float):
+        """
+        فحص المفتاح وتسجيله إذا لم يكن مكرراً - عملية واحدة ذرية
+
+        Returns:
+            عمر التسجيل السابق بالثواني إذا كان مكرراً (ضمن النافذة)، وإلا None
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemoryDedupStore(DedupStore):
+    """
+    مفاتيح تنتهي صلاحيتها تلقائياً (داخل العملية فقط)
+
+    Args:
+        capacity: الحد الأقصى لعدد المفاتيح - عند تجاوزه يُحذف الأقرب للانتهاء
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = {}  # key → (seen_at, expires_at)
+        self._heap = []  # (expires_at, key) - قد يحتوي على عناصر قديمة تُتجاهل عند الإخراج
+
+    def check(self, key: str, window: float, now: float = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return now - entry[0]
+
+            expires_at = now + window
+            self._entries[key] = (now, expires_at)
+            heapq.heappush(self._heap, (expires_at, key))
+            while len(self._entries) > self.capacity:
+                self._pop()
+            # العناصر القديمة في الـ heap (مفتاح أُعيد تسجيله بنافذة أقصر) لا يجب أن تتراكم
+            if len(self._heap) > 2 * self.capacity:
+                self._heap = [(exp, k) for k, (_, exp) in self._entries.items()]
+                heapq.heapify(self._heap)
+            return None
+
+    def _expire(self, now: float):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            self._pop()
+
+    def _pop(self):
+        expires_at, key = heapq.heappop(self._heap)
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] == expires_at:
+            del self._entries[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteDedupStore(DedupStore):
+    """
+    مفاتيح مشتركة بين العمليات عبر ملف SQLite (يُفضل على tmpfs مثل /dev/shm)
+    بدون fsync (synchronous=OFF): فقدان المفاتيح عند إعادة تشغيل الجهاز لا يهم لنافذة بالثواني
+
+    Args:
+        path: ملف القاعدة
+        cleanup_interval: حذف المفاتيح المنتهية كل N ثانية (الجدول محدود بـ معدل الإشارات × النافذة)
+    """
+
+    _SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS dedup (
+            key TEXT PRIMARY KEY,
+            seen_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_dedup_expires_at ON dedup (expires_at)",
+    )
+
+    # إدخال جديد، أو استبدال مفتاح انتهت نافذته - وإلا لا يتغير شيء (= مكرر)
+    _CHECK = (
+        "INSERT INTO dedup (key, seen_at, expires_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET seen_at = excluded.seen_at, expires_at = excluded.expires_at "
+        "WHERE dedup.expires_at <= excluded.seen_at"
+    )
+
+    def __init__(self, path: str, cleanup_interval: float = 60):
+        self.path = path
+        self.cleanup_interval = cleanup_interval
+        self._local = threading.local()
+        self._next_cleanup = 0.0
+        conn = self._conn()
+        for statement in self._SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        """اتصال لكل خيط (ويُنشأ من جديد داخل كل worker بعد fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def check(self, key: str, window: float, now: float = None):
+        now = time.time() if now is None else now
+        conn = self._conn()
+        try:
+            before = conn.total_changes
+            conn.execute(self._CHECK, (key, now, now + window))
+            if conn.total_changes != before:
+                if now >= self._next_cleanup:
+                    self._cleanup(conn, now)
+                return None
+            row = conn.execute("SELECT seen_at FROM dedup WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            # لا نوقف الإرسال بسبب منع التكرار
+            logger.error(f"❌ خطأ في قاعدة منع التكرار: {e}")
+            return None
+        return now - row[0] if row else 0.0
+
+    def _cleanup(self, conn: sqlite3.Connection, now: float):
+        self._next_cleanup = now + self.cleanup_interval
+        conn.execute("DELETE FROM dedup WHERE expires_at <= ?", (now,))
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM dedup").fetchone()[0]
+
+
+def create_dedup_store(backend: str, capacity: int = 10000, db_path: str = 'dedup.db') -> DedupStore:
+    """إنشاء backend حسب الإعدادات (DEDUP_BACKEND)"""
+    backend = (backend or 'memory').lower()
+    if backend == 'sqlite':
+        logger.info(f"🧹 منع التكرار: SQLite مشترك بين workers ({db_path})")
+        return SQLiteDedupStore(db_path)
+    if backend != 'memory':
+        logger.warning(f"⚠️ Backend غير معروف لمنع التكرار: {backend} - سيتم استخدام memory")
+    return MemoryDedupStore(capacity=capacity)
+
+
+class SignalDeduplicator:
+    """
+    منع تكرار نفس نوع الإشارة لنفس الرمز - النافذة من سجل الإشارات (SignalSpec.dedup_window)
+    الأسماء البديلة لنفس النوع (TP1 و TP1_HIT) تُعتبر نفس الإشارة
+    """
+
+    def __init__(self, store: DedupStore, registry):
+        self.store = store
+        self.registry = registry
+
+    def check(self, signal, symbol: str):
+        """
+        Args:
+            signal: اسم الإشارة أو SignalSpec
+
+        Returns:
+            الثواني منذ آخر إشارة مماثلة إذا كانت مكررة، وإلا None
+        """
+        spec = signal if isinstance(signal, SignalSpec) else self.registry.resolve(signal)
+        if spec is None or not spec.dedup_window:
+            return None
+        return self.store.check(f"{spec.name}_{symbol}", spec.dedup_window)
@@ -0,0 +1,145 @@
+"""
+Delivery Lanes - مسار FIFO لكل مجموعة فوق مجمع خيوط مشترك
+الرسائل لنفس المجموعة تُرسل بالترتيب وواحدة تلو الأخرى (الدخول قبل TP1 قبل TP2)،
+والمجموعات المختلفة تتقدم بشكل مستقل: مجموعة بطيئة أو تحت rate limit لا توقف البقية
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ChatLanes:
+    """
+    Args:
+        max_workers: عدد الخيوط المشتركة (= أقصى عدد مجموعات يُرسل إليها في نفس اللحظة)
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self._max_workers = max(1, max_workers)
+        self._lock = threading.Lock()
+        self._lanes = {}  # chat_id → deque[(enqueued_at, future, fn, args)] - الأول هو الجاري إرساله
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """مجمع الخيوط (يُنشأ من جديد داخل كل worker بعد fork)"""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                        thread_name_prefix="lane")
+                    self._lanes = {}
+                    self._pid = pid
+        return self._executor
+
+    def submit(self, chat_id: str, fn, *args) -> Future:
+        """
+        إضافة مهمة إلى نهاية مسار المجموعة
+
+        Returns:
+            Future بنتيجة fn(*args)
+        """
+        executor = self._get_executor()
+        chat_id = str(chat_id)
+        future = Future()
+        with self._lock:
+            lane = self._lanes.get(chat_id)
+            idle = lane is None
+            if idle:
+                lane = self._lanes[chat_id] = deque()
+            lane.append((time.monotonic(), future, fn, args))
+        if idle:
+            executor.submit(self._serve, chat_id)
+        return future
+
+    def _serve(self, chat_id: str):
+        """تنفيذ أول مهمة في المسار ثم إعادة جدولة المسار خلف المسارات الأخرى (تناوب عادل)"""
+        with self._lock:
+            lane = self._lanes[chat_id]
+            _, future, fn, args = lane[0]
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+        with self._lock:
+            lane.popleft()
+            if not lane:
+                del self._lanes[chat_id]
+                return
+        self._executor.submit(self._serve, chat_id)
+
+    def stats(self) -> dict:
+        """
+        لكل مجموعة لديها رسائل: depth = المنتظرة + الجارية، lag = عمر أقدم رسالة لم تكتمل (ثواني)
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {chat_id: {'depth': len(lane), 'lag': now - lane[0][0]}
+                    for chat_id, lane in self._lanes.items()}
+
+
+class AsyncChatLanes:
+    """
+    نفس المسارات داخل حلقة asyncio (async_app.py): مهمة واحدة لكل مجموعة لديها رسائل تُرسلها بالترتيب،
+    والتوازي بين المجموعات بلا خيوط - حده مجمع اتصالات عميل HTTP. كل الاستدعاءات من خيط الحلقة فقط
+    """
+
+    def __init__(self):
+        self._lanes = {}  # chat_id → deque[(enqueued_at, future, fn, args)] - الأول هو الجاري إرساله
+        self._tasks = set()
+
+    def submit(self, chat_id: str, fn, *args) -> asyncio.Future:
+        """
+        إضافة coroutine function إلى نهاية مسار المجموعة
+
+        Returns:
+            asyncio.Future بنتيجة await fn(*args)
+        """
+        loop = asyncio.get_running_loop()
+        chat_id = str(chat_id)
+        future = loop.create_future()
+        lane = self._lanes.get(chat_id)
+        idle = lane is None
+        if idle:
+            lane = self._lanes[chat_id] = deque()
+        lane.append((time.monotonic(), future, fn, args))
+        if idle:
+            task = loop.create_task(self._serve(chat_id, lane))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return future
+
+    async def _serve(self, chat_id: str, lane: deque):
+        try:
+            while lane:
+                _, future, fn, args = lane[0]
+                if not future.cancelled():
+                    try:
+                        result = await fn(*args)
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                    else:
+                        if not future.done():
+                            future.set_result(result)
+                lane.popleft()
+        except asyncio.CancelledError:
+            for _, future, _, _ in lane:
+                future.cancel()
+            raise
+        finally:
+            del self._lanes[chat_id]
+
+    def stats(self) -> dict:
+        """نفس شكل ChatLanes.stats"""
+        now = time.monotonic()
+        return {chat_id: {'depth': len(lane), 'lag': now - lane[0][0]}
+                for chat_id, lane in self._lanes.items()}
@@ -0,0 +1,269 @@
+"""
+Delivery Queue - طابور إرسال غير متزامن للرسائل
+الـ webhook يضع الرسالة في الطابور ويرد فوراً (202)، وخيط خلفي يقوم بالإرسال
+سجل الحالة (delivery id) في SQLite مشترك بين workers: GET /deliveries/<id> يجده من أي worker وبعد إعادة التشغيل
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryRecords:
+    """سجل حالة عمليات الإرسال داخل العملية (لكل worker) - حتى history_size سجل"""
+
+    def __init__(self, history_size: int = 1000):
+        self._history_size = history_size
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, record: dict):
+        with self._lock:
+            self._records[record['id']] = record
+            while len(self._records) > self._history_size:
+                self._records.popitem(last=False)
+
+    def get(self, delivery_id: str):
+        with self._lock:
+            record = self._records.get(delivery_id)
+            return dict(record) if record else None
+
+    def update(self, delivery_id: str, **fields):
+        with self._lock:
+            record = self._records.get(delivery_id)
+            if record is not None:
+                record.update(fields)
+
+    def remove(self, delivery_id: str):
+        with self._lock:
+            self._records.pop(delivery_id, None)
+
+
+class SQLiteDeliveryRecords(DeliveryRecords):
+    """
+    سجل حالة مشترك بين العمليات عبر ملف SQLite (السجل JSON كامل لكل delivery id)
+    فقط الـ worker الذي وضع الرسالة في طابوره يحدّث سجلها
+
+    Args:
+        path: ملف القاعدة
+        ttl: ثواني الاحتفاظ بالسجل بعد وضعه في الطابور
+        cleanup_interval: حذف السجلات القديمة كل N ثانية
+    """
+
+    _SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS deliveries (
+            id TEXT PRIMARY KEY,
+            record TEXT NOT NULL,
+            queued_at REAL NOT NULL
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_deliveries_queued_at ON deliveries (queued_at)",
+    )
+
+    def __init__(self, path: str, ttl: float = 86400, cleanup_interval: float = 600):
+        self.path = path
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._local = threading.local()
+        self._next_cleanup = 0.0
+        conn = self._conn()
+        for statement in self._SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        """اتصال لكل خيط (ويُنشأ من جديد داخل كل worker بعد fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def put(self, record: dict):
+        try:
+            conn = self._conn()
+            conn.execute("INSERT OR REPLACE INTO deliveries (id, record, queued_at) VALUES (?, ?, ?)",
+                         (record['id'], json.dumps(record, ensure_ascii=False), record['queued_at']))
+            now = time.time()
+            if now >= self._next_cleanup:
+                self._next_cleanup = now + self.cleanup_interval
+                conn.execute("DELETE FROM deliveries WHERE queued_at < ?", (now - self.ttl,))
+        except sqlite3.Error as e:
+            # لا نوقف الإرسال بسبب سجل الحالة
+            logger.error(f"❌ خطأ في قاعدة سجل الإرسال: {e}")
+
+    def get(self, delivery_id: str):
+        try:
+            row = self._conn().execute("SELECT record FROM deliveries WHERE id = ?", (delivery_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"❌ خطأ في قاعدة سجل الإرسال: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def update(self, delivery_id: str, **fields):
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT record FROM deliveries WHERE id = ?", (delivery_id,)).fetchone()
+                if row is not None:
+                    record = json.loads(row[0])
+                    record.update(fields)
+                    conn.execute("UPDATE deliveries SET record = ? WHERE id = ?",
+                                 (json.dumps(record, ensure_ascii=False), delivery_id))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            # لا نوقف الإرسال بسبب سجل الحالة
+            logger.error(f"❌ خطأ في قاعدة سجل الإرسال: {e}")
+
+    def remove(self, delivery_id: str):
+        try:
+            self._conn().execute("DELETE FROM deliveries WHERE id = ?", (delivery_id,))
+        except sqlite3.Error as e:
+            logger.error(f"❌ خطأ في قاعدة سجل الإرسال: {e}")
+
+
+def create_delivery_records(db_path: str = None, history_size: int = 1000, ttl: float = 86400) -> DeliveryRecords:
+    """سجل مشترك في SQLite (DELIVERY_DB_FILE)، أو داخل العملية إذا كان المسار فارغاً (worker واحد فقط)"""
+    if db_path:
+        return SQLiteDeliveryRecords(db_path, ttl=ttl)
+    logger.warning("⚠️ سجل الإرسال داخل العملية: GET /deliveries/<id> يعمل فقط مع worker واحد (gunicorn -w 1)")
+    return DeliveryRecords(history_size)
+
+
+class DeliveryQueue:
+    """
+    طابور إرسال داخل العملية مع سجل حالة لكل عملية إرسال (delivery id)
+
+    Args:
+        send_fn: دالة الإرسال (message, chat_ids) -> dict بنفس شكل send_message_to_all_groups،
+            أو Future بنفس النتيجة (الإرسال عبر مسارات المجموعات: الخيط لا ينتظر أبطأ مجموعة)
+        maxsize: الحد الأقصى لعدد العناصر المنتظرة في الطابور
+        workers: عدد الخيوط التي تسحب من الطابور
+        records: سجل الحالة للاستعلام لاحقاً (None = داخل العملية بحد 1000 سجل)
+    """
+
+    def __init__(self, send_fn, maxsize: int = 1000, workers: int = 1, records: DeliveryRecords = None):
+        self._send_fn = send_fn
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._workers = max(1, workers)
+        self._records = records if records is not None else DeliveryRecords()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+
+    def _ensure_started(self):
+        """تشغيل الخيوط عند أول استخدام (داخل كل worker بعد fork الخاص بـ gunicorn)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._threads = []
+            for i in range(self._workers):
+                t = threading.Thread(target=self._run, name=f"delivery-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._pid = pid
+            logger.info(f"🚚 تم تشغيل محرك الإرسال ({self._workers} خيط)")
+
+    def submit(self, message: str, chat_ids: list, send_fn=None, **meta) -> str:
+        """
+        إضافة رسالة إلى الطابور
+
+        Args:
+            send_fn: دالة إرسال لهذه الرسالة فقط بدلاً من send_fn الطابور (نفس الشكل)
+
+        Returns:
+            str: delivery id للاستعلام عن الحالة لاحقاً
+
+        Raises:
+            queue.Full: إذا كان الطابور ممتلئاً
+        """
+        self._ensure_started()
+        delivery_id = uuid.uuid4().hex
+        record = {
+            'id': delivery_id,
+            'status': 'queued',  # queued, sending, delivered, partial, failed
+            'chat_ids': [str(c) for c in chat_ids],
+            'queued_at': time.time(),
+            'started_at': None,
+            'completed_at': None,
+            'result': None,
+        }
+        record.update(meta)
+        self._records.put(record)
+
+        try:
+            self._queue.put_nowait((delivery_id, message, record['chat_ids'], send_fn))
+        except queue.Full:
+            self._records.remove(delivery_id)
+            raise
+        return delivery_id
+
+    def get(self, delivery_id: str):
+        """الحصول على حالة عملية إرسال (أو None إذا لم تكن موجودة)"""
+        return self._records.get(delivery_id)
+
+    def depth(self) -> int:
+        """عدد الرسائل المنتظرة في الطابور"""
+        return self._queue.qsize()
+
+    def join(self, timeout: float = None) -> bool:
+        """انتظار إرسال كل ما في الطابور (عند الإيقاف) - False إذا انتهت المهلة أولاً"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            delivery_id, message, chat_ids, send_fn = self._queue.get()
+            try:
+                self._update(delivery_id, status='sending', started_at=time.time())
+                result = (send_fn or self._send_fn)(message, chat_ids)
+                if isinstance(result, Future):
+                    result.add_done_callback(lambda future, delivery_id=delivery_id: self._complete(delivery_id, future))
+                else:
+                    self._complete(delivery_id, result)
+            except Exception as e:
+                logger.error(f"❌ خطأ في محرك الإرسال ({delivery_id}): {e}", exc_info=True)
+                self._update(delivery_id, status='failed', error=str(e), completed_at=time.time())
+            finally:
+                self._queue.task_done()
+
+    def _complete(self, delivery_id: str, result):
+        try:
+            if isinstance(result, Future):
+                result = result.result()
+            if result['success'] == result['total'] and result['total'] > 0:
+                status = 'delivered'
+            elif result['success'] > 0:
+                status = 'partial'
+            else:
+                status = 'failed'
+            self._update(delivery_id, status=status, result=result, completed_at=time.time())
+            logger.info(f"🚚 Delivery {delivery_id}: {status} ({result['success']}/{result['total']})")
+        except Exception as e:
+            logger.error(f"❌ خطأ في محرك الإرسال ({delivery_id}): {e}", exc_info=True)
+            self._update(delivery_id, status='failed', error=str(e), completed_at=time.time())
+
+    def _update(self, delivery_id: str, **fields):
+        self._records.update(delivery_id, **fields)
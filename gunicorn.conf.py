@@ -0,0 +1,22 @@
+"""
+إعدادات gunicorn (تُقرأ تلقائياً من مجلد التشغيل)
+مهام بدء التشغيل تبدأ في الخلفية بعد تهيئة كل worker، وليس عند استيراد التطبيق
+وعند إيقاف الـ worker (SIGTERM) تُرسل الرسائل المنتظرة وتُحرر سجلات الـ outbox غير المرسلة
+"""
+import sys
+
+
+def _app_module(worker):
+    return sys.modules.get(getattr(worker.app, 'app_uri', '').split(':')[0])
+
+
+def post_worker_init(worker):
+    start = getattr(_app_module(worker), 'start_background_tasks', None)
+    if start is not None:
+        start()
+
+
+def worker_exit(server, worker):
+    stop = getattr(_app_module(worker), 'stop_background_tasks', None)
+    if stop is not None:
+        stop()
@@ -1,7 +1,7 @@
 """
 TradingView Webhook to Telegram Bot - نسخة مبسطة
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from telegram_bot import (
     send_message,
     send_message_to_all_groups,
@@ -12,14 +12,57 @@ from telegram_bot import (
     format_tp1_hit,
     format_tp2_hit,
     format_tp3_hit,
-    format_stop_loss_hit
+    format_stop_loss_hit,
+    send_startup_message,
+    command_reply,
+    rate_limiter,
+    get_outbox
+)
+from config import (
+    WEBHOOK_PORT,
+    DEBUG,
+    DELIVERY_MODE,
+    DELIVERY_QUEUE_SIZE,
+    DELIVERY_WORKERS,
+    DELIVERY_DB_FILE,
+    DELIVERY_HISTORY_TTL,
+    DEDUP_ENTRY_WINDOW,
+    DEDUP_EXIT_WINDOW,
+    DEDUP_WINDOWS,
+    DEDUP_CAPACITY,
+    DEDUP_BACKEND,
+    DEDUP_DB_FILE,
+    COALESCE_WINDOW_MS,
+    COALESCE_MAX_MESSAGES,
+    BULK_MAX_ITEMS,
+    CHAT_HEALTH_PREFLIGHT,
+    STARTUP_ANNOUNCE,
+    STARTUP_LOCK_FILE,
+    STARTUP_DEPLOYMENT_ID,
+    OUTBOX_DRAIN_TIMEOUT,
+    get_config_status
+)
+from delivery_queue import DeliveryQueue, create_delivery_records
+from payload_parser import extract_payload, parse_bulk
+from dedup import create_dedup_store, SignalDeduplicator
+from coalescer import Coalescer, build_digests
+from signals import create_registry
+from startup import StartupTasks, default_deployment_id, on_sigterm
+from metrics import (
+    REGISTRY,
+    CONTENT_TYPE,
+    WEBHOOK_STAGE_SECONDS,
+    SIGNALS_TOTAL,
+    DUPLICATES_TOTAL,
+    register_delivery_gauges
 )
-from config import WEBHOOK_PORT, DEBUG, get_config_status
 import logging
 import json
-import re
+import queue
 from datetime import datetime
 import hashlib
+import time
+from functools import partial
 
 # Configure logging
 logging.basicConfig(
@@ -31,9 +74,45 @@ logger = logging.getLogger(__name__)
 # Initialize Flask app
 app = Flask(__name__)
 
-# Simple cache to prevent duplicate messages (last 5 minutes)
-recent_messages = {}
-last_signal_time = {}  # لتتبع آخر إشارة لكل رمز
+# محرك الإرسال في الخلفية (يُستخدم عند DELIVERY_MODE=async)
+# الطابور يضع كل رسالة في مسارات المجموعات ولا ينتظر اكتمالها (مجموعة بطيئة لا توقف الرسائل التالية)
+delivery_queue = DeliveryQueue(
+    partial(send_message_to_all_groups, wait=False),
+    maxsize=DELIVERY_QUEUE_SIZE,
+    workers=DELIVERY_WORKERS,
+    records=create_delivery_records(DELIVERY_DB_FILE, ttl=DELIVERY_HISTORY_TTL)
+)
+
+# دمج الإشارات المتقاربة لنفس المجموعة في رسالة واحدة (معطل عند COALESCE_WINDOW_MS=0)
+coalescer = Coalescer(
+    partial(send_message_to_all_groups, wait=False),
+    window_ms=COALESCE_WINDOW_MS,
+    max_messages=COALESCE_MAX_MESSAGES
+) if COALESCE_WINDOW_MS > 0 else None
+# نفس الـ outbox الذي يستخدمه send_message_to_all_groups (نسخة واحدة لكل عملية)
+outbox = get_outbox()
+register_delivery_gauges(delivery_queue, coalescer, outbox)
+
+# سجل الإشارات: كل اسم بديل → النوع الموحد ودالة التنسيق ونافذة منع التكرار
+signal_registry = create_registry(
+    {
+        'BUY': format_buy_signal,
+        'SELL': format_sell_signal,
+        'BUY_REVERSE': format_buy_reverse_signal,
+        'SELL_REVERSE': format_sell_reverse_signal,
+        'TP1': format_tp1_hit,
+        'TP2': format_tp2_hit,
+        'TP3': format_tp3_hit,
+        'SL': format_stop_loss_hit,
+    },
+    entry_window=DEDUP_ENTRY_WINDOW,
+    exit_window=DEDUP_EXIT_WINDOW,
+    windows=DEDUP_WINDOWS
+)
+
+# منع التكرار: مفاتيح تنتهي صلاحيتها تلقائياً (memory: مع حد أقصى للذاكرة، sqlite: مشترك بين workers)
+dedup_store = create_dedup_store(DEDUP_BACKEND, capacity=DEDUP_CAPACITY, db_path=DEDUP_DB_FILE)
+signal_dedup = SignalDeduplicator(dedup_store, signal_registry)
 
 def get_message_key(data: dict) -> str:
     """Generate a unique key for a message to detect duplicates"""
@@ -52,52 +131,20 @@ def get_message_key(data: dict) -> str:
     return f"{signal}_{symbol}_{price_rounded}_{timestamp}"
 
 def is_recent_duplicate(message_key: str, data: dict) -> bool:
-    """Check if message was sent recently (within last 30 seconds for same signal)"""
-    current_time = datetime.now()
+    """
+    Check if message was sent recently
+    نفس الإشارة لنفس الرمز: DEDUP_ENTRY_WINDOW (60 ثانية) للدخول و DEDUP_EXIT_WINDOW (30 ثانية) لـ TP/SL
+    """
     signal = data.get('signal', '')
     symbol = data.get('symbol', '')
     
-    # تنظيف الرسائل القديمة (أكثر من 10 دقائق) لتوفير الذاكرة
-    keys_to_remove = []
-    for key, sent_time in recent_messages.items():
-        time_diff = (current_time - sent_time).total_seconds()
-        if time_diff > 600:  # 10 minutes
-            keys_to_remove.append(key)
-    for key in keys_to_remove:
-        del recent_messages[key]
-    
-    # التحقق من التكرار بناءً على نوع الإشارة
-    signal_key = f"{signal}_{symbol}"
-    
-    # للإشارات الرئيسية (BUY, SELL, etc.)، منع التكرار لمدة 60 ثانية (زيادة لتجنب spam)
-    if signal in ['BUY', 'SELL', 'BUY_REVERSE', 'SELL_REVERSE', 'LONG', 'SHORT', 'LONG_REVERSE', 'SHORT_REVERSE']:
-        if signal_key in last_signal_time:
-            last_time = last_signal_time[signal_key]
-            time_diff = (current_time - last_time).total_seconds()
-            if time_diff < 60:  # 60 seconds (زيادة من 30 لتجنب spam)
-                logger.warning(f"⚠️ تم تجاهل إشارة متكررة: {signal} لـ {symbol} (آخر إشارة قبل {time_diff:.1f} ثانية)")
-                return True
-        last_signal_time[signal_key] = current_time
+    time_diff = signal_dedup.check(signal, symbol)
+    if time_diff is not None:
+        logger.warning(f"⚠️ تم تجاهل إشارة متكررة: {signal} لـ {symbol} (آخر إشارة قبل {time_diff:.1f} ثانية)")
+        return True
     
-    # للإشارات TP/SL، منع التكرار لمدة 30 ثانية (زيادة من 15)
-    elif signal in ['TP1_HIT', 'TP2_HIT', 'TP3_HIT', 'STOP_LOSS', 'TP1', 'TP2', 'TP3', 'SL']:
-        if signal_key in last_signal_time:
-            last_time = last_signal_time[signal_key]
-            time_diff = (current_time - last_time).total_seconds()
-            if time_diff < 30:  # 30 seconds (زيادة من 15)
-                logger.warning(f"⚠️ تم تجاهل إشارة متكررة: {signal} لـ {symbol} (آخر إشارة قبل {time_diff:.1f} ثانية)")
-                return True
-        last_signal_time[signal_key] = current_time
-    
-    # التحقق من المفتاح الأساسي
-    if message_key in recent_messages:
-        last_sent = recent_messages[message_key]
-        time_diff = (current_time - last_sent).total_seconds()
-        if time_diff < 60:  # 1 minute
-            return True
-    
-    recent_messages[message_key] = current_time
-    return False
+    # التحقق من المفتاح الأساسي (1 minute)
+    return dedup_store.check(message_key, 60) is not None
 
 @app.route('/', methods=['GET'])
 def health_check():
@@ -126,58 +173,122 @@ def telegram_webhook():
         chat_id = str(chat.get('id', ''))
         
         # الرد على الأوامر
-        if text.startswith('/start'):
-            from telegram_bot import send_message
-            welcome_msg = (
-                "🤖 <b>مرحباً! أنا بوت إشارات التداول</b>\n\n"
-                "✅ البوت يعمل بشكل صحيح\n"
-                "📊 سأرسل إشارات التداول من TradingView تلقائياً\n\n"
-                "💡 <b>الأوامر المتاحة:</b>\n"
-                "/start - عرض هذه الرسالة\n"
-                "/help - عرض المساعدة\n"
-                "/status - حالة البوت"
-            )
-            send_message(welcome_msg, chat_id)
-            return jsonify({"status": "ok"}), 200
-        
-        elif text.startswith('/help'):
-            from telegram_bot import send_message
-            help_msg = (
-                "📖 <b>مساعدة - بوت إشارات التداول</b>\n\n"
-                "🔹 <b>كيف يعمل البوت:</b>\n"
-                "• يستقبل إشارات من TradingView\n"
-                "• يرسل إشارات التداول تلقائياً\n"
-                "• يعرض TP/SL والأسعار\n\n"
-                "🔹 <b>أنواع الإشارات:</b>\n"
-                "• 🟢 صفقة لونج (BUY)\n"
-                "• 🔴 صفقة شورت (SELL)\n"
-                "• 🟠 صفقات عكسية (REVERSE)\n"
-                "• 🎯 أهداف الربح (TP1, TP2, TP3)\n"
-                "• 🛑 وقف الخسارة (SL)\n\n"
-                "💡 البوت يعمل تلقائياً، لا حاجة لإرسال أوامر!"
-            )
-            send_message(help_msg, chat_id)
-            return jsonify({"status": "ok"}), 200
-        
-        elif text.startswith('/status'):
-            from telegram_bot import send_message
-            status_msg = (
-                "✅ <b>حالة البوت: نشط</b>\n\n"
-                "🤖 البوت يعمل بشكل صحيح\n"
-                "📊 جاهز لاستقبال الإشارات من TradingView\n"
-                "⚡ Rate limiting: مفعّل\n"
-                "🔒 حماية من spam: مفعّلة"
-            )
-            send_message(status_msg, chat_id)
-            return jsonify({"status": "ok"}), 200
+        reply = command_reply(text)
+        if reply:
+            send_message(reply, chat_id)
         
         return jsonify({"status": "ok"}), 200
     except Exception as e:
         logger.error(f"Error in telegram webhook: {e}")
         return jsonify({"status": "ok"}), 200  # دائماً نرد OK حتى لا يحاول Telegram إعادة الإرسال
 
+def process_bulk_item(data):
+    """
+    منع التكرار والتنسيق لعنصر واحد من الدفعة
+
+    Returns:
+        (item_status, message) - message = None إذا لم يتم قبول العنصر
+    """
+    if not isinstance(data, dict):
+        return {"status": "error", "error": "No valid data received"}, None
+    signal = str(data.get('signal', '')).upper()
+    if not signal:
+        return {"status": "error", "error": "Signal type is required"}, None
+    item = {"signal": signal, "symbol": data.get('symbol', 'N/A')}
+    spec = signal_registry.resolve(signal)
+    if spec is None:
+        item.update(status="error", error=f"Unknown signal type: {signal}")
+        return item, None
+    SIGNALS_TOTAL.inc(spec.name, str(item["symbol"]))
+    try:
+        if is_recent_duplicate(get_message_key(data), data):
+            DUPLICATES_TOTAL.inc(spec.name)
+            item["status"] = "ignored"
+            return item, None
+        message = spec.render(data)
+    except Exception as e:
+        logger.error(f"❌ خطأ في معالجة عنصر من الدفعة: {e}", exc_info=True)
+        item.update(status="error", error=str(e))
+        return item, None
+    item["status"] = "accepted"
+    return item, message
+
+@app.route('/webhook/bulk', methods=['POST'])
+@app.route('/personal/<chat_id>/webhook/bulk', methods=['POST'])
+def webhook_bulk(chat_id=None):
+    """
+    عدة إشارات في طلب واحد: مصفوفة JSON أو NDJSON
+    كل إشارة تمر بمنع التكرار والتنسيق، ثم تُسلَّم الرسائل المقبولة للإرسال كوحدة واحدة (رسائل مدمجة)
+    """
+    try:
+        entries = parse_bulk(request.get_data(as_text=True))
+    except json.JSONDecodeError as e:
+        return jsonify({"error": f"Invalid JSON: {str(e)}"}), 400
+    if not entries:
+        return jsonify({"error": "No valid data received"}), 400
+    if len(entries) > BULK_MAX_ITEMS:
+        return jsonify({"error": f"Too many items (max {BULK_MAX_ITEMS})"}), 413
+    
+    from config import TELEGRAM_CHAT_IDS
+    targets = [chat_id] if chat_id else TELEGRAM_CHAT_IDS
+    if not targets:
+        logger.error("❌ No chat IDs available - يجب تحديد Chat IDs في config.py")
+        return jsonify({"error": "No chat IDs available"}), 500
+    
+    items, messages = [], []
+    for index, (data, error) in enumerate(entries):
+        if error:
+            item, message = {"status": "error", "error": error}, None
+        else:
+            item, message = process_bulk_item(data)
+        item["index"] = index
+        items.append(item)
+        if message:
+            messages.append(message)
+    
+    response = {
+        "status": "success",
+        "total": len(items),
+        "accepted": len(messages),
+        "ignored": sum(1 for item in items if item["status"] == "ignored"),
+        "errors": sum(1 for item in items if item["status"] == "error"),
+        "items": items,
+    }
+    logger.info(f"📥 دفعة: {response['accepted']}/{response['total']} إشارة مقبولة")
+    if not messages:
+        return jsonify(response), 200
+    
+    if coalescer is not None:
+        for message in messages:
+            coalescer.submit(message, targets)
+        response["delivery"] = {"mode": "coalesced", "window_ms": COALESCE_WINDOW_MS}
+        return jsonify(response), 202
+    
+    digests = build_digests(messages)
+    if DELIVERY_MODE == 'async':
+        try:
+            delivery_ids = [
+                delivery_queue.submit(digest, targets, signal='BULK', count=len(messages))
+                for digest in digests
+            ]
+        except queue.Full:
+            logger.error("❌ طابور الإرسال ممتلئ")
+            return jsonify({"status": "error", "message": "Delivery queue is full", "items": items}), 503
+        response["delivery"] = {"mode": "queued", "delivery_ids": delivery_ids, "messages": len(digests)}
+        return jsonify(response), 202
+    
+    sent = 0
+    for digest in digests:
+        sent += send_message_to_all_groups(digest, targets)['success']
+    response["delivery"] = {"mode": "sync", "messages": len(digests), "sent": sent, "total": len(digests) * len(targets)}
+    if sent == 0:
+        response["status"] = "error"
+        return jsonify(response), 500
+    return jsonify(response), 200
+
 @app.route('/webhook', methods=['POST', 'GET'])
 @app.route('/personal/<chat_id>/webhook', methods=['POST', 'GET'])
+@WEBHOOK_STAGE_SECONDS.timed('total')
 def webhook(chat_id=None):
     """
     Main webhook endpoint - نسخة مبسطة
@@ -194,41 +305,16 @@ def webhook(chat_id=None):
         # Get JSON data
         data = None
         try:
-            if request.is_json:
-                data = request.get_json(force=False)
-            else:
-                raw_data = request.get_data(as_text=True)
+            raw_data = request.get_data(as_text=True)
+            if not request.is_json:
                 logger.info(f"📥 Raw data received: {raw_data[:200]}...")  # Log first 200 chars
-                
-                if raw_data:
-                    # Try to extract JSON from raw data (in case there's extra text)
-                    # Look for JSON object starting with {
-                    start_idx = raw_data.find('{')
-                    if start_idx != -1:
-                        # Find matching closing brace
-                        brace_count = 0
-                        end_idx = start_idx
-                        for i in range(start_idx, len(raw_data)):
-                            if raw_data[i] == '{':
-                                brace_count += 1
-                            elif raw_data[i] == '}':
-                                brace_count -= 1
-                                if brace_count == 0:
-                                    end_idx = i + 1
-                                    break
-                        
-                        json_str = raw_data[start_idx:end_idx]
-                        
-                        # Replace TradingView placeholders that weren't substituted
-                        # {{plot("...")}} -> null
-                        json_str = re.sub(r'\{\{plot\([^)]+\)\}\}', 'null', json_str)
-                        json_str = re.sub(r'\{\{[^}]+\}\}', 'null', json_str)  # Any other {{...}}
-                        
-                        logger.info(f"📥 Cleaned JSON: {json_str[:200]}...")
-                        data = json.loads(json_str)
-                    else:
-                        # Try parsing the whole thing
-                        data = json.loads(raw_data)
+            
+            if raw_data:
+                # JSON نظيف → json.loads مباشرة، وإلا استخراج أول كائن واستبدال
+                # TradingView placeholders التي لم تُستبدل ({{plot("...")}} -> null) في مرور واحد
+                started = time.perf_counter()
+                data = extract_payload(raw_data, is_json=request.is_json)
+                WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'extract')
         except json.JSONDecodeError as e:
             logger.error(f"❌ Error parsing JSON: {e}")
             logger.error(f"❌ Raw data: {request.get_data(as_text=True)[:500]}")
@@ -246,36 +332,68 @@ def webhook(chat_id=None):
         signal = data.get('signal', '').upper()
         if not signal:
             return jsonify({"error": "Signal type is required"}), 400
+        spec = signal_registry.resolve(signal)
+        if spec is None:
+            return jsonify({"error": f"Unknown signal type: {signal}"}), 400
+        SIGNALS_TOTAL.inc(spec.name, str(data.get('symbol', 'N/A')))
         
         # Check for duplicates
+        started = time.perf_counter()
         message_key = get_message_key(data)
-        if is_recent_duplicate(message_key, data):
+        duplicate = is_recent_duplicate(message_key, data)
+        WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'dedup')
+        if duplicate:
+            DUPLICATES_TOTAL.inc(spec.name)
             logger.warning(f"⚠️ Duplicate message ignored: {message_key}")
             return jsonify({"status": "ignored", "message": "Duplicate"}), 200
         
         logger.info(f"✅ New signal: {signal} for {data.get('symbol', 'N/A')}")
         
         # Route to appropriate formatter
-        message = None
+        started = time.perf_counter()
+        message = spec.render(data)
+        WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - started, 'format')
         
-        if signal == 'BUY' or signal == 'LONG':
-            message = format_buy_signal(data)
-        elif signal == 'SELL' or signal == 'SHORT':
-            message = format_sell_signal(data)
-        elif signal == 'BUY_REVERSE' or signal == 'LONG_REVERSE':
-            message = format_buy_reverse_signal(data)
-        elif signal == 'SELL_REVERSE' or signal == 'SHORT_REVERSE':
-            message = format_sell_reverse_signal(data)
-        elif signal == 'TP1_HIT' or signal == 'TP1':
-            message = format_tp1_hit(data)
-        elif signal == 'TP2_HIT' or signal == 'TP2':
-            message = format_tp2_hit(data)
-        elif signal == 'TP3_HIT' or signal == 'TP3':
-            message = format_tp3_hit(data)
-        elif signal == 'STOP_LOSS' or signal == 'SL':
-            message = format_stop_loss_hit(data)
-        else:
-            return jsonify({"error": f"Unknown signal type: {signal}"}), 400
+        # دمج الإشارات: الرد فوراً والإرسال كرسالة مدمجة بعد انتهاء النافذة
+        if message and coalescer is not None:
+            from config import TELEGRAM_CHAT_IDS
+            targets = [chat_id] if chat_id else TELEGRAM_CHAT_IDS
+            if not targets:
+                logger.error("❌ No chat IDs available - يجب تحديد Chat IDs في config.py")
+                return jsonify({
+                    "error": "No chat IDs available",
+                    "message": "يجب تحديد Chat IDs في config.py أو استخدام /personal/<chat_id>/webhook"
+                }), 500
+            coalescer.submit(message, targets)
+            return jsonify({
+                "status": "coalesced",
+                "signal": signal,
+                "total": len(targets),
+                "window_ms": COALESCE_WINDOW_MS
+            }), 202
+        
+        # وضع الطابور: الرد فوراً والإرسال في الخلفية
+        if message and DELIVERY_MODE == 'async':
+            from config import TELEGRAM_CHAT_IDS
+            targets = [chat_id] if chat_id else TELEGRAM_CHAT_IDS
+            if not targets:
+                logger.error("❌ No chat IDs available - يجب تحديد Chat IDs في config.py")
+                return jsonify({
+                    "error": "No chat IDs available",
+                    "message": "يجب تحديد Chat IDs في config.py أو استخدام /personal/<chat_id>/webhook"
+                }), 500
+            try:
+                delivery_id = delivery_queue.submit(message, targets, signal=signal, symbol=data.get('symbol', 'N/A'))
+            except queue.Full:
+                logger.error("❌ طابور الإرسال ممتلئ")
+                return jsonify({"status": "error", "message": "Delivery queue is full"}), 503
+            logger.info(f"📥 تمت إضافة الإشارة إلى الطابور: {delivery_id} ({len(targets)} مجموعة)")
+            return jsonify({
+                "status": "queued",
+                "signal": signal,
+                "delivery_id": delivery_id,
+                "total": len(targets)
+            }), 202
         
         # Send message
         if message:
@@ -284,8 +402,9 @@ def webhook(chat_id=None):
             if chat_id:
                 # إرسال لمجموعة واحدة (من URL)
                 logger.info(f"📤 إرسال لمجموعة واحدة من URL: {chat_id}")
-                success = send_message(message, chat_id)
-                if success:
+                # عبر الـ outbox ومسار المجموعة (نفس ترتيب الرسائل المرسلة لكل المجموعات)
+                result = send_message_to_all_groups(message, [chat_id])
+                if result['success'] > 0:
                     return jsonify({"status": "success", "signal": signal, "chat_id": chat_id}), 200
                 else:
                     return jsonify({"status": "error", "message": "Failed to send to Telegram"}), 500
@@ -318,19 +437,73 @@ def webhook(chat_id=None):
         logger.error(f"Error processing webhook: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
-# Startup message
-from config import get_config_status
-from telegram_bot import send_startup_message
-import time
-import os
+@app.route('/rate-limits', methods=['GET'])
+def get_rate_limits():
+    """الميزانية الحالية لمحدد المعدل (عام ولكل مجموعة)"""
+    return jsonify({"status": "success", "rate_limits": rate_limiter.budget()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """مقاييس Prometheus لهذا الـ worker"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/deliveries/<delivery_id>', methods=['GET'])
+def get_delivery(delivery_id):
+    """الاستعلام عن حالة عملية إرسال من الطابور"""
+    record = delivery_queue.get(delivery_id)
+    if not record:
+        return jsonify({"error": "Delivery not found"}), 404
+    return jsonify({"status": "success", "delivery": record}), 200
+
+# مهام بدء التشغيل في الخلفية (لا شيء يُنفذ عند الاستيراد - الـ worker جاهز فوراً)
+def _chat_preflight():
+    """فحص جميع المجموعات مرة واحدة عند البدء بدلاً من getChat قبل كل رسالة"""
+    from config import TELEGRAM_CHAT_IDS
+    from telegram_bot import chat_health
+    chat_health.preflight(TELEGRAM_CHAT_IDS)
 
-config_status = get_config_status()
-if config_status["all_set"]:
+def _announce_startup():
+    """رسالة بدء التشغيل - worker واحد لكل نشر (بعد preflight حتى لا تُرسل للمجموعات المطرود منها البوت)"""
+    return send_startup_message()
+
+startup_tasks = StartupTasks(STARTUP_LOCK_FILE, STARTUP_DEPLOYMENT_ID)
+if CHAT_HEALTH_PREFLIGHT:
+    startup_tasks.add('chat_preflight', _chat_preflight)
+if outbox is not None:
+    # إعادة إرسال ما لم يُرسل قبل إعادة التشغيل (بعد preflight حتى تُتجاهل المجموعات المطرود منها البوت)
+    startup_tasks.add('outbox_replay', outbox.replay)
+if STARTUP_ANNOUNCE:
+    startup_tasks.add('startup_message', _announce_startup, once=True)
+
+@app.before_request
+def _ensure_startup():
+    # احتياط لخوادم بدون post_worker_init (gunicorn.conf.py) - فحص pid فقط بعد أول طلب
+    startup_tasks.start()
+
+def start_background_tasks(standalone: bool = False):
+    """نقطة التشغيل من gunicorn.conf.py (post_worker_init) أو __main__"""
+    config_status = get_config_status()
+    if not config_status["all_set"]:
+        logger.warning("⚠️ Configuration incomplete")
+        return None
     logger.info("Configuration validated successfully")
-    time.sleep(2)
-    send_startup_message()
-else:
-    logger.warning("⚠️ Configuration incomplete")
+    return startup_tasks.start(
+        STARTUP_DEPLOYMENT_ID or (default_deployment_id(standalone=True) if standalone else None)
+    )
+
+def stop_background_tasks(timeout: float = OUTBOX_DRAIN_TIMEOUT):
+    """
+    نقطة الإيقاف من gunicorn.conf.py (worker_exit) أو SIGTERM في __main__:
+    إرسال الرسائل المدمجة المنتظرة وما في طابور الإرسال، ثم تحرير سجلات الـ outbox غير المرسلة
+    """
+    deadline = time.monotonic() + timeout
+    if coalescer is not None:
+        coalescer.flush(timeout)
+    delivery_queue.join(max(0.0, deadline - time.monotonic()))
+    if outbox is not None:
+        outbox.drain(max(0.0, deadline - time.monotonic()))
 
 if __name__ == '__main__':
+    start_background_tasks(standalone=True)
+    on_sigterm(stop_background_tasks)
     app.run(host='0.0.0.0', port=WEBHOOK_PORT, debug=DEBUG)
@@ -0,0 +1,86 @@
+"""
+Message Templates - قوالب رسائل Telegram مُجمَّعة مسبقاً
+كل قالب يُحوَّل مرة واحدة عند الاستيراد إلى دالة Python (f-string واحد لكل مجموعة أسطر)،
+فالرسالة تُبنى في خطوة واحدة بدلاً من += لكل سطر
+
+صيغة القالب:
+    {field}      قيمة الحقل كما هي
+    {field!h}    الحقل بعد تمرير دالة التحويل h (التحويلات تُمرر عند إنشاء القالب: h=escape_html, p=format_price, ...)
+    ?سطر         سطر اختياري: يُحذف إذا كانت أي قيمة من حقوله فارغة (None, 0, '')
+
+الرسالة تُنسق مرة واحدة لكل إشارة ونفس النص يُرسل لكل المجموعات
+"""
+import json
+from string import Formatter
+
+_OPTIONAL = '?'
+
+
+def _literal(text: str) -> str:
+    """نص ثابت داخل f-string مولَّد"""
+    return json.dumps(text, ensure_ascii=False)[1:-1].replace('{', '{{').replace('}', '}}')
+
+
+class Template:
+    """
+    Args:
+        source: نص القالب (الأسطر تحتفظ بـ \\n الخاص بها، السطر الأخير بدونه إذا لم يكن في النص)
+        converters: {حرف التحويل: دالة} لـ {field!x}
+
+    Raises:
+        ValueError: تحويل غير معروف في القالب
+    """
+
+    __slots__ = ('source', 'fields', 'render')
+
+    def __init__(self, source: str, converters: dict = None):
+        converters = converters or {}
+        self.source = source
+
+        names = {}  # اسم الحقل → اسم المتغير في الدالة المولدة
+        namespace = {}
+        segments = []  # (شرط, f-string)
+        for line in source.splitlines(keepends=True):
+            optional = line.startswith(_OPTIONAL)
+            if optional:
+                line = line[1:]
+            body = []
+            required = []
+            for literal, field, _, conversion in Formatter().parse(line):
+                body.append(_literal(literal))
+                if field is None:
+                    continue
+                var = names.setdefault(field, f"v{len(names)}")
+                required.append(var)
+                if conversion:
+                    if conversion not in converters:
+                        raise ValueError(f"Unknown conversion !{conversion} in template line: {line!r}")
+                    namespace[f"c_{conversion}"] = converters[conversion]
+                    body.append(f"{{c_{conversion}({var})}}")
+                else:
+                    body.append(f"{{{var}}}")
+            condition = ' and '.join(dict.fromkeys(required)) if optional and required else None
+            # الأسطر غير الاختيارية المتتالية تُدمج في f-string واحد
+            if condition is None and segments and segments[-1][0] is None:
+                segments[-1] = (None, segments[-1][1] + ''.join(body))
+            else:
+                segments.append((condition, ''.join(body)))
+
+        parts = [f'f"{text}"' if condition is None else f'(f"{text}" if {condition} else "")'
+                 for condition, text in segments] or ['""']
+        code = "def render(values):\n"
+        if names:
+            code += "    get = values.get\n"
+            code += ''.join(f"    {var} = get({field!r})\n" for field, var in names.items())
+        code += f"    return {' + '.join(parts)}\n"
+        exec(compile(code, f"<template {source[:40]!r}>", 'exec'), namespace)
+        self.fields = tuple(names)
+        self.render = namespace['render']
+
+    def __repr__(self):
+        return f"Template({self.fields})"
+
+
+def render(values: dict, *templates: Template) -> str:
+    """عدة قوالب متتالية (مثلاً: جسم الرسالة + كتلة الأهداف)"""
+    return ''.join([template.render(values) for template in templates])
@@ -0,0 +1,172 @@
+"""
+Message Threads - ربط أحداث الصفقة (TP1/TP2/TP3/SL) برسالة الدخول في كل مجموعة
+بدلاً من رسالة جديدة لكل حدث: تعديل بطاقة الدخول (edit) أو الرد عليها (reply) حسب إعداد المجموعة
+
+- عند إرسال إشارة الدخول يُحفظ message_id لكل مجموعة مع معرف الصفقة (جدول SQLite مشترك بين workers)
+- البحث عن البطاقة بالمفتاح (trade_id, chat_id) مباشرة - بدون مرور على الرسائل أو الصفقات
+- edit: البطاقة المحفوظة + سطر الحدث (بحد Telegram 4096 حرف - بعده رد بدلاً من التعديل)
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MODE_OFF = 'off'
+MODE_REPLY = 'reply'
+MODE_EDIT = 'edit'
+MODES = (MODE_OFF, MODE_REPLY, MODE_EDIT)
+
+ACTION_SEND = 'send'
+ACTION_REPLY = 'reply'
+ACTION_EDIT = 'edit'
+
+# الحد الأقصى لطول نص الرسالة في Telegram
+MAX_MESSAGE_LENGTH = 4096
+# فاصل سطر الحدث عن بطاقة الدخول عند التعديل
+UPDATE_SEPARATOR = '\n\n'
+
+
+def reply_parameters(message_id: int) -> dict:
+    """حقل sendMessage للرد على رسالة (يُرسل كرسالة عادية إذا حُذفت البطاقة)"""
+    return {"reply_parameters": {"message_id": message_id, "allow_sending_without_reply": True}}
+
+
+class MessageThreads:
+    """
+    Args:
+        path: ملف القاعدة (مشترك بين workers)
+        default_mode: وضع المجموعات غير المذكورة في chat_modes (off / reply / edit)
+        chat_modes: {chat_id: mode} لمجموعات معينة
+        ttl: ثواني الاحتفاظ بالبطاقة (بعدها تُرسل أحداث الصفقة كرسائل جديدة)
+        cleanup_interval: حذف البطاقات المنتهية كل N ثانية
+    """
+
+    _SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS message_threads (
+            trade_id TEXT NOT NULL,
+            chat_id TEXT NOT NULL,
+            message_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (trade_id, chat_id)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_message_threads_created_at ON message_threads (created_at)",
+    )
+
+    def __init__(self, path: str, default_mode: str = MODE_OFF, chat_modes: dict = None,
+                 ttl: float = 30 * 86400, cleanup_interval: float = 3600):
+        self.path = path
+        self.default_mode = self._valid_mode(default_mode, 'MESSAGE_THREAD_MODE')
+        self.chat_modes = {
+            str(chat_id).strip(): self._valid_mode(mode, f"MESSAGE_THREAD_CHATS ({chat_id})")
+            for chat_id, mode in (chat_modes or {}).items()
+        }
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._local = threading.local()
+        self._next_cleanup = 0.0
+        conn = self._conn()
+        for statement in self._SCHEMA:
+            conn.execute(statement)
+
+    @staticmethod
+    def _valid_mode(mode: str, source: str) -> str:
+        mode = (mode or MODE_OFF).lower()
+        if mode not in MODES:
+            logger.warning(f"⚠️ وضع غير معروف لربط الرسائل في {source}: {mode} - سيتم استخدام off")
+            return MODE_OFF
+        return mode
+
+    def _conn(self) -> sqlite3.Connection:
+        """اتصال لكل خيط (ويُنشأ من جديد داخل كل worker بعد fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def mode(self, chat_id) -> str:
+        return self.chat_modes.get(str(chat_id), self.default_mode)
+
+    def record(self, trade_id: str, chat_id, message_id: int, text: str):
+        """حفظ بطاقة الدخول لصفقة في مجموعة (المجموعات بوضع off لا تُحفظ)"""
+        if not trade_id or not message_id or self.mode(chat_id) == MODE_OFF:
+            return
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO message_threads (trade_id, chat_id, message_id, text, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (trade_id, str(chat_id), message_id, text, now)
+            )
+            if now >= self._next_cleanup:
+                self._next_cleanup = now + self.cleanup_interval
+                conn.execute("DELETE FROM message_threads WHERE created_at < ?", (now - self.ttl,))
+        except sqlite3.Error as e:
+            # لا نوقف الإرسال بسبب الربط - الأحداث التالية تُرسل كرسائل جديدة
+            logger.error(f"❌ خطأ في قاعدة ربط الرسائل: {e}")
+
+    def lookup(self, trade_id: str, chat_id):
+        """
+        Returns:
+            (message_id, نص البطاقة الحالي) أو None
+        """
+        try:
+            return self._conn().execute(
+                "SELECT message_id, text FROM message_threads WHERE trade_id = ? AND chat_id = ? AND created_at >= ?",
+                (trade_id, str(chat_id), time.time() - self.ttl)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"❌ خطأ في قاعدة ربط الرسائل: {e}")
+            return None
+
+    def update_text(self, trade_id: str, chat_id, text: str):
+        """نص البطاقة بعد تعديلها (ليُضاف إليه الحدث التالي)"""
+        try:
+            self._conn().execute(
+                "UPDATE message_threads SET text = ? WHERE trade_id = ? AND chat_id = ?",
+                (text, trade_id, str(chat_id))
+            )
+        except sqlite3.Error as e:
+            logger.error(f"❌ خطأ في قاعدة ربط الرسائل: {e}")
+
+    def plan(self, trade_id: str, chat_id, update: str) -> tuple:
+        """
+        كيف يُرسل حدث صفقة إلى مجموعة
+
+        Returns:
+            (ACTION_EDIT, message_id, نص البطاقة بعد إضافة الحدث)،
+            (ACTION_REPLY, message_id, update)، أو (ACTION_SEND, None, update) إذا لم تُحفظ بطاقة
+        """
+        mode = self.mode(chat_id)
+        card = self.lookup(trade_id, chat_id) if trade_id and mode != MODE_OFF else None
+        if card is None:
+            return ACTION_SEND, None, update
+        message_id, text = card
+        if mode == MODE_EDIT:
+            edited = text + UPDATE_SEPARATOR + update
+            if len(edited) <= MAX_MESSAGE_LENGTH:
+                return ACTION_EDIT, message_id, edited
+        return ACTION_REPLY, message_id, update
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM message_threads").fetchone()[0]
+
+
+def create_message_threads(default_mode: str, chat_modes: dict, path: str = 'message_threads.db',
+                           ttl: float = 30 * 86400):
+    """إنشاء جدول الربط حسب الإعدادات (None إذا كانت كل المجموعات بوضع off)"""
+    chat_modes = chat_modes or {}
+    if all((mode or MODE_OFF).lower() == MODE_OFF for mode in (default_mode, *chat_modes.values())):
+        return None
+    threads = MessageThreads(path, default_mode, chat_modes, ttl=ttl)
+    logger.info(f"🧵 ربط أحداث الصفقة ببطاقة الدخول: {threads.default_mode} "
+                f"({len(threads.chat_modes)} مجموعة بإعداد خاص) - {path}")
+    return threads
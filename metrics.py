@@ -0,0 +1,257 @@
+"""
+Metrics - مقاييس بصيغة Prometheus (text exposition 0.0.4) لمسار الإشارات، بدون مكتبات خارجية
+- Counter / Histogram: قفل واحد لكل مقياس وعمليات dict فقط (تكلفة ~1µs) - آمنة في المسار الساخن
+- Gauge: دالة تُستدعى عند القراءة فقط (عمق الطابور، تأخير rate limit، المجموعات المطرود منها البوت)
+المقاييس لكل عملية (worker): مع gunicorn -w N كل scrape يعرض worker واحد
+"""
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# حدود الـ buckets بالثواني: من مراحل بالميكروثانية (dedup) إلى طلبات Telegram بالثواني
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# حد أقصى لعدد مجموعات الـ labels لكل مقياس (symbol يأتي من التنبيه) - الزائد يُجمع في "other"
+MAX_SERIES = 1000
+OVERFLOW = 'other'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: tuple) -> tuple:
+        """مفتاح السلسلة (يُستدعى داخل القفل)"""
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {labels}")
+        if labels in self._values or len(self._values) < MAX_SERIES:
+            return labels
+        return (OVERFLOW,) * len(labels)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> list:
+        raise NotImplementedError
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """عداد تراكمي: counter.inc('BUY', 'BTCUSDT')"""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            key = self._key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """
+    توزيع زمني: histogram.observe(seconds, 'dedup')
+    التخزين لكل bucket بدون تراكم (تحديث واحد لكل قياس)، والتراكم يُحسب عند القراءة
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._values.get(key)
+            if series is None:
+                # [counts لكل bucket + Inf, sum]
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, *labels) -> '_Timer':
+        """with histogram.time('format'): ..."""
+        return _Timer(self, labels)
+
+    def timed(self, *labels):
+        """decorator: زمن تنفيذ الدالة كاملة (مثلاً endpoint بعدة نقاط return)"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *labels)
+            return wrapper
+        return decorator
+
+    def count(self, *labels) -> int:
+        with self._lock:
+            series = self._values.get(labels)
+            return sum(series[0]) if series else 0
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted((key, (list(series[0]), series[1])) for key, series in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_labels', '_started')
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._started, *self._labels)
+        return False
+
+
+class Gauge(_Metric):
+    """
+    قيمة لحظية من دالة تُستدعى عند القراءة
+
+    Args:
+        fn: () -> رقم، أو {labels tuple: رقم} إذا كانت هناك labels
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, fn, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def samples(self) -> list:
+        value = self.fn()
+        if not self.labelnames:
+            return [f"{self.name} {_format_value(value)}"]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+                for key, v in sorted(value.items())]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """تسجيل مقياس (نفس الاسم يستبدل السابق - مثلاً Gauge يعاد تعريفه من تطبيق آخر)"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, fn, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, fn, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:  # Gauge فاشل لا يُسقط بقية المقاييس
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+                continue
+            lines.extend(metric.header())
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = Registry()
+
+# مقاييس مسار الإشارات (مشتركة بين app.py و main.py)
+WEBHOOK_STAGE_SECONDS = REGISTRY.histogram(
+    'webhook_stage_seconds', "Time spent in each webhook stage (extract, dedup, store, format, total)", ('stage',)
+)
+SIGNALS_TOTAL = REGISTRY.counter('signals_total', "Valid signals received by type and symbol", ('signal', 'symbol'))
+DUPLICATES_TOTAL = REGISTRY.counter('signal_duplicates_total', "Signals dropped as duplicates", ('signal',))
+TELEGRAM_REQUEST_SECONDS = REGISTRY.histogram(
+    'telegram_request_seconds', "Telegram Bot API round-trip per chat", ('method', 'chat_id')
+)
+TELEGRAM_RESPONSES_TOTAL = REGISTRY.counter(
+    'telegram_responses_total', "Telegram Bot API responses by HTTP status", ('method', 'status')
+)
+TELEGRAM_RATE_LIMITED_TOTAL = REGISTRY.counter(
+    'telegram_rate_limited_total', "Telegram 429 responses per chat", ('chat_id',)
+)
+OUTBOX_EVENTS_TOTAL = REGISTRY.counter(
+    'outbox_events_total', "Outbox retries scheduled, redeliveries, give-ups, expiries and replays", ('event',)
+)
+MESSAGE_THREAD_EVENTS_TOTAL = REGISTRY.counter(
+    'message_thread_events_total', "Trade updates delivered by editing or replying to the entry card, and fallbacks",
+    ('action',)
+)
+
+
+def register_delivery_gauges(delivery_queue, coalescer=None, outbox=None):
+    """عمق طابور الإرسال والرسائل المنتظرة في الدمج والـ outbox (نسخ كل تطبيق)"""
+    REGISTRY.gauge('delivery_queue_depth', "Deliveries waiting in the async queue", delivery_queue.depth)
+    REGISTRY.gauge('coalescer_pending_messages', "Messages waiting for their coalescing window",
+                   lambda: coalescer.stats()['pending_messages'] if coalescer is not None else 0)
+    REGISTRY.gauge('outbox_pending_messages', "(message, chat) deliveries not yet sent",
+                   lambda: outbox.pending() if outbox is not None else 0)
@@ -0,0 +1,404 @@
+"""
+Outbox - سجل دائم (SQLite) لكل (رسالة، مجموعة) قبل محاولة الإرسال
+بدونه أي خطأ شبكة أو إعادة تشغيل (SIGTERM من Railway أثناء الإرسال) يضيع الرسالة للمجموعات المتبقية
+
+- السجل يُكتب قبل الإرسال، ويُحذف بعد النجاح
+- الفشل المؤقت: إعادة المحاولة في خيط خلفي بمهلة متضاعفة مع jitter (حتى max_attempts)
+- المجموعات التي طُرد منها البوت: لا إعادة محاولة (failed)
+- الرسائل الأقدم من max_age لا تُرسل (expired) - إشارة TP1 قبل ساعة بلا قيمة
+- كل worker يحجز السجلات التي يرسلها (lease) حتى لا تُرسل مرتين من workers مختلفة؛
+  الحجز يُجدد ذرياً لحظة بدء الإرسال (begin)، فرسالة انتظرت في مسار المجموعة أكثر من lease
+  وأخذها worker آخر لا تُرسل مرة ثانية؛
+  عند البدء تُستعاد سجلات العمليات المنتهية (replay)، وعند SIGTERM تُحرر السجلات غير المرسلة (drain)
+"""
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from functools import partial
+
+from metrics import OUTBOX_EVENTS_TOTAL
+from startup import process_identity, process_alive
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_FAILED = 'failed'
+STATUS_EXPIRED = 'expired'
+
+# مدة الاحتفاظ بسجلات failed / expired للفحص قبل حذفها
+_KEEP_FINISHED = 86400
+
+
+class Outbox:
+    """
+    Args:
+        path: ملف القاعدة (مشترك بين workers)
+        send_fn: دالة الإرسال لمجموعة واحدة (message, chat_id) -> bool
+        fan_out: دالة الإرسال المتوازي (send_fn, message, chat_ids, wait) -> dict أو Future (fan_out_message)
+        should_retry: (chat_id) -> bool - False = فشل دائم (مثلاً البوت مطرود)
+        max_age: ثواني صلاحية الرسالة من أول تسجيل
+        max_attempts: عدد المحاولات الكلي لكل (رسالة، مجموعة)
+        backoff_base, backoff_max: مهلة إعادة المحاولة base * 2^n (حتى max) × jitter بين 0.5 و 1
+        lease: ثواني حجز السجل للعملية التي ترسله (بعدها يمكن لعملية أخرى إعادة إرساله)
+        poll_interval: فحص السجلات المستحقة كل N ثانية
+    """
+
+    _SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            next_attempt_at REAL NOT NULL,
+            owner TEXT,
+            lease_until REAL NOT NULL DEFAULT 0,
+            last_error TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)",
+    )
+
+    def __init__(self, path: str, send_fn, fan_out, should_retry=None, max_age: float = 600,
+                 max_attempts: int = 8, backoff_base: float = 2, backoff_max: float = 120,
+                 lease: float = 120, poll_interval: float = 1.0):
+        self.path = path
+        self._send_fn = send_fn
+        self._fan_out = fan_out
+        self._should_retry = should_retry or (lambda chat_id: True)
+        self.max_age = max_age
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._inflight = threading.Condition()
+        self._active = set()  # السجلات التي يجري إرسالها الآن
+        self._queued = set()  # السجلات المسجلة أو المحجوزة في هذه العملية ولم تُرسل بعد (في مسار المجموعة)
+        self._wakeup = threading.Event()
+        self._closing = False
+        self._owner = None
+        self._pid = None
+        self._thread = None
+        self._next_cleanup = 0.0
+        conn = self._conn()
+        for statement in self._SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        """اتصال لكل خيط (ويُنشأ من جديد داخل كل worker بعد fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_started(self):
+        """تشغيل خيط إعادة المحاولة عند أول استخدام (داخل كل worker بعد fork)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._owner = process_identity(pid)
+            self._closing = False
+            self._active = set()
+            self._queued = set()
+            self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+            self._thread.start()
+            self._pid = pid
+            logger.info(f"📮 تم تشغيل الـ outbox ({self.path})")
+
+    def record(self, message: str, chat_ids: list) -> dict:
+        """
+        تسجيل الرسالة لكل مجموعة (محجوزة للعملية الحالية) قبل الإرسال
+
+        Returns:
+            {chat_id: (row id, created_at)}
+        """
+        self._ensure_started()
+        now = time.time()
+        # بعد بدء drain: السجل غير محجوز ليُرسل من worker آخر أو بعد إعادة التشغيل
+        owner, lease_until = (None, 0) if self._closing else (self._owner, now + self.lease)
+        rows = {}
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for chat_id in chat_ids:
+                chat_id = str(chat_id).strip()
+                if not chat_id or chat_id in rows:
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO outbox (chat_id, message, created_at, next_attempt_at, owner, lease_until) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (chat_id, message, now, now, owner, lease_until)
+                )
+                rows[chat_id] = (cursor.lastrowid, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._inflight:
+            self._queued.update(row_id for row_id, _ in rows.values())
+        return rows
+
+    def send(self, message: str, chat_ids: list, wait: bool = True, send_fn=None):
+        """
+        تسجيل ثم إرسال بالتوازي - نفس شكل نتيجة fan_out_message (Future إذا wait=False)
+        المجموعات التي فشل الإرسال إليها تبقى في الـ outbox لإعادة المحاولة في الخلفية
+
+        send_fn: دالة إرسال لهذه الرسالة فقط بدلاً من send_fn الافتراضية (مثل تعديل بطاقة الصفقة)؛
+        إعادة المحاولة في الخلفية تستخدم send_fn الافتراضية (رسالة جديدة)
+        """
+        send_fn = send_fn or self._send_fn
+        try:
+            rows = self.record(message, chat_ids)
+        except sqlite3.Error as e:
+            # لا نوقف الإرسال بسبب الـ outbox
+            logger.error(f"❌ خطأ في تسجيل الرسالة في الـ outbox: {e}")
+            return self._fan_out(send_fn, message, chat_ids, wait=wait)
+
+        def send_one(msg, chat_id):
+            row_id, created_at = rows[chat_id]
+            return self._attempt(row_id, chat_id, msg, created_at, 0, send_fn)
+
+        return self._fan_out(send_one, message, chat_ids, wait=wait)
+
+    def _retry(self, row_id: int, created_at: float, attempts: int, message: str, chat_id: str) -> bool:
+        return self._attempt(row_id, chat_id, message, created_at, attempts)
+
+    def _attempt(self, row_id: int, chat_id: str, message: str, created_at: float, attempts: int,
+                 send_fn=None) -> bool:
+        """محاولة إرسال سجل محجوز للعملية الحالية"""
+        if not self.begin(row_id, chat_id, created_at):
+            return False
+        error = None
+        try:
+            ok = bool((send_fn or self._send_fn)(message, chat_id))
+        except Exception as e:
+            ok, error = False, str(e)
+        return self.settle(row_id, chat_id, attempts, ok, error)
+
+    def begin(self, row_id: int, chat_id: str, created_at: float) -> bool:
+        """
+        بداية محاولة إرسال (لمن يرسل بنفسه، مثل async_app.py): False = لا إرسال
+        (drain بدأ، أو السجل أُرسل أو حجزته عملية أخرى، أو الرسالة قديمة)
+        بعد True يجب استدعاء settle بنتيجة الإرسال
+        """
+        with self._inflight:
+            if self._closing:
+                # drain بدأ: السجل يبقى pending ويُحرر لعملية أخرى
+                return False
+            self._active.add(row_id)
+        now = time.time()
+        # حجز ذري لحظة الإرسال: السجل ما زال pending وإما لنا أو انتهى حجزه
+        # (وإلا فقد انتظر في المسار أكثر من lease وأخذته عملية أخرى، أو أُرسل وحُذف)
+        try:
+            claimed = self._conn().execute(
+                "UPDATE outbox SET owner = ?, lease_until = ? "
+                "WHERE id = ? AND status = 'pending' AND (owner = ? OR lease_until <= ?)",
+                (self._owner, now + self.lease, row_id, self._owner, now)
+            ).rowcount
+        except sqlite3.Error as e:
+            # لا نوقف الإرسال بسبب الـ outbox
+            logger.error(f"❌ خطأ في قاعدة الـ outbox: {e}")
+            claimed = 1
+        if not claimed:
+            logger.info(f"📮 الرسالة إلى {chat_id} أُرسلت أو تُرسل من عملية أخرى - تم التخطي")
+            self._release(row_id)
+            return False
+        if self.max_age and now - created_at > self.max_age:
+            self._finish(row_id, STATUS_EXPIRED, 'stale')
+            OUTBOX_EVENTS_TOTAL.inc('expired')
+            logger.warning(f"⌛ رسالة منتهية الصلاحية لن تُرسل إلى {chat_id} (عمرها {now - created_at:.0f} ثانية)")
+            self._release(row_id)
+            return False
+        return True
+
+    def settle(self, row_id: int, chat_id: str, attempts: int, ok: bool, error: str = None) -> bool:
+        """تسجيل نتيجة الإرسال: حذف السجل، أو جدولة إعادة المحاولة، أو فشل دائم"""
+        try:
+            if ok:
+                self._execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                if attempts:
+                    OUTBOX_EVENTS_TOTAL.inc('delivered_after_retry')
+                return True
+
+            attempts += 1
+            if not self._should_retry(chat_id):
+                self._finish(row_id, STATUS_FAILED, error or 'chat unavailable', attempts)
+                OUTBOX_EVENTS_TOTAL.inc('failed')
+            elif attempts >= self.max_attempts:
+                self._finish(row_id, STATUS_FAILED, error or 'max attempts', attempts)
+                OUTBOX_EVENTS_TOTAL.inc('failed')
+                logger.error(f"❌ فشل الإرسال إلى {chat_id} بعد {attempts} محاولات - تم التخلي عن الرسالة")
+            else:
+                delay = self.backoff(attempts)
+                self._execute(
+                    "UPDATE outbox SET attempts = ?, next_attempt_at = ?, owner = NULL, lease_until = 0, "
+                    "last_error = ? WHERE id = ?",
+                    (attempts, time.time() + delay, error or 'send failed', row_id)
+                )
+                OUTBOX_EVENTS_TOTAL.inc('retry_scheduled')
+                logger.warning(f"🔁 إعادة المحاولة إلى {chat_id} بعد {delay:.1f} ثانية ({attempts}/{self.max_attempts})")
+            return False
+        finally:
+            self._release(row_id)
+
+    def _release(self, row_id: int):
+        with self._inflight:
+            self._active.discard(row_id)
+            self._queued.discard(row_id)
+            self._inflight.notify_all()
+
+    def backoff(self, attempts: int) -> float:
+        """مهلة متضاعفة مع jitter (حتى لا تعيد عدة workers المحاولة في نفس اللحظة)"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _finish(self, row_id: int, status: str, error: str, attempts: int = None):
+        if attempts is None:
+            self._execute("UPDATE outbox SET status = ?, last_error = ?, lease_until = 0 WHERE id = ?",
+                          (status, error, row_id))
+        else:
+            self._execute("UPDATE outbox SET status = ?, last_error = ?, attempts = ?, lease_until = 0 WHERE id = ?",
+                          (status, error, attempts, row_id))
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        try:
+            return self._conn().execute(sql, params).rowcount
+        except sqlite3.Error as e:
+            logger.error(f"❌ خطأ في قاعدة الـ outbox: {e}")
+            return 0
+
+    def _claim(self, limit: int = 50) -> list:
+        """
+        حجز السجلات المستحقة وغير المحجوزة لعملية أخرى
+        (بدون السجلات التي تنتظر في مسارات هذه العملية - وإلا تُرسل مرتين)
+        """
+        now = time.time()
+        with self._inflight:
+            queued = set(self._queued)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, chat_id, message, created_at, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt_at <= ? AND lease_until <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (now, now, limit + len(queued))
+            ).fetchall()
+            rows = [row for row in rows if row[0] not in queued][:limit]
+            if rows:
+                conn.execute(
+                    f"UPDATE outbox SET owner = ?, lease_until = ? WHERE id IN ({','.join('?' * len(rows))})",
+                    (self._owner, now + self.lease, *(row[0] for row in rows))
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._inflight:
+            self._queued.update(row[0] for row in rows)
+        return rows
+
+    def _run(self):
+        while not self._closing:
+            try:
+                # إعادة المحاولة عبر نفس fan-out (مسار المجموعة) بدون انتظار - مجموعة بطيئة لا تؤخر البقية
+                for row_id, chat_id, message, created_at, attempts in self._claim():
+                    if self._closing:
+                        break
+                    self._fan_out(partial(self._retry, row_id, created_at, attempts), message, [chat_id], wait=False)
+                now = time.time()
+                if now >= self._next_cleanup:
+                    self._next_cleanup = now + 600
+                    self._execute("DELETE FROM outbox WHERE status != 'pending' AND created_at < ?",
+                                  (now - _KEEP_FINISHED,))
+            except sqlite3.Error as e:
+                logger.error(f"❌ خطأ في قاعدة الـ outbox: {e}")
+            except Exception as e:
+                logger.error(f"❌ خطأ في خيط الـ outbox: {e}", exc_info=True)
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def replay(self) -> int:
+        """
+        عند البدء: تحرير السجلات المحجوزة لعمليات انتهت (إعادة تشغيل أو نشر جديد)
+        لتُرسل فوراً من خيط إعادة المحاولة (المنتهية الصلاحية تُتجاهل عند المحاولة)
+
+        Returns:
+            عدد السجلات المعلقة
+        """
+        self._ensure_started()
+        now = time.time()
+        conn = self._conn()
+        owners = [row[0] for row in conn.execute(
+            "SELECT DISTINCT owner FROM outbox WHERE status = 'pending' AND owner IS NOT NULL AND lease_until > ?",
+            (now,)
+        )]
+        released = 0
+        for owner in owners:
+            if owner != self._owner and not process_alive(owner):
+                released += self._execute(
+                    "UPDATE outbox SET owner = NULL, lease_until = 0 WHERE owner = ? AND status = 'pending'", (owner,)
+                )
+        pending = self.pending()
+        if released:
+            OUTBOX_EVENTS_TOTAL.inc('replayed', amount=released)
+        if pending:
+            logger.info(f"📮 {pending} رسالة معلقة في الـ outbox (منها {released} من عمليات سابقة) - سيتم إرسالها")
+        self._wakeup.set()
+        return pending
+
+    def drain(self, timeout: float = 20) -> int:
+        """
+        عند الإيقاف (SIGTERM): انتظار الإرسالات الجارية ثم تحرير السجلات المحجوزة غير المرسلة
+        لتُرسل من worker آخر أو بعد إعادة التشغيل
+
+        Returns:
+            عدد السجلات المعلقة المتبقية
+        """
+        if self._pid != os.getpid():
+            return 0
+        deadline = time.monotonic() + timeout
+        with self._inflight:
+            self._closing = True
+            self._wakeup.set()
+            while self._active and time.monotonic() < deadline:
+                self._inflight.wait(deadline - time.monotonic())
+            # الإرسالات التي لم تنته تبقى محجوزة (قد تكون وصلت) - تُستعاد عند البدء التالي عبر replay
+            active = list(self._active)
+        self._execute(
+            "UPDATE outbox SET owner = NULL, lease_until = 0 WHERE owner = ? AND status = 'pending' "
+            f"AND id NOT IN ({','.join('?' * len(active))})",
+            (self._owner, *active)
+        )
+        pending = self.pending()
+        if pending:
+            logger.info(f"📮 إيقاف الـ outbox: {pending} رسالة معلقة ستُرسل بعد إعادة التشغيل")
+        return pending
+
+    def pending(self) -> int:
+        """عدد السجلات التي لم تُرسل بعد"""
+        try:
+            return self._conn().execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def stats(self) -> dict:
+        counts = dict(self._conn().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return {
+            'pending': counts.get(STATUS_PENDING, 0),
+            'failed': counts.get(STATUS_FAILED, 0),
+            'expired': counts.get(STATUS_EXPIRED, 0),
+        }
@@ -0,0 +1,104 @@
+"""
+Payload Parser - استخراج JSON من جسم تنبيه TradingView في مرور واحد
+- مسار سريع: الجسم JSON نظيف → json.loads مباشرة
+- غير ذلك: مسح واحد بتعبير مُجمَّع مسبقاً يقفز بين الأقواس والنصوص والـ placeholders
+  (بدلاً من حلقة Python حرف بحرف ثم re.sub مرتين)
+- يفهم النصوص: { و } داخل "..." لا تُحسب في مطابقة الأقواس
+- placeholders التي لم يستبدلها TradingView ({{plot("TP1")}}, {{close}}, ...) تصبح null أثناء المسح
+"""
+import json
+import re
+
+# كل ما يهم المسح: نص JSON كامل (مع escapes)، أو placeholder، أو قوس
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|\{\{.*?\}\}|[{}]', re.S)
+_PLACEHOLDER = re.compile(r'\{\{.*?\}\}', re.S)
+
+
+def extract_json(raw: str) -> str:
+    """
+    أول كائن JSON في النص بعد استبدال الـ placeholders بـ null
+
+    Returns:
+        نص JSON جاهز لـ json.loads (أو النص كما هو إذا لم يحتوِ على {)
+    """
+    start = raw.find('{')
+    if start == -1:
+        return raw
+
+    pieces = []
+    last = start
+    depth = 0
+    end = len(raw)
+    for match in _TOKEN.finditer(raw, start):
+        token = match.group()
+        first = token[0]
+        if first == '"':
+            # placeholder داخل نص: "{{ticker}}" → "null" (نفس سلوك التنظيف القديم)
+            if depth and '{{' in token:
+                pieces.append(raw[last:match.start()])
+                pieces.append(_PLACEHOLDER.sub('null', token))
+                last = match.end()
+            continue
+        if len(token) > 1:
+            # placeholder كقيمة: {{close}} → null (خارج الكائن يتم تجاهله)
+            if depth:
+                pieces.append(raw[last:match.start()])
+                pieces.append('null')
+            last = match.end()
+            continue
+        if first == '{':
+            if depth == 0:
+                last = match.start()
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                end = match.end()
+                break
+    pieces.append(raw[last:end])
+    return ''.join(pieces)
+
+
+def extract_payload(raw: str, is_json: bool = False):
+    """
+    تحويل جسم التنبيه إلى dict
+
+    Args:
+        raw: جسم الطلب كنص
+        is_json: Content-Type هو application/json
+
+    Raises:
+        json.JSONDecodeError: إذا لم يكن هناك JSON صالح بعد التنظيف
+    """
+    # المسار السريع: JSON نظيف (الحالة الطبيعية عندما يستبدل TradingView كل القيم)
+    if '{{' not in raw and (is_json or raw.lstrip().startswith('{')):
+        try:
+            return json.loads(raw)
+        except ValueError:
+            pass
+    return json.loads(extract_json(raw))
+
+
+def parse_bulk(raw: str) -> list:
+    """
+    جسم طلب /webhook/bulk: مصفوفة JSON أو NDJSON (إشارة في كل سطر)
+
+    Returns:
+        [(data, error)] لكل عنصر - خطأ عنصر واحد لا يُسقط الدفعة
+
+    Raises:
+        json.JSONDecodeError: إذا كانت المصفوفة نفسها غير صالحة
+    """
+    if raw.lstrip().startswith('['):
+        items = json.loads(raw)
+        return [(item, None) for item in items]
+
+    results = []
+    for line in raw.splitlines():
+        if not line.strip():
+            continue
+        try:
+            results.append((extract_payload(line), None))
+        except ValueError as e:
+            results.append((None, f"Invalid JSON: {e}"))
+    return results
@@ -0,0 +1,153 @@
+"""
+Position Index - فهرس الصفقات الحية في الذاكرة
+المفتاح (symbol, timeframe, direction) → مكدس trade ids، يُحدَّث مع كل فتح/إغلاق
+حتى يكون البحث عن الصفقة المقصودة بإشارة TP/SL بزمن ثابت بدلاً من المرور على كل الصفقات
+"""
+import threading
+
+from signals import LONG_SIGNALS, SHORT_SIGNALS
+
+# دورة حياة الصفقة: open → tp1 → tp2 → tp3، و sl من أي حالة حية
+LIVE_STATUSES = ('open', 'tp1', 'tp2')
+STATUS_RANK = {'open': 0, 'tp1': 1, 'tp2': 2, 'tp3': 3}
+
+# حدث الإشارة → الحالة الجديدة
+EVENT_STATUS = {
+    'TP1': 'tp1',
+    'TP2': 'tp2',
+    'TP3': 'tp3',
+    'SL': 'sl',
+}
+
+
+def next_status(current: str, event: str):
+    """
+    الانتقال التالي في دورة حياة الصفقة
+
+    Args:
+        current: الحالة الحالية (open, tp1, tp2, ...)
+        event: TP1, TP2, TP3 أو SL
+
+    Returns:
+        الحالة الجديدة، أو None إذا كان الانتقال غير مسموح (مثلاً TP1 بعد TP2 أو أي حدث بعد الإغلاق)
+    """
+    if current not in LIVE_STATUSES:
+        return None
+    target = EVENT_STATUS.get(event)
+    if target is None:
+        return None
+    if target == 'sl':
+        return target
+    # السماح بالتقدم فقط (TP2 بدون TP1 مقبول إذا ضاع تنبيه TP1)
+    return target if STATUS_RANK[target] > STATUS_RANK[current] else None
+
+
+def signal_direction(signal: str):
+    """long أو short من نوع الإشارة"""
+    signal = (signal or '').upper()
+    if signal in LONG_SIGNALS:
+        return 'long'
+    if signal in SHORT_SIGNALS:
+        return 'short'
+    return None
+
+
+def trade_direction(trade: dict):
+    """اتجاه الصفقة (الصفقات القديمة بدون حقل direction تُستنتج من signal)"""
+    return trade.get('direction') or signal_direction(trade.get('signal'))
+
+
+def normalize_timeframe(timeframe) -> str:
+    if timeframe is None or timeframe == '':
+        return 'N/A'
+    return str(timeframe)
+
+
+class PositionIndex:
+    """
+    فهرس الصفقات الحية
+    _stacks: (symbol, timeframe, direction) → [trade_id, ...] (الأحدث في النهاية)
+    _symbols: symbol → مجموعة المفاتيح غير الفارغة (للبحث عندما لا يُعرف الإطار الزمني أو الاتجاه)
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._stacks = {}
+        self._symbols = {}
+        self._keys = {}  # trade_id → key
+        self._seq = {}  # trade_id → ترتيب الفتح (لاختيار الأحدث بين عدة مكدسات)
+        self._counter = 0
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._symbols.clear()
+            self._keys.clear()
+            self._seq.clear()
+
+    def trade_changed(self, old, new: dict):
+        """تحديث الفهرس بعد إضافة/تحديث صفقة"""
+        trade_id = new['id']
+        with self._lock:
+            is_live = new.get('status') in LIVE_STATUSES
+            indexed = trade_id in self._keys
+            if is_live and not indexed:
+                self._push(trade_id, new)
+            elif not is_live and indexed:
+                self._remove(trade_id)
+
+    def _push(self, trade_id: str, trade: dict):
+        key = (trade.get('symbol'), normalize_timeframe(trade.get('timeframe')), trade_direction(trade))
+        self._stacks.setdefault(key, []).append(trade_id)
+        self._symbols.setdefault(key[0], set()).add(key)
+        self._keys[trade_id] = key
+        self._counter += 1
+        self._seq[trade_id] = self._counter
+
+    def _remove(self, trade_id: str):
+        key = self._keys.pop(trade_id)
+        self._seq.pop(trade_id, None)
+        stack = self._stacks[key]
+        # غالباً الصفقة المغلقة هي الأحدث (أعلى المكدس)
+        if stack and stack[-1] == trade_id:
+            stack.pop()
+        else:
+            stack.remove(trade_id)
+        if not stack:
+            del self._stacks[key]
+            keys = self._symbols.get(key[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._symbols[key[0]]
+
+    def find(self, symbol: str, timeframe=None, direction=None):
+        """
+        أحدث صفقة حية تطابق الرمز (والإطار الزمني والاتجاه إذا كانا معروفين)
+
+        Returns:
+            trade_id أو None
+        """
+        timeframe = normalize_timeframe(timeframe)
+        with self._lock:
+            if timeframe != 'N/A' and direction:
+                stack = self._stacks.get((symbol, timeframe, direction))
+                if stack:
+                    return stack[-1]
+
+            # عدد المفاتيح لكل رمز صغير (إطارات زمنية × اتجاهين)
+            # الصفقات المحفوظة بدون إطار زمني (N/A) تطابق أي إطار
+            best = None
+            for key in self._symbols.get(symbol, ()):
+                if timeframe != 'N/A' and key[1] not in (timeframe, 'N/A'):
+                    continue
+                if direction and key[2] != direction:
+                    continue
+                candidate = self._stacks[key][-1]
+                if best is None or self._seq[candidate] > self._seq[best]:
+                    best = candidate
+            return best
+
+    def live_count(self) -> int:
+        with self._lock:
+            return len(self._keys)
@@ -0,0 +1,185 @@
+"""
+Rate Limiter - نظام تحديد معدل الإرسال إلى Telegram
+دلو رموز (token bucket) عام للبوت + دلو لكل مجموعة، آمن مع الخيوط، ويحترم retry_after
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    دلو رموز بصيغة الجدولة الافتراضية (GCRA)
+    بدلاً من عدّاد رموز يُعاد ملؤه، نحفظ الوقت النظري للرسالة التالية (tat)،
+    وهذا يسمح بحجز مواعيد مستقبلية بدون انتظار داخل القفل
+
+    Args:
+        rate: عدد الرموز في الثانية
+        capacity: أقصى عدد رموز (حجم الدفعة المسموح بها)
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self.interval = 1.0 / self.rate if self.rate > 0 else 0.0
+        self.tat = 0.0  # theoretical arrival time
+        self.blocked_until = 0.0  # من retry_after
+
+    def available_at(self, now: float) -> float:
+        """أقرب وقت يتوفر فيه رمز"""
+        return max(now, self.tat - (self.capacity - 1) * self.interval, self.blocked_until)
+
+    def consume(self, at: float):
+        """استهلاك رمز في الوقت المحجوز"""
+        self.tat = max(self.tat, at) + self.interval
+
+    def tokens(self, now: float) -> float:
+        """عدد الرموز المتاحة الآن"""
+        if self.interval == 0:
+            return self.capacity
+        if now < self.blocked_until:
+            return 0.0
+        available = (now - self.tat) / self.interval + self.capacity
+        return max(0.0, min(self.capacity, available))
+
+
+class RateLimiter:
+    """
+    محدد المعدل: كل رسالة تحتاج رمزاً من الدلو العام ومن دلو المجموعة
+
+    Args:
+        global_rate: رسائل/ثانية لكل البوت (حد Telegram ~30)
+        global_burst: حجم الدفعة للدلو العام
+        group_rate_per_min: رسائل/دقيقة لكل مجموعة (حد Telegram ~20)
+        private_rate_per_min: رسائل/دقيقة للمحادثات الخاصة (~60)
+        chat_burst: حجم الدفعة لكل مجموعة
+    """
+
+    def __init__(self, global_rate: float = 30, global_burst: float = 30,
+                 group_rate_per_min: float = 20, private_rate_per_min: float = 60,
+                 chat_burst: float = 3):
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_burst)
+        self._group_rate = group_rate_per_min / 60.0
+        self._private_rate = private_rate_per_min / 60.0
+        self._chat_burst = chat_burst
+        self._chats = {}
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Chat IDs السالبة = مجموعات، الموجبة = محادثات خاصة
+            rate = self._group_rate if chat_id.startswith('-') else self._private_rate
+            bucket = TokenBucket(rate, self._chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def reserve(self, chat_id: str) -> float:
+        """
+        حجز موعد في دلو المجموعة فقط (بدون انتظار) - الرمز العام يُؤخذ بعده عبر reserve_global
+        عند لحظة الإرسال الفعلية: مجموعة تحت rate limit أو retry_after لا تؤخر الدلو العام لبقية المجموعات
+
+        Returns:
+            float: عدد الثواني المتبقية حتى موعد المجموعة
+        """
+        chat_id_str = str(chat_id)
+        with self._lock:
+            now = time.time()
+            chat_bucket = self._chat_bucket(chat_id_str)
+            send_at = chat_bucket.available_at(now)
+            chat_bucket.consume(send_at)
+        return send_at - now
+
+    def reserve_global(self) -> float:
+        """
+        حجز رمز من الدلو العام الآن (بعد انقضاء موعد المجموعة)
+
+        Returns:
+            float: عدد الثواني المتبقية حتى يتوفر الرمز العام
+        """
+        with self._lock:
+            now = time.time()
+            send_at = self._global.available_at(now)
+            self._global.consume(send_at)
+        return send_at - now
+
+    def acquire(self, chat_id: str) -> float:
+        """
+        انتظار موعد المجموعة ثم الرمز العام (الانتظار خارج القفل)
+
+        Returns:
+            float: مدة الانتظار الفعلية بالثواني
+        """
+        wait_time = self.reserve(chat_id)
+        if wait_time > 0:
+            time.sleep(wait_time)
+        global_wait = self.reserve_global()
+        if global_wait > 0:
+            time.sleep(global_wait)
+        return max(0.0, wait_time) + max(0.0, global_wait)
+
+    def backoff(self, chat_id: str, retry_after: float):
+        """
+        إيقاف الإرسال إلى مجموعة حتى انقضاء retry_after بالضبط (من رد Telegram)
+        """
+        chat_id_str = str(chat_id)
+        with self._lock:
+            until = time.time() + max(0.0, float(retry_after))
+            bucket = self._chat_bucket(chat_id_str)
+            bucket.blocked_until = max(bucket.blocked_until, until)
+        logger.warning(f"⏳ Rate limit: إيقاف الإرسال إلى {chat_id_str} لمدة {retry_after} ثانية (retry_after)")
+
+    def budget(self, chat_id: str = None) -> dict:
+        """الميزانية الحالية: الرموز المتاحة عالمياً ولكل مجموعة"""
+        with self._lock:
+            now = time.time()
+            chats = self._chats if chat_id is None else {
+                str(chat_id): self._chat_bucket(str(chat_id))
+            }
+            return {
+                'global': {
+                    'tokens': round(self._global.tokens(now), 3),
+                    'capacity': self._global.capacity,
+                    'rate_per_sec': self._global.rate,
+                },
+                'chats': {
+                    cid: {
+                        'tokens': round(bucket.tokens(now), 3),
+                        'capacity': bucket.capacity,
+                        'rate_per_min': round(bucket.rate * 60, 3),
+                        'blocked_for': round(max(0.0, bucket.blocked_until - now), 3),
+                    }
+                    for cid, bucket in chats.items()
+                }
+            }
+
+    def current_delay(self, chat_id: str = None) -> float:
+        """مدة الانتظار المتوقعة للرسالة التالية (بدون حجز)"""
+        with self._lock:
+            now = time.time()
+            available_at = self._global.available_at(now)
+            if chat_id is not None:
+                available_at = max(available_at, self._chat_bucket(str(chat_id)).available_at(now))
+            return available_at - now
+
+
+def parse_retry_after(result: dict):
+    """
+    استخراج retry_after من رد Telegram
+    {"ok": false, "error_code": 429, "parameters": {"retry_after": 17}}
+
+    Returns:
+        float أو None إذا لم يكن الرد Rate Limit
+    """
+    if not isinstance(result, dict):
+        return None
+    parameters = result.get('parameters') or {}
+    retry_after = parameters.get('retry_after')
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return None
+    return None
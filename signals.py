@@ -0,0 +1,127 @@
+"""
+Signals - سجل أنواع الإشارات
+كل اسم بديل (BUY/LONG, TP1/TP1_HIT, ...) → النوع الموحد، دالة التنسيق، نافذة منع التكرار، وإجراء دورة حياة الصفقة
+التوجيه = بحث واحد في dict، وإضافة نوع جديد = register() بدون تعديل الـ endpoint
+"""
+
+KIND_ENTRY = 'entry'
+KIND_EXIT = 'exit'
+
+# إجراء دورة حياة الصفقة: فتح صفقة جديدة، أو حدث TP1/TP2/TP3/SL (position_index.EVENT_STATUS)
+ACTION_OPEN = 'open'
+
+# (النوع الموحد, الأسماء البديلة, النوع, الاتجاه, إجراء الصفقة)
+DEFAULT_SIGNALS = (
+    ('BUY', ('LONG',), KIND_ENTRY, 'long', ACTION_OPEN),
+    ('SELL', ('SHORT',), KIND_ENTRY, 'short', ACTION_OPEN),
+    ('BUY_REVERSE', ('LONG_REVERSE',), KIND_ENTRY, 'long', ACTION_OPEN),
+    ('SELL_REVERSE', ('SHORT_REVERSE',), KIND_ENTRY, 'short', ACTION_OPEN),
+    ('TP1', ('TP1_HIT',), KIND_EXIT, None, 'TP1'),
+    ('TP2', ('TP2_HIT',), KIND_EXIT, None, 'TP2'),
+    ('TP3', ('TP3_HIT',), KIND_EXIT, None, 'TP3'),
+    ('SL', ('STOP_LOSS',), KIND_EXIT, None, 'SL'),
+)
+
+LONG_SIGNALS = tuple(alias for name, aliases, _, direction, _ in DEFAULT_SIGNALS
+                     if direction == 'long' for alias in (name,) + aliases)
+SHORT_SIGNALS = tuple(alias for name, aliases, _, direction, _ in DEFAULT_SIGNALS
+                      if direction == 'short' for alias in (name,) + aliases)
+
+
+class SignalSpec:
+    """
+    تعريف نوع إشارة
+
+    Attributes:
+        name: النوع الموحد (BUY, TP1, ...)
+        aliases: الأسماء البديلة المقبولة في التنبيه
+        kind: entry أو exit
+        direction: long / short لإشارات الدخول
+        trade_action: 'open' أو حدث TP1/TP2/TP3/SL (None = لا تأثير على الصفقات)
+        dedup_window: نافذة منع التكرار بالثواني (0 أو None = بدون منع تكرار)
+        formatter: دالة (data) -> str
+    """
+
+    __slots__ = ('name', 'aliases', 'kind', 'direction', 'trade_action', 'dedup_window', 'formatter')
+
+    def __init__(self, name, aliases=(), kind=KIND_ENTRY, direction=None, trade_action=None,
+                 dedup_window=None, formatter=None):
+        self.name = name
+        self.aliases = tuple(aliases)
+        self.kind = kind
+        self.direction = direction
+        self.trade_action = trade_action
+        self.dedup_window = dedup_window
+        self.formatter = formatter
+
+    def render(self, data: dict):
+        return self.formatter(data) if self.formatter else None
+
+    def __repr__(self):
+        return f"SignalSpec({self.name})"
+
+
+class SignalRegistry:
+    """
+    Args:
+        entry_window: نافذة منع التكرار الافتراضية لإشارات الدخول
+        exit_window: نافذة منع التكرار الافتراضية لـ TP/SL
+        windows: {signal: seconds} لتجاوز النافذة لنوع معين (بالاسم الموحد أو أي اسم بديل)
+    """
+
+    def __init__(self, entry_window: float = 60, exit_window: float = 30, windows: dict = None):
+        self.entry_window = entry_window
+        self.exit_window = exit_window
+        self.windows = {k.upper(): v for k, v in (windows or {}).items()}
+        self._specs = {}
+        self._aliases = {}
+
+    def register(self, name: str, aliases=(), kind: str = KIND_ENTRY, direction: str = None,
+                 trade_action: str = None, dedup_window: float = None, formatter=None) -> SignalSpec:
+        """تسجيل نوع إشارة (أو استبداله) مع كل أسمائه البديلة"""
+        name = name.upper()
+        aliases = tuple(a.upper() for a in aliases if a.upper() != name)
+        if dedup_window is None:
+            dedup_window = next(
+                (self.windows[n] for n in (name,) + aliases if n in self.windows),
+                self.entry_window if kind == KIND_ENTRY else self.exit_window
+            )
+        spec = SignalSpec(name, aliases, kind, direction, trade_action, dedup_window, formatter)
+
+        old = self._specs.get(name)
+        if old is not None:
+            for alias in (old.name,) + old.aliases:
+                self._aliases.pop(alias, None)
+        self._specs[name] = spec
+        for alias in (name,) + aliases:
+            self._aliases[alias] = spec
+        return spec
+
+    def set_formatter(self, name: str, formatter):
+        self._specs[name.upper()].formatter = formatter
+
+    def resolve(self, signal):
+        """SignalSpec للاسم (أي اسم بديل) أو None إذا كان غير معروف"""
+        return self._aliases.get(str(signal or '').upper())
+
+    def specs(self) -> list:
+        return list(self._specs.values())
+
+    def __contains__(self, signal):
+        return self.resolve(signal) is not None
+
+
+def create_registry(formatters: dict = None, entry_window: float = 60, exit_window: float = 30,
+                    windows: dict = None) -> SignalRegistry:
+    """
+    السجل الافتراضي (الإشارات الثمانية) مع دوال التنسيق الخاصة بكل تطبيق
+
+    Args:
+        formatters: {النوع الموحد: دالة التنسيق}
+    """
+    formatters = formatters or {}
+    registry = SignalRegistry(entry_window=entry_window, exit_window=exit_window, windows=windows)
+    for name, aliases, kind, direction, action in DEFAULT_SIGNALS:
+        registry.register(name, aliases, kind=kind, direction=direction, trade_action=action,
+                          formatter=formatters.get(name))
+    return registry
@@ -0,0 +1,159 @@
+"""
+Startup - مهام بدء التشغيل في الخلفية بدلاً من تنفيذها عند الاستيراد
+الـ worker يبدأ استقبال الـ webhooks فوراً، والمهام تعمل في خيط خلفي:
+- مهام لكل worker (مثل preflight لحالة المجموعات - كاش داخل كل عملية)
+- مهام مرة واحدة لكل نشر (deployment) مثل رسالة بدء التشغيل: worker واحد فقط ينفذها
+  (قفل fcntl على ملف مشترك + تسجيل معرف النشر في نفس الملف بعد النجاح؛ الـ workers الأخرى تنتظر القفل
+  ثم تتجاوز المهمة إذا سُجلت، أو تعيد المحاولة إذا فشلت عند من سبقها)
+
+التشغيل: post_worker_init في gunicorn.conf.py، أو app.run في __main__، أو أول طلب (before_request) كاحتياط
+الإيقاف: worker_exit في gunicorn.conf.py، أو on_sigterm في __main__
+"""
+import fcntl
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _process_start_time(pid: int) -> str:
+    """وقت بدء العملية من /proc (لتمييز عملية gunicorn رئيسية جديدة تحمل نفس الـ pid)"""
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return ''
+
+
+def process_identity(pid: int = None) -> str:
+    """pid + وقت بدء العملية (يبقى فريداً حتى لو أعيد استخدام الـ pid لعملية أخرى)"""
+    pid = os.getpid() if pid is None else pid
+    return f"{pid}-{_process_start_time(pid)}"
+
+
+def process_alive(identity: str) -> bool:
+    """هل العملية صاحبة هذا المعرف (من process_identity) ما زالت تعمل؟"""
+    pid, _, started = identity.partition('-')
+    try:
+        pid = int(pid)
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return not started or _process_start_time(pid) == started
+
+
+def default_deployment_id(standalone: bool = False) -> str:
+    """
+    معرف النشر عند عدم تحديد STARTUP_DEPLOYMENT_ID:
+    كل workers لنفس عملية gunicorn الرئيسية = نشر واحد (إعادة تشغيل worker لا تعيد رسالة البدء)
+
+    Args:
+        standalone: تشغيل مباشر (python main.py) - العملية نفسها هي النشر
+    """
+    return process_identity(os.getpid() if standalone else os.getppid())
+
+
+class StartupTasks:
+    """
+    Args:
+        lock_path: ملف القفل المشترك بين workers (يحفظ آخر نشر نفذ كل مهمة)
+        deployment_id: معرف النشر الحالي (None = default_deployment_id)
+    """
+
+    def __init__(self, lock_path: str = 'startup.lock', deployment_id: str = None):
+        self.lock_path = lock_path
+        self.deployment_id = deployment_id or None
+        self._tasks = []  # (name, fn, once)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._status = {}  # name → ran / skipped / failed
+
+    def add(self, name: str, fn, once: bool = False):
+        """
+        Args:
+            once: مرة واحدة لكل نشر (worker واحد فقط) - fn تُرجع False عند الفشل ليُعاد المحاولة في worker لاحق
+        """
+        self._tasks.append((name, fn, once))
+
+    def start(self, deployment_id: str = None) -> threading.Thread:
+        """تشغيل المهام في خيط خلفي مرة واحدة لكل عملية (آمن للاستدعاء من كل طلب)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._thread
+        with self._lock:
+            if self._pid == pid:
+                return self._thread
+            if deployment_id:
+                self.deployment_id = deployment_id
+            self._status = {}
+            self._thread = threading.Thread(target=self._run, name="startup-tasks", daemon=True)
+            self._thread.start()
+            self._pid = pid
+        return self._thread
+
+    def _run(self):
+        started = time.monotonic()
+        for name, fn, once in self._tasks:
+            try:
+                if once:
+                    self._status[name] = self._run_once(name, fn)
+                else:
+                    fn()
+                    self._status[name] = 'ran'
+            except Exception as e:
+                self._status[name] = 'failed'
+                logger.error(f"❌ خطأ في مهمة بدء التشغيل {name}: {e}", exc_info=True)
+        logger.info(f"🚀 انتهت مهام بدء التشغيل ({time.monotonic() - started:.2f}s): {self._status}")
+
+    def _run_once(self, name: str, fn) -> str:
+        """
+        worker واحد في كل مرة يملك القفل (الانتظار في الخيط الخلفي - لا يؤخر الطلبات)
+        المهمة تُسجل كمنفذة لهذا النشر بعد نجاحها فقط: إذا فشلت (False أو استثناء) ينفذها الـ worker التالي
+        """
+        deployment = self.deployment_id or default_deployment_id()
+        with open(self.lock_path, 'a+', encoding='utf-8') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                lock_file.seek(0)
+                try:
+                    done = json.loads(lock_file.read() or '{}')
+                except ValueError:
+                    done = {}
+                if done.get(name) == deployment:
+                    return 'skipped'
+
+                if fn() is False:
+                    return 'failed'
+                done[name] = deployment
+                lock_file.seek(0)
+                lock_file.truncate()
+                json.dump(done, lock_file)
+                lock_file.flush()
+                return 'ran'
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def join(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self) -> dict:
+        return dict(self._status)
+
+
+def on_sigterm(fn):
+    """تشغيل مباشر (python main.py): تنفيذ fn عند SIGTERM ثم الخروج (gunicorn يستخدم worker_exit بدلاً منه)"""
+    def handler(signum, frame):
+        try:
+            fn()
+        finally:
+            sys.exit(0)
+    signal.signal(signal.SIGTERM, handler)
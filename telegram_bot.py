@@ -2,23 +2,57 @@
 Telegram Bot Module - نسخة مبسطة مع رسائل بالعربية
 """
 import requests
-from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
+from config import (
+    TELEGRAM_CHAT_ID,
+    FANOUT_MAX_WORKERS,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_GLOBAL_BURST,
+    TELEGRAM_GROUP_RATE_PER_MIN,
+    TELEGRAM_PRIVATE_RATE_PER_MIN,
+    TELEGRAM_CHAT_BURST,
+    CHAT_HEALTH_TTL,
+    CHAT_HEALTH_BACKOFF_BASE,
+    CHAT_HEALTH_BACKOFF_MAX,
+    OUTBOX_ENABLED,
+    OUTBOX_DB_FILE,
+    OUTBOX_MAX_AGE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_BASE,
+    OUTBOX_RETRY_MAX,
+    OUTBOX_LEASE
+)
+from rate_limiter import RateLimiter, parse_retry_after
+from chat_health import ChatHealthRegistry, STATUS_OK, STATUS_KICKED
+from telegram_client import telegram_api, encode_message
+from outbox import Outbox
+from concurrent.futures import Future
+from delivery_lanes import ChatLanes
+from functools import lru_cache
+from message_templates import Template, render
+from metrics import REGISTRY
 import logging
+import os
+import threading
 import time
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-TELEGRAM_GET_CHAT_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getChat"
-TELEGRAM_GET_ME_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getMe"
+# جميع طلبات Telegram تمر عبر جلسة مشتركة (keep-alive) - انظر telegram_client.py
 
-# Rate limiting: آخر وقت إرسال رسالة (لتجنب spam)
-_last_message_time = 0
-_min_delay_between_messages = 2.0  # 2 ثانية بين كل رسالة (للحماية من الطرد)
-_bot_kicked_chats = set()  # حفظ قائمة المجموعات التي طُرد منها البوت
+# Rate limiting: دلو عام للبوت + دلو لكل مجموعة (لتجنب spam والطرد)
+rate_limiter = RateLimiter(
+    global_rate=TELEGRAM_GLOBAL_RATE,
+    global_burst=TELEGRAM_GLOBAL_BURST,
+    group_rate_per_min=TELEGRAM_GROUP_RATE_PER_MIN,
+    private_rate_per_min=TELEGRAM_PRIVATE_RATE_PER_MIN,
+    chat_burst=TELEGRAM_CHAT_BURST
+)
 _max_retries = 3  # عدد المحاولات
 
+# Fan-out: مسار FIFO لكل مجموعة فوق مجمع خيوط مشترك ومحدود (الترتيب داخل المجموعة، والتوازي بين المجموعات)
+delivery_lanes = ChatLanes(max_workers=FANOUT_MAX_WORKERS)
+
 def escape_html(text: str) -> str:
     """تهريب الأحرف الخاصة في HTML"""
     if not isinstance(text, str):
@@ -29,8 +63,10 @@ def escape_html(text: str) -> str:
     text = text.replace('>', '&gt;')
     return text
 
+@lru_cache(maxsize=4096)
 def format_price(price: float) -> str:
-    """تنسيق السعر"""
+    """تنسيق السعر (مع كاش: نفس الأسعار تتكرر في TP/SL وفي الإشارات المتتالية لنفس الرمز)"""
+    price = float(price)
     if price == 0:
         return "0.00"
     if price >= 1000:
@@ -43,8 +79,16 @@ def format_price(price: float) -> str:
         return f"{price:.8f}".rstrip('0').rstrip('.')
 
 def format_timeframe(timeframe: str) -> str:
-    """تحويل الإطار الزمني إلى تنسيق قابل للقراءة"""
-    if not timeframe or timeframe == 'N/A':
+    """تحويل الإطار الزمني إلى تنسيق قابل للقراءة (مع كاش: عدد الأطر المستخدمة محدود)"""
+    if not timeframe:
+        return 'N/A'
+    if not isinstance(timeframe, (str, int, float)):
+        timeframe = str(timeframe)
+    return _format_timeframe(timeframe)
+
+@lru_cache(maxsize=256)
+def _format_timeframe(timeframe) -> str:
+    if timeframe == 'N/A':
         return 'N/A'
     
     # إذا كان رقم (دقائق)
@@ -72,78 +116,146 @@ def format_timeframe(timeframe: str) -> str:
         # إذا كان نص (مثل "15D", "1H", "5M")
         timeframe_upper = str(timeframe).upper()
         
-        # تحويل الاختصارات الشائعة
-        if timeframe_upper.endswith('D'):
-            days = int(timeframe_upper.replace('D', ''))
-            return f"{days} ي"
-        elif timeframe_upper.endswith('H'):
-            hours = int(timeframe_upper.replace('H', ''))
-            return f"{hours} س"
-        elif timeframe_upper.endswith('M'):
-            minutes = int(timeframe_upper.replace('M', ''))
-            return f"{minutes} د"
-        elif timeframe_upper.endswith('W'):
-            weeks = int(timeframe_upper.replace('W', ''))
-            return f"{weeks} أ"
-        elif timeframe_upper.endswith('S'):
-            seconds = int(timeframe_upper.replace('S', ''))
-            if seconds < 60:
-                return f"{seconds} ث"
-            else:
-                minutes = seconds // 60
+        # تحويل الاختصارات الشائعة (بدون رقم مثل "D" من TradingView = 1)
+        try:
+            if timeframe_upper.endswith('D'):
+                days = int(timeframe_upper.replace('D', '') or 1)
+                return f"{days} ي"
+            elif timeframe_upper.endswith('H'):
+                hours = int(timeframe_upper.replace('H', '') or 1)
+                return f"{hours} س"
+            elif timeframe_upper.endswith('M'):
+                minutes = int(timeframe_upper.replace('M', '') or 1)
                 return f"{minutes} د"
+            elif timeframe_upper.endswith('W'):
+                weeks = int(timeframe_upper.replace('W', '') or 1)
+                return f"{weeks} أ"
+            elif timeframe_upper.endswith('S'):
+                seconds = int(timeframe_upper.replace('S', '') or 1)
+                if seconds < 60:
+                    return f"{seconds} ث"
+                else:
+                    minutes = seconds // 60
+                    return f"{minutes} د"
+        except ValueError:
+            pass
         
         # إذا لم يكن تنسيق معروف، ارجعه كما هو
         return str(timeframe)
 
-def check_bot_status(chat_id: str) -> bool:
-    """التحقق من حالة البوت في المجموعة قبل الإرسال"""
-    global _bot_kicked_chats
-    
-    chat_id_str = str(chat_id)
-    
-    # إذا كان البوت طُرد سابقاً، تحقق مرة أخرى بعد 5 دقائق
-    if chat_id_str in _bot_kicked_chats:
-        logger.warning(f"⚠️ البوت كان محظوراً سابقاً في {chat_id_str}، سيتم التحقق مرة أخرى...")
-        # يمكن إضافة منطق للتحقق مرة أخرى بعد فترة
-        # إزالة من القائمة بعد فترة (سيتم التحقق مرة أخرى)
-        import time
-        time.sleep(1)  # تأخير بسيط
+def _is_membership_error(description: str) -> bool:
+    """هل الخطأ يعني أن البوت غير موجود في المجموعة؟"""
+    description = (description or '').lower()
+    return (
+        'kicked' in description
+        or 'bot was blocked' in description
+        or 'chat not found' in description
+        or 'forbidden' in description
+    )
+
+def probe_chat(chat_id: str):
+    """
+    فحص حالة البوت في المجموعة عبر getChat (يُستخدم في الخلفية فقط)
     
+    Returns:
+        tuple: (status, error) - status = 'ok' أو 'kicked' أو None إذا فشل الفحص
+    """
     try:
-        # التحقق من حالة البوت في المجموعة (فقط كل 10 رسائل لتقليل الاستعلامات)
-        # تخطي التحقق في بعض الحالات لتقليل الاستعلامات
-        response = requests.get(
-            TELEGRAM_GET_CHAT_URL,
-            params={"chat_id": chat_id_str},
-            timeout=5
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('ok'):
-                # البوت موجود في المجموعة
-                if chat_id_str in _bot_kicked_chats:
-                    _bot_kicked_chats.remove(chat_id_str)
-                    logger.info(f"✅ البوت تم إضافته مرة أخرى إلى {chat_id_str}")
-                return True
-            else:
-                error = result.get('description', '')
-                if 'kicked' in error.lower() or 'not found' in error.lower() or 'forbidden' in error.lower():
-                    _bot_kicked_chats.add(chat_id_str)
-                    logger.error(f"❌ البوت غير موجود في المجموعة: {error}")
-                    logger.error(f"💡 يرجى إضافة البوت إلى المجموعة مرة أخرى وإعطائه صلاحية 'Send Messages'")
-                    return False
-        
-        return True  # إذا فشل التحقق، حاول الإرسال على أي حال
+        response = telegram_api.get_chat(chat_id, timeout=5)
+        result = response.json()
+        if result.get('ok'):
+            return STATUS_OK, None
+        error = result.get('description', '')
+        if _is_membership_error(error):
+            logger.error(f"💡 يرجى إضافة البوت إلى المجموعة مرة أخرى وإعطائه صلاحية 'Send Messages'")
+            return STATUS_KICKED, error
+        return None, error
     except Exception as e:
         logger.warning(f"⚠️ فشل التحقق من حالة البوت: {e}")
-        return True  # إذا فشل التحقق، حاول الإرسال على أي حال
+        return None, str(e)
+
+# سجل حالة المجموعات (كاش + circuit breaker) - بدلاً من getChat قبل كل رسالة
+chat_health = ChatHealthRegistry(
+    probe_chat,
+    ttl=CHAT_HEALTH_TTL,
+    backoff_base=CHAT_HEALTH_BACKOFF_BASE,
+    backoff_max=CHAT_HEALTH_BACKOFF_MAX
+)
+
+# مقاييس لحظية (/metrics): تُحسب عند القراءة فقط
+REGISTRY.gauge('telegram_kicked_chats', "Chats the bot was removed from (circuit open)",
+               lambda: len(chat_health.kicked_chats()))
+REGISTRY.gauge('telegram_rate_limit_delay_seconds', "Wait before the next message may be sent (global bucket)",
+               lambda: max(0.0, rate_limiter.current_delay()))
+REGISTRY.gauge('delivery_lane_depth', "Messages queued or in flight in each chat's delivery lane",
+               lambda: {(chat_id,): lane['depth'] for chat_id, lane in delivery_lanes.stats().items()}, ('chat_id',))
+REGISTRY.gauge('delivery_lane_lag_seconds', "Age of the oldest unfinished message in each chat's delivery lane",
+               lambda: {(chat_id,): lane['lag'] for chat_id, lane in delivery_lanes.stats().items()}, ('chat_id',))
+
+def check_bot_status(chat_id: str) -> bool:
+    """التحقق من حالة البوت في المجموعة قبل الإرسال (من الكاش - بدون طلب HTTP)"""
+    return chat_health.is_sendable(chat_id)
+
+def _collect_results(futures: dict) -> dict:
+    """total = عدد المجموعات بعد حذف المكرر (كل مجموعة تُرسل مرة واحدة)"""
+    results = {}
+    for chat_id_str, future in futures.items():
+        try:
+            results[chat_id_str] = bool(future.result())
+        except Exception as e:
+            logger.error(f"❌ خطأ في الإرسال إلى {chat_id_str}: {e}")
+            results[chat_id_str] = False
+    success_count = sum(1 for ok in results.values() if ok)
+    return {
+        'total': len(results),
+        'success': success_count,
+        'failed': len(results) - success_count,
+        'results': results
+    }
+
+def fan_out_message(send_fn, message: str, chat_ids: list, wait: bool = True):
+    """
+    إرسال رسالة إلى عدة مجموعات بالتوازي - كل مجموعة في مسارها (بعد الرسائل السابقة لنفس المجموعة)
+    
+    Args:
+        send_fn: دالة الإرسال (message, chat_id) -> bool
+        message: الرسالة المراد إرسالها
+        chat_ids: قائمة Chat IDs
+        wait: False = الرجوع فوراً بـ Future (ترتيب الرسالة في كل مسار يتحدد لحظة الاستدعاء)
+    
+    Returns:
+        dict: {'total', 'success', 'failed', 'results'} - أو Future بنفس النتيجة إذا wait=False
+    """
+    targets = []
+    for chat_id in chat_ids:
+        chat_id_str = str(chat_id).strip()
+        if chat_id_str and chat_id_str not in targets:
+            targets.append(chat_id_str)
+    
+    futures = {chat_id_str: delivery_lanes.submit(chat_id_str, send_fn, message, chat_id_str)
+               for chat_id_str in targets}
+    if wait:
+        return _collect_results(futures)
+    
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        combined.set_result(_collect_results(futures))
+    
+    if not futures:
+        combined.set_result(_collect_results(futures))
+    for future in futures.values():
+        future.add_done_callback(on_done)
+    return combined
 
 def send_message(message: str, chat_id: str = None, retry_count: int = 0) -> bool:
     """إرسال رسالة إلى Telegram مع rate limiting وتجنب spam"""
-    global _last_message_time, _min_delay_between_messages, _max_retries
-    
     try:
         target_chat_id = chat_id or TELEGRAM_CHAT_ID
         if not target_chat_id:
@@ -158,56 +270,52 @@ def send_message(message: str, chat_id: str = None, retry_count: int = 0) -> boo
                 logger.error(f"❌ البوت غير موجود في المجموعة {chat_id_str} - لن يتم الإرسال")
                 return False
         
-        # Rate limiting: تأخير بسيط بين الرسائل لتجنب spam detection
-        current_time = time.time()
-        time_since_last_message = current_time - _last_message_time
-        if time_since_last_message < _min_delay_between_messages:
-            sleep_time = _min_delay_between_messages - time_since_last_message
-            time.sleep(sleep_time)
-        _last_message_time = time.time()
+        # استخدام HTML بدلاً من Markdown لتجنب مشاكل التهريب (الجسم يُحوَّل إلى JSON مرة واحدة)
+        body = encode_message(chat_id_str, message, "HTML")
         
-        payload = {
-            "chat_id": chat_id_str,
-            "text": message,
-            "parse_mode": "HTML"  # استخدام HTML بدلاً من Markdown لتجنب مشاكل التهريب
-        }
-        
-        logger.info(f"📤 Attempting to send message to chat_id: {chat_id_str}")
-        response = requests.post(TELEGRAM_API_URL, json=payload, timeout=10)
-        
-        # التحقق من الاستجابة
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('ok'):
+        for attempt in range(retry_count, _max_retries + 1):
+            # Rate limiting: رمز من الدلو العام + دلو المجموعة (وينتظر انتهاء retry_after إن وُجد)
+            rate_limiter.acquire(chat_id_str)
+            
+            logger.info(f"📤 Attempting to send message to chat_id: {chat_id_str}")
+            response = telegram_api.send_message(chat_id_str, message, body=body)
+            
+            try:
+                result = response.json()
+            except ValueError:
+                logger.error(f"❌ HTTP Error {response.status_code}: {response.text}")
+                return False
+            
+            if response.status_code == 200 and result.get('ok'):
                 logger.info(f"✅ Message sent successfully to Telegram (chat_id: {chat_id_str})")
+                chat_health.record_success(chat_id_str)
                 return True
-            else:
-                error_description = result.get('description', 'Unknown error')
-                logger.error(f"❌ Telegram API error: {error_description}")
-                if 'chat not found' in error_description.lower():
-                    logger.error("❌ المشكلة: Chat ID غير صحيح أو البوت غير عضو في المجموعة!")
-                    logger.error("💡 الحل: أضف البوت إلى المجموعة مرة أخرى")
-                elif 'bot was blocked' in error_description.lower() or 'kicked' in error_description.lower():
-                    _bot_kicked_chats.add(chat_id_str)
-                    logger.error("❌ المشكلة: البوت تم طرده من المجموعة!")
-                    logger.error("💡 الحل: أضف البوت إلى المجموعة مرة أخرى من إعدادات المجموعة")
-                    logger.error("💡 لمنع الطرد: تأكد من أن البوت لديه صلاحية 'Send Messages' في إعدادات المجموعة")
-                    return False
-                elif 'too many requests' in error_description.lower() or 'flood' in error_description.lower():
-                    logger.error("❌ المشكلة: إرسال رسائل كثيرة جداً (Rate Limit)!")
-                    logger.error("💡 الحل: البوت سيقلل من سرعة الإرسال تلقائياً")
-                    # زيادة التأخير مؤقتاً بشكل تدريجي
-                    _min_delay_between_messages = min(_min_delay_between_messages * 2.0, 5.0)  # حد أقصى 5 ثواني
-                    # إعادة المحاولة بعد التأخير
-                    if retry_count < _max_retries:
-                        wait_time = _min_delay_between_messages * (retry_count + 1) + 10  # إضافة 10 ثواني إضافية
-                        logger.info(f"⏳ انتظار {wait_time:.1f} ثانية قبل إعادة المحاولة...")
-                        time.sleep(wait_time)
-                        return send_message(message, chat_id, retry_count + 1)
-                return False
-        else:
-            logger.error(f"❌ HTTP Error {response.status_code}: {response.text}")
+            
+            error_description = result.get('description', 'Unknown error')
+            logger.error(f"❌ Telegram API error ({response.status_code}): {error_description}")
+            
+            # Rate limit: Telegram يحدد بالضبط متى يمكن الإرسال مرة أخرى
+            retry_after = parse_retry_after(result)
+            if retry_after is not None or response.status_code == 429:
+                logger.error("❌ المشكلة: إرسال رسائل كثيرة جداً (Rate Limit)!")
+                if attempt >= _max_retries:
+                    break
+                rate_limiter.backoff(chat_id_str, retry_after if retry_after is not None else 1.0)
+                logger.info(f"⏳ إعادة المحاولة بعد retry_after ({attempt + 1}/{_max_retries})...")
+                continue
+            
+            if _is_membership_error(error_description):
+                chat_health.record_kicked(chat_id_str, error_description)
+            if 'chat not found' in error_description.lower():
+                logger.error("❌ المشكلة: Chat ID غير صحيح أو البوت غير عضو في المجموعة!")
+                logger.error("💡 الحل: أضف البوت إلى المجموعة مرة أخرى")
+            elif 'bot was blocked' in error_description.lower() or 'kicked' in error_description.lower():
+                logger.error("❌ المشكلة: البوت تم طرده من المجموعة!")
+                logger.error("💡 الحل: أضف البوت إلى المجموعة مرة أخرى من إعدادات المجموعة")
+                logger.error("💡 لمنع الطرد: تأكد من أن البوت لديه صلاحية 'Send Messages' في إعدادات المجموعة")
             return False
+        
+        return False
             
     except requests.exceptions.RequestException as e:
         logger.error(f"❌ Network error sending message: {e}")
@@ -241,368 +349,175 @@ def calculate_tp_sl(entry_price: float, is_long: bool = True) -> dict:
     
     return {"tp1": tp1, "tp2": tp2, "tp3": tp3, "stop_loss": stop_loss}
 
-def format_buy_signal(data: dict) -> str:
-    """تنسيق إشارة الشراء (صفقة لونج)"""
-    symbol = data.get('symbol', 'N/A')
-    entry_price = data.get('entry_price') or data.get('price', 0)
-    tp1 = data.get('tp1')
-    tp2 = data.get('tp2')
-    tp3 = data.get('tp3')
-    stop_loss = data.get('stop_loss')
-    time = data.get('time', 'N/A')
-    timeframe = data.get('timeframe', 'N/A')
+# قوالب الرسائل (تُجمَّع مرة واحدة): h = escape_html, p = format_price, t = format_timeframe (+ escape_html)
+_CONVERTERS = {
+    'h': escape_html,
+    'p': format_price,
+    't': lambda timeframe: escape_html(format_timeframe(timeframe)),
+}
+
+_ENTRY_HEADERS = {
+    'BUY': "🟢 <b>صفقة لونج (LONG)</b> 🟢\n\n",
+    'SELL': "🔴 <b>صفقة شورت (SHORT)</b> 🔴\n\n",
+    'BUY_REVERSE': "🟠 <b>صفقة لونج عكسي (LONG REVERSE)</b> 🟠\n⚠️ <b>تم عكس الصفقة</b>\n\n",
+    'SELL_REVERSE': "🟠 <b>صفقة شورت عكسي (SHORT REVERSE)</b> 🟠\n⚠️ <b>تم عكس الصفقة</b>\n\n",
+}
+
+_ENTRY_BODY = Template(
+    "📊 الرمز: {symbol!h}\n"
+    "💰 سعر الدخول: <code>{entry_price!p}</code>\n"
+    "⏰ الوقت: {time!h}\n"
+    "📈 الإطار الزمني: {timeframe!t}\n"
+    "\n",
+    _CONVERTERS
+)
+
+_ENTRY_TARGETS = Template(
+    "🎯 <b>أهداف الربح:</b>\n"
+    "?🎯 TP1: <code>{tp1!p}</code>\n"
+    "?🎯 TP2: <code>{tp2!p}</code>\n"
+    "?🎯 TP3: <code>{tp3!p}</code>\n"
+    "\n"
+    "?🛑 وقف الخسارة: <code>{stop_loss!p}</code>",
+    _CONVERTERS
+)
+
+# إذا لم تكن TP/SL موجودة ولا يمكن حسابها
+_ENTRY_NO_TARGETS = Template(
+    "⚠️ <i>ملاحظة: TP/SL غير متاحة</i>\n"
+    "💡 <i>الحل: تأكد من أسماء الـ plots في التنبيه</i>\n"
+    "📝 <i>الأسماء الشائعة: \"TP Line 1\", \"TP1\", \"SL Line\", \"Stop Loss\"</i>"
+)
+
+def _exit_template(header: str, target_label: str) -> Template:
+    return Template(
+        header + "\n"
+        "\n"
+        "📊 الرمز: {symbol!h}\n"
+        "?💰 سعر الدخول: <code>{entry_price!p}</code>\n"
+        "?💰 سعر الخروج: <code>{exit_price!p}</code>\n"
+        "?" + target_label + ": <code>{target!p}</code>\n"
+        "⏰ الوقت: {time!h}",
+        _CONVERTERS
+    )
+
+# (القالب, حقل الهدف في التنبيه)
+_EXIT_TEMPLATES = {
+    'TP1': (_exit_template("🎯✅ <b>تم ضرب الهدف الأول (TP1)</b> ✅🎯", "🎯 TP1"), 'tp1'),
+    'TP2': (_exit_template("🎯✅ <b>تم ضرب الهدف الثاني (TP2)</b> ✅🎯", "🎯 TP2"), 'tp2'),
+    'TP3': (_exit_template("🚀🚀🚀 <b>تم ضرب الهدف الثالث (TP3)</b> 🚀🚀🚀", "🎯 TP3"), 'tp3'),
+    'SL': (_exit_template("🛑😔 <b>تم ضرب وقف الخسارة (Stop Loss)</b> 😔🛑", "🛑 Stop Loss"), 'stop_loss'),
+}
+
+def _format_entry(data: dict, signal: str, is_long: bool) -> str:
+    """تنسيق إشارات الدخول (لونج/شورت والعكسي) من القالب"""
+    values = {
+        'symbol': data.get('symbol', 'N/A'),
+        'entry_price': data.get('entry_price') or data.get('price', 0),
+        'time': data.get('time', 'N/A'),
+        'timeframe': data.get('timeframe', 'N/A'),
+        'tp1': data.get('tp1'),
+        'tp2': data.get('tp2'),
+        'tp3': data.get('tp3'),
+        'stop_loss': data.get('stop_loss'),
+    }
+    entry_price = values['entry_price']
     
     # إذا لم تكن TP/SL موجودة، حسابها بناءً على entry_price
-    if not (tp1 or tp2 or tp3 or stop_loss) and entry_price:
+    has_tp_sl = values['tp1'] or values['tp2'] or values['tp3'] or values['stop_loss']
+    if not has_tp_sl and entry_price:
         try:
-            calculated = calculate_tp_sl(float(entry_price), is_long=True)
-            tp1 = calculated['tp1']
-            tp2 = calculated['tp2']
-            tp3 = calculated['tp3']
-            stop_loss = calculated['stop_loss']
-        except:
+            values.update(calculate_tp_sl(float(entry_price), is_long=is_long))
+            has_tp_sl = True
+        except (ValueError, TypeError):
             pass
     
-    message = f"🟢 <b>صفقة لونج (LONG)</b> 🟢\n\n"
-    message += f"📊 الرمز: {escape_html(symbol)}\n"
-    message += f"💰 سعر الدخول: <code>{format_price(entry_price)}</code>\n"
-    message += f"⏰ الوقت: {escape_html(time)}\n"
-    message += f"📈 الإطار الزمني: {escape_html(format_timeframe(timeframe))}\n\n"
-    
-    # عرض TP/SL المتاحة
-    has_tp_sl = tp1 or tp2 or tp3 or stop_loss
-    if has_tp_sl:
-        message += f"🎯 <b>أهداف الربح:</b>\n"
-        if tp1:
-            message += f"🎯 TP1: <code>{format_price(float(tp1))}</code>\n"
-        if tp2:
-            message += f"🎯 TP2: <code>{format_price(float(tp2))}</code>\n"
-        if tp3:
-            message += f"🎯 TP3: <code>{format_price(float(tp3))}</code>\n"
-        message += "\n"
-        if stop_loss:
-            message += f"🛑 وقف الخسارة: <code>{format_price(float(stop_loss))}</code>"
-    else:
-        # إذا لم تكن TP/SL موجودة، أضف رسالة توضيحية
-        message += f"⚠️ <i>ملاحظة: TP/SL غير متاحة</i>\n"
-        message += f"💡 <i>الحل: تأكد من أسماء الـ plots في التنبيه</i>\n"
-        message += f"📝 <i>الأسماء الشائعة: \"TP Line 1\", \"TP1\", \"SL Line\", \"Stop Loss\"</i>"
-    
-    return message
+    return _ENTRY_HEADERS[signal] + render(values, _ENTRY_BODY, _ENTRY_TARGETS if has_tp_sl else _ENTRY_NO_TARGETS)
 
-def format_sell_signal(data: dict) -> str:
-    """تنسيق إشارة البيع (صفقة شورت)"""
-    symbol = data.get('symbol', 'N/A')
-    entry_price = data.get('entry_price') or data.get('price', 0)
-    tp1 = data.get('tp1')
-    tp2 = data.get('tp2')
-    tp3 = data.get('tp3')
-    stop_loss = data.get('stop_loss')
-    time = data.get('time', 'N/A')
-    timeframe = data.get('timeframe', 'N/A')
+def _format_exit(data: dict, signal: str) -> str:
+    """تنسيق رسائل ضرب TP1/TP2/TP3/SL من القالب"""
+    template, target_field = _EXIT_TEMPLATES[signal]
+    entry_price = data.get('entry_price', 0)
+    target = data.get(target_field)
+    exit_price = data.get('exit_price') or data.get('price', 0)
     
-    # إذا لم تكن TP/SL موجودة، حسابها بناءً على entry_price
-    if not (tp1 or tp2 or tp3 or stop_loss) and entry_price:
+    # تحسين: إذا كان exit_price = entry_price، استخدم الهدف (أو وقف الخسارة)
+    if exit_price and entry_price:
         try:
-            calculated = calculate_tp_sl(float(entry_price), is_long=False)
-            tp1 = calculated['tp1']
-            tp2 = calculated['tp2']
-            tp3 = calculated['tp3']
-            stop_loss = calculated['stop_loss']
-        except:
+            if abs(float(exit_price) - float(entry_price)) < 0.01:  # تقريباً نفس القيمة
+                if target:
+                    exit_price = target
+                    logger.info(f"✅ {signal} Hit: تم استخدام {signal} كسعر خروج لأن exit_price = entry_price")
+        except (ValueError, TypeError):
             pass
     
-    message = f"🔴 <b>صفقة شورت (SHORT)</b> 🔴\n\n"
-    message += f"📊 الرمز: {escape_html(symbol)}\n"
-    message += f"💰 سعر الدخول: <code>{format_price(entry_price)}</code>\n"
-    message += f"⏰ الوقت: {escape_html(time)}\n"
-    message += f"📈 الإطار الزمني: {escape_html(format_timeframe(timeframe))}\n\n"
-    
-    # عرض TP/SL المتاحة
-    has_tp_sl = tp1 or tp2 or tp3 or stop_loss
-    if has_tp_sl:
-        message += f"🎯 <b>أهداف الربح:</b>\n"
-        if tp1:
-            message += f"🎯 TP1: <code>{format_price(float(tp1))}</code>\n"
-        if tp2:
-            message += f"🎯 TP2: <code>{format_price(float(tp2))}</code>\n"
-        if tp3:
-            message += f"🎯 TP3: <code>{format_price(float(tp3))}</code>\n"
-        message += "\n"
-        if stop_loss:
-            message += f"🛑 وقف الخسارة: <code>{format_price(float(stop_loss))}</code>"
-    else:
-        message += f"⚠️ <i>ملاحظة: TP/SL غير متاحة</i>\n"
-        message += f"💡 <i>الحل: تأكد من أسماء الـ plots في التنبيه</i>\n"
-        message += f"📝 <i>الأسماء الشائعة: \"TP Line 1\", \"TP1\", \"SL Line\", \"Stop Loss\"</i>"
-    
-    return message
+    return template.render({
+        'symbol': data.get('symbol', 'N/A'),
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        # عرض الهدف دائماً إذا كان موجوداً، وإلا سعر الخروج
+        'target': target or exit_price,
+        'time': data.get('time', 'N/A'),
+    })
+
+def format_buy_signal(data: dict) -> str:
+    """تنسيق إشارة الشراء (صفقة لونج)"""
+    return _format_entry(data, 'BUY', is_long=True)
+
+def format_sell_signal(data: dict) -> str:
+    """تنسيق إشارة البيع (صفقة شورت)"""
+    return _format_entry(data, 'SELL', is_long=False)
 
 def format_buy_reverse_signal(data: dict) -> str:
     """تنسيق إشارة الشراء العكسية (لونج عكسي)"""
-    symbol = data.get('symbol', 'N/A')
-    entry_price = data.get('entry_price') or data.get('price', 0)
-    tp1 = data.get('tp1')
-    tp2 = data.get('tp2')
-    tp3 = data.get('tp3')
-    stop_loss = data.get('stop_loss')
-    time = data.get('time', 'N/A')
-    timeframe = data.get('timeframe', 'N/A')
-    
-    # إذا لم تكن TP/SL موجودة، حسابها بناءً على entry_price
-    if not (tp1 or tp2 or tp3 or stop_loss) and entry_price:
-        try:
-            calculated = calculate_tp_sl(float(entry_price), is_long=True)
-            tp1 = calculated['tp1']
-            tp2 = calculated['tp2']
-            tp3 = calculated['tp3']
-            stop_loss = calculated['stop_loss']
-        except:
-            pass
-    
-    message = f"🟠 <b>صفقة لونج عكسي (LONG REVERSE)</b> 🟠\n"
-    message += f"⚠️ <b>تم عكس الصفقة</b>\n\n"
-    message += f"📊 الرمز: {escape_html(symbol)}\n"
-    message += f"💰 سعر الدخول: <code>{format_price(entry_price)}</code>\n"
-    message += f"⏰ الوقت: {escape_html(time)}\n"
-    message += f"📈 الإطار الزمني: {escape_html(format_timeframe(timeframe))}\n\n"
-    
-    # عرض TP/SL المتاحة
-    has_tp_sl = tp1 or tp2 or tp3 or stop_loss
-    if has_tp_sl:
-        message += f"🎯 <b>أهداف الربح:</b>\n"
-        if tp1:
-            message += f"🎯 TP1: <code>{format_price(float(tp1))}</code>\n"
-        if tp2:
-            message += f"🎯 TP2: <code>{format_price(float(tp2))}</code>\n"
-        if tp3:
-            message += f"🎯 TP3: <code>{format_price(float(tp3))}</code>\n"
-        message += "\n"
-        if stop_loss:
-            message += f"🛑 وقف الخسارة: <code>{format_price(float(stop_loss))}</code>"
-    else:
-        message += f"⚠️ <i>ملاحظة: TP/SL غير متاحة</i>\n"
-        message += f"💡 <i>الحل: تأكد من أسماء الـ plots في التنبيه</i>\n"
-        message += f"📝 <i>الأسماء الشائعة: \"TP Line 1\", \"TP1\", \"SL Line\", \"Stop Loss\"</i>"
-    
-    return message
+    return _format_entry(data, 'BUY_REVERSE', is_long=True)
 
 def format_sell_reverse_signal(data: dict) -> str:
     """تنسيق إشارة البيع العكسية (شورت عكسي)"""
-    symbol = data.get('symbol', 'N/A')
-    entry_price = data.get('entry_price') or data.get('price', 0)
-    tp1 = data.get('tp1')
-    tp2 = data.get('tp2')
-    tp3 = data.get('tp3')
-    stop_loss = data.get('stop_loss')
-    time = data.get('time', 'N/A')
-    timeframe = data.get('timeframe', 'N/A')
-    
-    # إذا لم تكن TP/SL موجودة، حسابها بناءً على entry_price
-    if not (tp1 or tp2 or tp3 or stop_loss) and entry_price:
-        try:
-            calculated = calculate_tp_sl(float(entry_price), is_long=False)
-            tp1 = calculated['tp1']
-            tp2 = calculated['tp2']
-            tp3 = calculated['tp3']
-            stop_loss = calculated['stop_loss']
-        except:
-            pass
-    
-    message = f"🟠 <b>صفقة شورت عكسي (SHORT REVERSE)</b> 🟠\n"
-    message += f"⚠️ <b>تم عكس الصفقة</b>\n\n"
-    message += f"📊 الرمز: {escape_html(symbol)}\n"
-    message += f"💰 سعر الدخول: <code>{format_price(entry_price)}</code>\n"
-    message += f"⏰ الوقت: {escape_html(time)}\n"
-    message += f"📈 الإطار الزمني: {escape_html(format_timeframe(timeframe))}\n\n"
-    
-    # عرض TP/SL المتاحة
-    has_tp_sl = tp1 or tp2 or tp3 or stop_loss
-    if has_tp_sl:
-        message += f"🎯 <b>أهداف الربح:</b>\n"
-        if tp1:
-            message += f"🎯 TP1: <code>{format_price(float(tp1))}</code>\n"
-        if tp2:
-            message += f"🎯 TP2: <code>{format_price(float(tp2))}</code>\n"
-        if tp3:
-            message += f"🎯 TP3: <code>{format_price(float(tp3))}</code>\n"
-        message += "\n"
-        if stop_loss:
-            message += f"🛑 وقف الخسارة: <code>{format_price(float(stop_loss))}</code>"
-    else:
-        message += f"⚠️ <i>ملاحظة: TP/SL غير متاحة</i>\n"
-        message += f"💡 <i>الحل: تأكد من أسماء الـ plots في التنبيه</i>\n"
-        message += f"📝 <i>الأسماء الشائعة: \"TP Line 1\", \"TP1\", \"SL Line\", \"Stop Loss\"</i>"
-    
-    return message
+    return _format_entry(data, 'SELL_REVERSE', is_long=False)
 
 def format_tp1_hit(data: dict) -> str:
     """تنسيق رسالة ضرب الهدف الأول"""
-    symbol = data.get('symbol', 'N/A')
-    entry_price = data.get('entry_price', 0)
-    tp1 = data.get('tp1')
-    exit_price = data.get('exit_price') or data.get('price', 0)
-    time = data.get('time', 'N/A')
-    
-    # تحسين: إذا كان exit_price = entry_price، استخدم tp1
-    if exit_price and entry_price:
-        try:
-            if abs(float(exit_price) - float(entry_price)) < 0.01:  # تقريباً نفس القيمة
-                if tp1:
-                    exit_price = tp1
-                    logger.info(f"✅ TP1 Hit: تم استخدام TP1 كسعر خروج لأن exit_price = entry_price")
-        except (ValueError, TypeError):
-            pass
-    
-    message = f"🎯✅ <b>تم ضرب الهدف الأول (TP1)</b> ✅🎯\n\n"
-    message += f"📊 الرمز: {escape_html(symbol)}\n"
-    
-    # عرض سعر الدخول دائماً إذا كان موجوداً
-    if entry_price:
-        message += f"💰 سعر الدخول: <code>{format_price(entry_price)}</code>\n"
-    
-    # عرض سعر الخروج
-    if exit_price:
-        message += f"💰 سعر الخروج: <code>{format_price(exit_price)}</code>\n"
-    
-    # عرض TP1 دائماً إذا كان موجوداً أو يمكن حسابه
-    if tp1:
-        message += f"🎯 TP1: <code>{format_price(float(tp1))}</code>\n"
-    elif exit_price:
-        # إذا لم يكن tp1 موجوداً، استخدم exit_price كـ TP1
-        message += f"🎯 TP1: <code>{format_price(exit_price)}</code>\n"
-    
-    message += f"⏰ الوقت: {escape_html(time)}"
-    
-    return message
+    return _format_exit(data, 'TP1')
 
 def format_tp2_hit(data: dict) -> str:
     """تنسيق رسالة ضرب الهدف الثاني"""
-    symbol = data.get('symbol', 'N/A')
-    entry_price = data.get('entry_price', 0)
-    tp2 = data.get('tp2')
-    exit_price = data.get('exit_price') or data.get('price', 0)
-    time = data.get('time', 'N/A')
-    
-    # تحسين: إذا كان exit_price = entry_price، استخدم tp2
-    if exit_price and entry_price:
-        try:
-            if abs(float(exit_price) - float(entry_price)) < 0.01:
-                if tp2:
-                    exit_price = tp2
-                    logger.info(f"✅ TP2 Hit: تم استخدام TP2 كسعر خروج لأن exit_price = entry_price")
-        except (ValueError, TypeError):
-            pass
-    
-    message = f"🎯✅ <b>تم ضرب الهدف الثاني (TP2)</b> ✅🎯\n\n"
-    message += f"📊 الرمز: {escape_html(symbol)}\n"
-    
-    # عرض سعر الدخول دائماً إذا كان موجوداً
-    if entry_price:
-        message += f"💰 سعر الدخول: <code>{format_price(entry_price)}</code>\n"
-    
-    # عرض سعر الخروج
-    if exit_price:
-        message += f"💰 سعر الخروج: <code>{format_price(exit_price)}</code>\n"
-    
-    # عرض TP2 دائماً إذا كان موجوداً أو يمكن حسابه
-    if tp2:
-        message += f"🎯 TP2: <code>{format_price(float(tp2))}</code>\n"
-    elif exit_price:
-        # إذا لم يكن tp2 موجوداً، استخدم exit_price كـ TP2
-        message += f"🎯 TP2: <code>{format_price(exit_price)}</code>\n"
-    
-    message += f"⏰ الوقت: {escape_html(time)}"
-    
-    return message
+    return _format_exit(data, 'TP2')
 
 def format_tp3_hit(data: dict) -> str:
     """تنسيق رسالة ضرب الهدف الثالث"""
-    symbol = data.get('symbol', 'N/A')
-    entry_price = data.get('entry_price', 0)
-    tp3 = data.get('tp3')
-    exit_price = data.get('exit_price') or data.get('price', 0)
-    time = data.get('time', 'N/A')
-    
-    # تحسين: إذا كان exit_price = entry_price، استخدم tp3
-    if exit_price and entry_price:
-        try:
-            if abs(float(exit_price) - float(entry_price)) < 0.01:
-                if tp3:
-                    exit_price = tp3
-                    logger.info(f"✅ TP3 Hit: تم استخدام TP3 كسعر خروج لأن exit_price = entry_price")
-        except (ValueError, TypeError):
-            pass
-    
-    message = f"🚀🚀🚀 <b>تم ضرب الهدف الثالث (TP3)</b> 🚀🚀🚀\n\n"
-    message += f"📊 الرمز: {escape_html(symbol)}\n"
-    
-    # عرض سعر الدخول دائماً إذا كان موجوداً
-    if entry_price:
-        message += f"💰 سعر الدخول: <code>{format_price(entry_price)}</code>\n"
-    
-    # عرض سعر الخروج
-    if exit_price:
-        message += f"💰 سعر الخروج: <code>{format_price(exit_price)}</code>\n"
-    
-    # عرض TP3 دائماً إذا كان موجوداً أو يمكن حسابه
-    if tp3:
-        message += f"🎯 TP3: <code>{format_price(float(tp3))}</code>\n"
-    elif exit_price:
-        # إذا لم يكن tp3 موجوداً، استخدم exit_price كـ TP3
-        message += f"🎯 TP3: <code>{format_price(exit_price)}</code>\n"
-    
-    message += f"⏰ الوقت: {escape_html(time)}"
-    
-    return message
+    return _format_exit(data, 'TP3')
 
 def format_stop_loss_hit(data: dict) -> str:
     """تنسيق رسالة ضرب وقف الخسارة"""
-    symbol = data.get('symbol', 'N/A')
-    entry_price = data.get('entry_price', 0)
-    stop_loss = data.get('stop_loss')
-    exit_price = data.get('exit_price') or data.get('price', 0)
-    time = data.get('time', 'N/A')
-    
-    # تحسين: إذا كان exit_price = entry_price، استخدم stop_loss
-    if exit_price and entry_price:
-        try:
-            if abs(float(exit_price) - float(entry_price)) < 0.01:
-                if stop_loss:
-                    exit_price = stop_loss
-                    logger.info(f"✅ SL Hit: تم استخدام SL كسعر خروج لأن exit_price = entry_price")
-        except (ValueError, TypeError):
-            pass
-    
-    message = f"🛑😔 <b>تم ضرب وقف الخسارة (Stop Loss)</b> 😔🛑\n\n"
-    message += f"📊 الرمز: {escape_html(symbol)}\n"
-    
-    # عرض سعر الدخول دائماً إذا كان موجوداً
-    if entry_price:
-        message += f"💰 سعر الدخول: <code>{format_price(entry_price)}</code>\n"
-    
-    # عرض سعر الخروج
-    if exit_price:
-        message += f"💰 سعر الخروج: <code>{format_price(exit_price)}</code>\n"
-    
-    # عرض Stop Loss دائماً إذا كان موجوداً أو يمكن حسابه
-    if stop_loss:
-        message += f"🛑 Stop Loss: <code>{format_price(float(stop_loss))}</code>\n"
-    elif exit_price:
-        # إذا لم يكن stop_loss موجوداً، استخدم exit_price كـ Stop Loss
-        message += f"🛑 Stop Loss: <code>{format_price(exit_price)}</code>\n"
-    
-    message += f"⏰ الوقت: {escape_html(time)}"
-    
-    return message
+    return _format_exit(data, 'SL')
 
-def send_message_to_all_groups(message: str, chat_ids: list = None) -> dict:
+def create_outbox(send_fn):
+    """
+    Outbox لدالة إرسال لمجموعة واحدة
+    المجموعات التي طُرد منها البوت لا يُعاد الإرسال إليها
+    """
+    if not OUTBOX_ENABLED:
+        return None
+    return Outbox(
+        OUTBOX_DB_FILE, send_fn, fan_out_message,
+        should_retry=check_bot_status,
+        max_age=OUTBOX_MAX_AGE,
+        max_attempts=OUTBOX_MAX_ATTEMPTS,
+        backoff_base=OUTBOX_RETRY_BASE,
+        backoff_max=OUTBOX_RETRY_MAX,
+        lease=OUTBOX_LEASE
+    )
+
+
+def send_message_to_all_groups(message: str, chat_ids: list = None, wait: bool = True):
     """
     إرسال رسالة لجميع المجموعات المحددة
     
     Args:
         message: الرسالة المراد إرسالها
         chat_ids: قائمة Chat IDs (إذا لم تُحدد، سيتم استخدام القائمة من config.py)
+        wait: False = الرجوع بـ Future بعد وضع الرسالة في مسار كل مجموعة (للطابور والدمج)
     
     Returns:
         dict: نتائج الإرسال لكل مجموعة
@@ -631,36 +546,89 @@ def send_message_to_all_groups(message: str, chat_ids: list = None) -> dict:
             'results': {}
         }
     
-    results = {}
-    success_count = 0
-    failed_count = 0
+    logger.info(f"📤 إرسال الرسالة إلى {len(target_chat_ids)} مجموعة/مجموعات (بالتوازي)")
     
-    logger.info(f"📤 إرسال الرسالة إلى {len(target_chat_ids)} مجموعة/مجموعات")
+    # كل (رسالة، مجموعة) تُسجل في الـ outbox قبل الإرسال - الفاشلة يُعاد إرسالها في الخلفية
+    outbox = get_outbox()
+    if outbox is not None:
+        result = outbox.send(message, target_chat_ids, wait=wait)
+    else:
+        result = fan_out_message(send_message, message, target_chat_ids, wait=wait)
     
-    for chat_id in target_chat_ids:
-        chat_id_str = str(chat_id).strip()
-        if not chat_id_str:
-            continue
-            
-        logger.info(f"📤 محاولة الإرسال إلى المجموعة: {chat_id_str}")
-        success = send_message(message, chat_id_str)
-        results[chat_id_str] = success
-        
+    if not wait:
+        result.add_done_callback(lambda future: _log_send_summary(future.result()))
+        return result
+    _log_send_summary(result)
+    return result
+
+def _log_send_summary(result: dict):
+    for chat_id_str, success in result['results'].items():
         if success:
-            success_count += 1
             logger.info(f"✅ تم الإرسال بنجاح إلى {chat_id_str}")
         else:
-            failed_count += 1
             logger.warning(f"⚠️ فشل الإرسال إلى {chat_id_str}")
     
-    logger.info(f"📊 ملخص الإرسال: نجح {success_count}/{len(target_chat_ids)}, فشل {failed_count}/{len(target_chat_ids)}")
-    
-    return {
-        'total': len(target_chat_ids),
-        'success': success_count,
-        'failed': failed_count,
-        'results': results
-    }
+    logger.info(f"📊 ملخص الإرسال: نجح {result['success']}/{result['total']}, فشل {result['failed']}/{result['total']}")
+
+_outbox = None
+_outbox_created = False
+_outbox_lock = threading.Lock()
+
+def get_outbox():
+    """
+    الـ outbox المشترك للعملية (يُنشأ عند أول استدعاء، None إذا كان معطلاً)
+    main.py و app.py و async_app.py يستخدمون نفس النسخة: نسختان على نفس الجدول لكل منهما حالة
+    حجز وإرسالات جارية منفصلة، وواحدة فقط تُفرغ عند الإيقاف
+    إعادة المحاولة في الخلفية عبر send_message؛ الإرسال الأول يمكن أن يمر بدالة أخرى (Outbox.send(send_fn=...))
+    """
+    global _outbox, _outbox_created
+    if not _outbox_created:
+        with _outbox_lock:
+            if not _outbox_created:
+                _outbox = create_outbox(send_message)
+                _outbox_created = True
+    return _outbox
+
+# ردود أوامر البوت (/telegram-webhook في main.py و async_app.py)
+BOT_COMMAND_REPLIES = {
+    '/start': (
+        "🤖 <b>مرحباً! أنا بوت إشارات التداول</b>\n\n"
+        "✅ البوت يعمل بشكل صحيح\n"
+        "📊 سأرسل إشارات التداول من TradingView تلقائياً\n\n"
+        "💡 <b>الأوامر المتاحة:</b>\n"
+        "/start - عرض هذه الرسالة\n"
+        "/help - عرض المساعدة\n"
+        "/status - حالة البوت"
+    ),
+    '/help': (
+        "📖 <b>مساعدة - بوت إشارات التداول</b>\n\n"
+        "🔹 <b>كيف يعمل البوت:</b>\n"
+        "• يستقبل إشارات من TradingView\n"
+        "• يرسل إشارات التداول تلقائياً\n"
+        "• يعرض TP/SL والأسعار\n\n"
+        "🔹 <b>أنواع الإشارات:</b>\n"
+        "• 🟢 صفقة لونج (BUY)\n"
+        "• 🔴 صفقة شورت (SELL)\n"
+        "• 🟠 صفقات عكسية (REVERSE)\n"
+        "• 🎯 أهداف الربح (TP1, TP2, TP3)\n"
+        "• 🛑 وقف الخسارة (SL)\n\n"
+        "💡 البوت يعمل تلقائياً، لا حاجة لإرسال أوامر!"
+    ),
+    '/status': (
+        "✅ <b>حالة البوت: نشط</b>\n\n"
+        "🤖 البوت يعمل بشكل صحيح\n"
+        "📊 جاهز لاستقبال الإشارات من TradingView\n"
+        "⚡ Rate limiting: مفعّل\n"
+        "🔒 حماية من spam: مفعّلة"
+    ),
+}
+
+def command_reply(text: str):
+    """نص الرد على أمر (/start, /help, /status) - None إذا لم يكن أمراً معروفاً"""
+    for command, reply in BOT_COMMAND_REPLIES.items():
+        if text.startswith(command):
+            return reply
+    return None
 
 def send_startup_message() -> bool:
     """إرسال رسالة بدء التشغيل لجميع المجموعات"""
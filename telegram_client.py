@@ -0,0 +1,175 @@
+"""
+Telegram API Client - عميل HTTP مشترك لجميع طلبات Telegram
+جلسة requests واحدة لكل worker مع مجمع اتصالات keep-alive، بدلاً من اتصال TCP+TLS جديد لكل رسالة
+"""
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_API_BASE_URL,
+    TELEGRAM_POOL_SIZE,
+    TELEGRAM_CONNECT_TIMEOUT,
+    TELEGRAM_READ_TIMEOUT
+)
+from metrics import TELEGRAM_REQUEST_SECONDS, TELEGRAM_RESPONSES_TOTAL, TELEGRAM_RATE_LIMITED_TOTAL
+
+logger = logging.getLogger(__name__)
+
+_JSON_HEADERS = {'Content-Type': 'application/json; charset=utf-8'}
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    الجلسة المشتركة (تُنشأ من جديد داخل كل worker بعد fork حتى لا تُشارك الاتصالات بين العمليات)
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=TELEGRAM_POOL_SIZE,
+                    pool_maxsize=TELEGRAM_POOL_SIZE,
+                    pool_block=False
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+                _session_pid = pid
+                logger.info(f"🔌 تم إنشاء جلسة Telegram (pool={TELEGRAM_POOL_SIZE})")
+    return _session
+
+
+def encode_payload(payload: dict) -> bytes:
+    """تحويل الطلب إلى JSON مرة واحدة (بدون ensure_ascii لتقليل حجم النص العربي)"""
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+@lru_cache(maxsize=64)
+def _encode_message_tail(text: str, parse_mode: str) -> bytes:
+    """
+    جزء الطلب المشترك بين كل المجموعات (النص + parse_mode) يُحوَّل إلى JSON مرة واحدة لكل رسالة
+    الناتج يبدأ بـ ',' ليُلصق بعد chat_id
+    """
+    return b',' + encode_payload({"text": text, "parse_mode": parse_mode})[1:]
+
+
+def encode_message(chat_id: str, text: str, parse_mode: str = 'HTML') -> bytes:
+    """جسم sendMessage جاهز: chat_id + الجزء المشترك المحفوظ مسبقاً"""
+    return b'{"chat_id":' + encode_payload(str(chat_id)) + _encode_message_tail(text, parse_mode)
+
+
+def _observe(method: str, chat_id, started: float, status):
+    """زمن الطلب لكل مجموعة + حالة الرد (status = None عند خطأ شبكة/مهلة بدون رد)"""
+    chat_id = str(chat_id)
+    TELEGRAM_REQUEST_SECONDS.observe(time.perf_counter() - started, method, chat_id)
+    status = str(status) if status is not None else 'error'  # نص دائماً: لا مقارنة بين int و str عند الترتيب
+    TELEGRAM_RESPONSES_TOTAL.inc(method, status)
+    if status == '429':
+        TELEGRAM_RATE_LIMITED_TOTAL.inc(chat_id)
+
+
+class TelegramClient:
+    """
+    عميل Bot API
+
+    Args:
+        token: توكن البوت
+        base_url: عنوان الـ API (يمكن توجيهه إلى خادم محلي للاختبار)
+        timeout: (connect, read) بالثواني
+    """
+
+    def __init__(self, token: str = TELEGRAM_BOT_TOKEN, base_url: str = TELEGRAM_API_BASE_URL,
+                 timeout: tuple = (TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT)):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._method_urls = {}
+
+    def method_url(self, method: str) -> str:
+        url = self._method_urls.get(method)
+        if url is None:
+            url = f"{self.base_url}/bot{self.token}/{method}"
+            self._method_urls[method] = url
+        return url
+
+    def post(self, method: str, payload: dict = None, body: bytes = None, timeout=None) -> requests.Response:
+        """
+        استدعاء method عبر POST
+
+        Args:
+            payload: dict يتم تحويله إلى JSON
+            body: JSON جاهز مسبقاً (bytes) - لإعادة استخدام نفس الجسم لعدة طلبات
+        """
+        if body is None:
+            body = encode_payload(payload or {})
+        return get_session().post(
+            self.method_url(method),
+            data=body,
+            headers=_JSON_HEADERS,
+            timeout=timeout or self.timeout
+        )
+
+    def get(self, method: str, params: dict = None, timeout=None) -> requests.Response:
+        """استدعاء method عبر GET"""
+        return get_session().get(self.method_url(method), params=params, timeout=timeout or self.timeout)
+
+    def send_message(self, chat_id: str, text: str, parse_mode: str = 'HTML', body: bytes = None, **extra) -> requests.Response:
+        """sendMessage"""
+        if body is None:
+            if extra:
+                payload = {"chat_id": str(chat_id), "text": text, "parse_mode": parse_mode}
+                payload.update(extra)
+                body = encode_payload(payload)
+            else:
+                body = encode_message(chat_id, text, parse_mode)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self.post('sendMessage', body=body)
+            return response
+        finally:
+            _observe('sendMessage', chat_id, started, response.status_code if response is not None else None)
+
+    def edit_message_text(self, chat_id: str, message_id: int, text: str, parse_mode: str = 'HTML') -> requests.Response:
+        """editMessageText"""
+        body = encode_payload({"chat_id": str(chat_id), "message_id": message_id, "text": text, "parse_mode": parse_mode})
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self.post('editMessageText', body=body)
+            return response
+        finally:
+            _observe('editMessageText', chat_id, started, response.status_code if response is not None else None)
+
+    def get_chat(self, chat_id: str, timeout=None) -> requests.Response:
+        """getChat"""
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self.get('getChat', params={"chat_id": str(chat_id)}, timeout=timeout)
+            return response
+        finally:
+            _observe('getChat', chat_id, started, response.status_code if response is not None else None)
+
+    def get_me(self) -> requests.Response:
+        """getMe"""
+        return self.get('getMe')
+
+
+# العميل الافتراضي (توكن config.py)
+telegram_api = TelegramClient()
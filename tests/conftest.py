@@ -0,0 +1,24 @@
+"""
+إعداد مشترك للاختبارات: جذر المشروع في sys.path (الوحدات مسطحة في الجذر، مثل benchmarks/)
+
+    python -m pytest tests
+"""
+import multiprocessing
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# اختبارات السباق بين workers تستخدم fork مثل gunicorn (الاتصالات والخيوط تُنشأ من جديد بعد fork)
+FORK = multiprocessing.get_context('fork')
+
+
+def run_workers(target, args_list, timeout: float = 60):
+    """تشغيل target(*args) في عملية لكل عنصر والتأكد أن جميعها انتهت بنجاح"""
+    workers = [FORK.Process(target=target, args=args) for args in args_list]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout)
+        assert worker.exitcode == 0, f"worker exit code: {worker.exitcode}"
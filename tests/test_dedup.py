@@ -0,0 +1,36 @@
+"""
+منع التكرار بين workers (SQLiteDedupStore): الفحص والتسجيل في عبارة واحدة ذرية
+"""
+from conftest import FORK, run_workers
+from dedup import SQLiteDedupStore
+
+WORKERS = 8
+KEYS = [f'BUY:SYM{i}' for i in range(200)]
+
+
+def _race(db_path: str, barrier, winners):
+    store = SQLiteDedupStore(db_path)
+    barrier.wait()
+    for key in KEYS:
+        if store.check(key, 60) is None:
+            winners.put(key)
+
+
+def test_each_key_has_exactly_one_winner_across_processes(tmp_path):
+    db_path = str(tmp_path / 'dedup.db')
+    SQLiteDedupStore(db_path)  # إنشاء الجدول قبل السباق
+    barrier = FORK.Barrier(WORKERS)
+    winners = FORK.Queue()
+
+    run_workers(_race, [(db_path, barrier, winners)] * WORKERS)
+
+    won = [winners.get(timeout=5) for _ in range(len(KEYS))]
+    assert sorted(won) == sorted(KEYS)
+    assert winners.empty()
+
+
+def test_key_is_accepted_again_after_its_window(tmp_path):
+    store = SQLiteDedupStore(str(tmp_path / 'dedup.db'))
+    assert store.check('SL:BTC', 30, now=1000.0) is None
+    assert store.check('SL:BTC', 30, now=1010.0) == 10.0
+    assert store.check('SL:BTC', 30, now=1030.0) is None
@@ -0,0 +1,88 @@
+"""
+Outbox: رسالة انتظرت في مسار المجموعة أكثر من lease لا تُرسل مرتين
+(لا من خيط إعادة المحاولة في نفس العملية ولا من worker آخر)
+"""
+import time
+
+from conftest import FORK
+from delivery_lanes import ChatLanes
+from outbox import Outbox
+
+CHAT = '-100A'
+MESSAGES = [f'msg{i}' for i in range(1, 7)]
+# lease أقصر من انتظار الرسائل الأخيرة في المسار (6 × 0.6 ثانية)
+LEASE = 1.0
+SEND_DELAY = 0.6
+
+
+def _fan_out(lanes: ChatLanes):
+    """مثل fan_out_message: كل مجموعة في مسار FIFO"""
+    def fan_out(send_fn, message, chat_ids, wait=True):
+        futures = [lanes.submit(chat_id, send_fn, message, chat_id) for chat_id in chat_ids]
+        return [future.result() for future in futures] if wait else futures
+    return fan_out
+
+
+def _slow_sender(log_path: str):
+    def send(message, chat_id):
+        time.sleep(SEND_DELAY)
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(f'{message}\n')
+        return True
+    return send
+
+
+def _outbox(db_path: str, log_path: str) -> Outbox:
+    return Outbox(db_path, _slow_sender(log_path), _fan_out(ChatLanes()), lease=LEASE, poll_interval=0.05)
+
+
+def _delivered(log_path) -> list:
+    try:
+        with open(log_path, encoding='utf-8') as f:
+            return f.read().split()
+    except FileNotFoundError:
+        return []
+
+
+def _wait_sent(outbox: Outbox, futures, timeout: float = 30):
+    for future in futures:
+        future.result(timeout)
+    deadline = time.monotonic() + timeout
+    while outbox.pending() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def _retry_worker(db_path: str, log_path: str, seconds: float):
+    """worker آخر: خيط إعادة المحاولة فقط (يحجز السجلات التي انتهى حجزها)"""
+    outbox = _outbox(db_path, log_path)
+    outbox.replay()
+    time.sleep(seconds)
+    outbox.drain(timeout=5)
+
+
+def test_queued_rows_are_not_resent_by_own_retry_thread(tmp_path):
+    log_path = tmp_path / 'sent.log'
+    outbox = _outbox(str(tmp_path / 'outbox.db'), str(log_path))
+    futures = [future for message in MESSAGES for future in outbox.send(message, [CHAT], wait=False)]
+    _wait_sent(outbox, futures)
+    time.sleep(LEASE)
+
+    assert _delivered(log_path) == MESSAGES
+    assert outbox.pending() == 0
+
+
+def test_queued_rows_are_sent_once_across_workers(tmp_path):
+    db_path, log_path = str(tmp_path / 'outbox.db'), str(tmp_path / 'sent.log')
+    outbox = _outbox(db_path, log_path)
+    other = FORK.Process(target=_retry_worker, args=(db_path, log_path, len(MESSAGES) * SEND_DELAY + 2))
+    other.start()
+    try:
+        futures = [future for message in MESSAGES for future in outbox.send(message, [CHAT], wait=False)]
+        _wait_sent(outbox, futures)
+    finally:
+        other.join(30)
+    assert other.exitcode == 0
+
+    delivered = _delivered(log_path)
+    assert sorted(delivered) == sorted(MESSAGES)
+    assert outbox.pending() == 0
@@ -0,0 +1,48 @@
+"""
+مهام مرة واحدة لكل نشر (StartupTasks): worker واحد فقط ينفذها، والفشل يُعاد في الـ worker التالي
+"""
+from conftest import FORK, run_workers
+from startup import StartupTasks
+
+WORKERS = 4
+
+
+def _worker(lock_path: str, deployment_id: str, log_path: str, barrier, fail: bool = False):
+    def announce():
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(f'{deployment_id}\n')
+        return not fail
+
+    tasks = StartupTasks(lock_path, deployment_id=deployment_id)
+    tasks.add('announce', announce, once=True)
+    barrier.wait()
+    tasks.start()
+    tasks.join(30)
+
+
+def _announcements(log_path) -> list:
+    try:
+        with open(log_path, encoding='utf-8') as f:
+            return f.read().split()
+    except FileNotFoundError:
+        return []
+
+
+def test_one_announcement_per_deployment(tmp_path):
+    lock_path, log_path = str(tmp_path / 'startup.lock'), str(tmp_path / 'sent.log')
+    for deployment_id in ('deploy-1', 'deploy-1', 'deploy-2'):
+        # نفس النشر مرتين = إعادة تشغيل workers (لا إعادة للرسالة)
+        barrier = FORK.Barrier(WORKERS)
+        run_workers(_worker, [(lock_path, deployment_id, log_path, barrier)] * WORKERS)
+
+    assert _announcements(log_path) == ['deploy-1', 'deploy-2']
+
+
+def test_failed_announcement_is_retried_by_next_worker(tmp_path):
+    lock_path, log_path = str(tmp_path / 'startup.lock'), str(tmp_path / 'sent.log')
+    run_workers(_worker, [(lock_path, 'deploy-1', log_path, FORK.Barrier(1), True)])
+    assert _announcements(log_path) == ['deploy-1']
+
+    barrier = FORK.Barrier(WORKERS)
+    run_workers(_worker, [(lock_path, 'deploy-1', log_path, barrier)] * WORKERS)
+    assert _announcements(log_path) == ['deploy-1', 'deploy-1']
@@ -0,0 +1,110 @@
+"""
+Trade store بين عدة workers: كل worker له نسخته من التخزين على نفس الملف
+"""
+import time
+
+import pytest
+
+from conftest import FORK, run_workers
+from trade_store import JournalTradeStore, SQLiteTradeStore
+
+TRADES = 40
+WORKERS = 4
+# زمن بين البحث عن الصفقة وتحديثها (نافذة السباق بين workers)
+LOOKUP_DELAY = 0.01
+
+
+def _open_store(backend: str, path: str):
+    if backend == 'sqlite':
+        return SQLiteTradeStore(path)
+    return JournalTradeStore(path, fsync=False)
+
+
+@pytest.fixture(params=['sqlite', 'journal'])
+def store_factory(request, tmp_path):
+    path = str(tmp_path / ('trades.db' if request.param == 'sqlite' else 'trades.jsonl'))
+    return lambda: _open_store(request.param, path)
+
+
+def _open_trades(store, count: int = TRADES):
+    for i in range(count):
+        store.add({'id': f't{i}', 'symbol': f'SYM{i}', 'timeframe': '15', 'signal': 'BUY',
+                   'direction': 'long', 'status': 'open'})
+
+
+def _apply_events(store_factory, barrier, event: str):
+    """TP1 و TP2 لنفس الشمعة يصلان إلى workers مختلفين في نفس اللحظة"""
+    store = store_factory()
+    find_live_trade = store.find_live_trade
+
+    def slow_find(*args):
+        trade = find_live_trade(*args)
+        time.sleep(LOOKUP_DELAY)
+        return trade
+
+    store.find_live_trade = slow_find
+    for i in range(TRADES):
+        barrier.wait()
+        store.apply_event(f'SYM{i}', event, {'exit_price': 1}, timeframe='15', direction='long')
+
+
+def test_tp1_and_tp2_on_different_workers_never_regress(store_factory):
+    store = store_factory()
+    _open_trades(store)
+    barrier = FORK.Barrier(2)
+
+    run_workers(_apply_events, [(store_factory, barrier, 'TP2'), (store_factory, barrier, 'TP1')])
+
+    statuses = {trade['status'] for trade in store.all().values()}
+    assert statuses == {'tp2'}
+    assert store.find_live_trade('SYM0', '15', 'long')['status'] == 'tp2'
+    assert store.verify_stats()['consistent']
+
+
+def test_event_after_close_is_rejected(store_factory):
+    store = store_factory()
+    _open_trades(store, 1)
+    assert store.apply_event('SYM0', 'SL', {})[1] == 'sl'
+    trade, new_status = store.apply_event('SYM0', 'TP1', {})
+    assert trade is None and new_status is None
+    assert store.get('t0')['status'] == 'sl'
+
+
+def _write_trades(store_factory, barrier, worker: int):
+    """كل worker يضيف صفقاته ويغلق نصفها (group commit / سجل التغييرات مع كتابات متزامنة)"""
+    store = store_factory()
+    barrier.wait()
+    for i in range(TRADES):
+        trade_id = f'w{worker}-{i}'
+        store.add({'id': trade_id, 'symbol': f'SYM{i % 5}', 'timeframe': str(worker), 'signal': 'BUY',
+                   'direction': 'long', 'status': 'open'})
+        if i % 2:
+            store.update(trade_id, {'status': 'sl'})
+
+
+def test_concurrent_writers_converge(store_factory):
+    # نسخة أنشئت قبل الكتابات: تلتقطها من الملف (السجل أو trade_changes) بدلاً من إعادة القراءة
+    store = store_factory()
+    barrier = FORK.Barrier(WORKERS)
+
+    run_workers(_write_trades, [(store_factory, barrier, worker) for worker in range(WORKERS)])
+
+    stats = store.stats()
+    assert stats['total'] == WORKERS * TRADES
+    assert stats['open'] == stats['sl'] == WORKERS * TRADES // 2
+    assert store.verify_stats()['consistent']
+    assert store_factory().stats() == stats
+    # أحدث صفقة حية لـ SYM0 من worker 0: i زوجي (لم تُغلق) و i % 5 == 0
+    latest = max(i for i in range(0, TRADES, 2) if i % 5 == 0)
+    assert store.find_live_trade('SYM0', '0', 'long')['id'] == f'w0-{latest}'
+
+
+def test_sqlite_worker_behind_pruned_change_log_rebuilds(tmp_path):
+    path = str(tmp_path / 'trades.db')
+    idle = SQLiteTradeStore(path)
+    writer = SQLiteTradeStore(path, change_log_size=5, cleanup_interval=0)
+    _open_trades(writer, 20)
+
+    assert idle.stats()['open'] == 20
+    assert idle.verify_stats()['consistent']
+    assert idle.find_live_trade('SYM19', '15', 'long')['id'] == 't19'
@@ -0,0 +1,361 @@
+"""
+Trade Journal - سجل صفقات إلحاقي (append-only JSONL) بدلاً من إعادة كتابة trades.json بالكامل
+كل إضافة/تحديث = سطر واحد في نهاية الملف، والحالة الكاملة في الذاكرة
+الطلبات المتزامنة تتشارك fsync واحد (group commit)، والضغط (compaction) يتم في الخلفية
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TradeJournal:
+    """
+    Args:
+        path: ملف السجل (JSONL)
+        legacy_path: ملف trades.json القديم - يتم استيراده مرة واحدة إذا لم يكن السجل موجوداً
+        fsync: تفعيل fsync بعد كل دفعة كتابة
+        compact_min_events: الحد الأدنى لعدد الأسطر قبل التفكير في الضغط
+        compact_ratio: الضغط عندما يتجاوز عدد الأسطر (عدد الصفقات × هذه النسبة)
+        listener: كائن اختياري يُبلَّغ بكل تغيير (trade_changed(old, new)) وبإعادة البناء (reset())
+                  لإبقاء الفهارس المشتقة محدثة - حتى بالتغييرات القادمة من workers آخرين
+    """
+
+    def __init__(self, path: str, legacy_path: str = None, fsync: bool = True,
+                 compact_min_events: int = 1000, compact_ratio: float = 4.0, listener=None):
+        self.path = path
+        self._listener = listener
+        self.legacy_path = legacy_path
+        self._fsync = fsync
+        self._compact_min_events = compact_min_events
+        self._compact_ratio = compact_ratio
+        self._lock_path = f"{path}.lock"
+
+        self._trades = {}
+        self._order = []  # ids بترتيب الإضافة (للصفحات)
+        self._position = {}  # trade_id → موضعه في _order
+        self._events = 0  # عدد الأسطر في الملف الحالي
+        self._offset = 0  # موضع القراءة في الملف (لالتقاط ما كتبته العمليات الأخرى)
+        self._inode = None
+        self._fd = None
+        self._read_buffer = b''
+
+        # group commit
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._pending = []
+        self._next_seq = 1
+        self._committed_seq = 0
+        self._failed = []  # [(from_seq, to_seq)] للدفعات التي فشلت كتابتها
+        self._flushing = False
+        self._compacting = False
+        self._loaded = False
+
+    # ───────────────────────────── قراءة ─────────────────────────────
+
+    def _ensure_loaded(self):
+        """فتح السجل وتحميل الحالة (مرة واحدة) - يُستدعى تحت القفل"""
+        if self._loaded:
+            return
+        if not os.path.exists(self.path) and self.legacy_path and os.path.exists(self.legacy_path):
+            with open(self._lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # worker آخر ربما قام بالاستيراد أثناء انتظار القفل
+                if not os.path.exists(self.path):
+                    self._import_legacy()
+        self._reopen()
+        self._loaded = True
+
+    def _import_legacy(self):
+        """استيراد trades.json القديم إلى السجل (مرة واحدة)"""
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                trades = json.load(f)
+        except Exception as e:
+            logger.error(f"❌ فشل استيراد {self.legacy_path}: {e}")
+            return
+        self._write_compacted(trades)
+        logger.info(f"📦 تم استيراد {len(trades)} صفقة من {self.legacy_path} إلى {self.path}")
+
+    def _reopen(self):
+        """فتح الملف من جديد وإعادة بناء الحالة (عند البدء أو بعد ضغط قامت به عملية أخرى)"""
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._inode = os.fstat(self._fd).st_ino
+        self._trades = {}
+        self._order = []
+        self._position = {}
+        self._events = 0
+        self._offset = 0
+        self._read_buffer = b''
+        if self._listener is not None:
+            self._listener.reset()
+        self._catch_up()
+
+    def _catch_up(self):
+        """تطبيق الأسطر الجديدة في نهاية الملف (من هذه العملية أو من workers آخرين) - تحت القفل"""
+        # أثناء الكتابة لا نغلق الملف من تحت القائد - القائد نفسه يعيد الفتح إذا لزم
+        if not self._flushing:
+            try:
+                if os.stat(self.path).st_ino != self._inode:
+                    self._reopen()
+                    return
+            except FileNotFoundError:
+                pass
+        size = os.fstat(self._fd).st_size
+        if size <= self._offset:
+            return
+        chunk = os.pread(self._fd, size - self._offset, self._offset)
+        self._offset += len(chunk)
+        data = self._read_buffer + chunk
+        lines = data.split(b'\n')
+        self._read_buffer = lines.pop()  # سطر غير مكتمل (كتابة جارية)
+        for line in lines:
+            if line:
+                self._apply_line(line)
+
+    def _apply_line(self, line: bytes):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            logger.warning(f"⚠️ سطر تالف في {self.path} - تم تجاهله")
+            return
+        self._events += 1
+        op = event.get('op')
+        if op == 'put':
+            trade = event['trade']
+            old = self._trades.get(trade['id'])
+            self._trades[trade['id']] = trade
+            if old is None:
+                self._position[trade['id']] = len(self._order)
+                self._order.append(trade['id'])
+        elif op == 'update':
+            trade = self._trades.get(event['id'])
+            if trade is None:
+                return
+            old = dict(trade) if self._listener is not None else None
+            trade.update(event['fields'])
+        else:
+            return
+        if self._listener is not None:
+            self._listener.trade_changed(old, trade)
+
+    def refresh(self):
+        """التقاط التغييرات الجديدة فقط (بدون نسخ الحالة) - لتحديث الفهارس المشتقة قبل الاستعلام"""
+        with self._lock:
+            self._ensure_loaded()
+            self._catch_up()
+
+    def get(self, trade_id: str):
+        with self._lock:
+            self._ensure_loaded()
+            self._catch_up()
+            trade = self._trades.get(trade_id)
+            return dict(trade) if trade else None
+
+    def all(self) -> dict:
+        """جميع الصفقات {id: trade}"""
+        with self._lock:
+            self._ensure_loaded()
+            self._catch_up()
+            return {trade_id: dict(trade) for trade_id, trade in self._trades.items()}
+
+    def page(self, predicate=None, after: str = None, limit: int = 100) -> list:
+        """
+        صفحة من الصفقات بترتيب الإضافة تبدأ بعد الصفقة after
+        يُنسخ فقط ما يدخل في الصفحة (limit) وليس كل الصفقات
+
+        Raises:
+            KeyError: إذا لم يكن after صفقة معروفة
+        """
+        with self._lock:
+            self._ensure_loaded()
+            self._catch_up()
+            start = 0 if after is None else self._position[after] + 1
+            trades = []
+            for i in range(start, len(self._order)):
+                trade = self._trades[self._order[i]]
+                if predicate is None or predicate(trade):
+                    trades.append(dict(trade))
+                    if len(trades) >= limit:
+                        break
+            return trades
+
+    def with_trades(self, fn):
+        """تنفيذ fn(trades) على الحالة الحالية تحت القفل (بدون نسخ) - لا تُعدَّل الصفقات داخل fn"""
+        with self._lock:
+            self._ensure_loaded()
+            self._catch_up()
+            return fn(self._trades.values())
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            self._catch_up()
+            return len(self._trades)
+
+    # ───────────────────────────── كتابة ─────────────────────────────
+
+    def put(self, trade: dict) -> bool:
+        """إضافة صفقة (أو استبدالها بالكامل)"""
+        return self._append({'op': 'put', 'trade': trade})
+
+    def update(self, trade_id: str, fields: dict) -> bool:
+        """تحديث حقول صفقة موجودة"""
+        return self._append({'op': 'update', 'id': trade_id, 'fields': fields})
+
+    def update_if(self, trade_id: str, expected: dict, fields: dict) -> bool:
+        """
+        compare-and-set: تحديث الصفقة فقط إذا كانت حقولها ما زالت تطابق expected
+        الفحص والكتابة تحت قفل حصري (LOCK_EX) بعد التقاط أسطر الـ workers الآخرين، خارج group commit
+
+        Returns:
+            False إذا لم توجد الصفقة أو تغيرت (أو فشلت الكتابة)
+        """
+        line = json.dumps({'op': 'update', 'id': trade_id, 'fields': fields},
+                          ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self._cond:
+            self._ensure_loaded()
+            # لا نكتب أثناء دفعة القائد أو الضغط في هذه العملية
+            while self._flushing or self._compacting:
+                self._cond.wait()
+            try:
+                with open(self._lock_path, 'a') as lock_file:
+                    # قفل حصري: لا يكتب worker آخر بين الفحص والكتابة
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    self._catch_up()
+                    trade = self._trades.get(trade_id)
+                    if trade is None or any(trade.get(key) != value for key, value in expected.items()):
+                        return False
+                    os.write(self._fd, line)
+                    if self._fsync:
+                        os.fsync(self._fd)
+                    self._catch_up()
+                    return True
+            except Exception as e:
+                logger.error(f"❌ خطأ في حفظ الصفقات: {e}")
+                return False
+            finally:
+                self._cond.notify_all()
+
+    def _append(self, event: dict) -> bool:
+        """
+        كتابة حدث وانتظار حفظه على القرص
+        أول خيط يجد السجل غير مشغول يصبح القائد ويكتب كل الأحداث المنتظرة بـ write + fsync واحد
+        """
+        line = json.dumps(event, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self._cond:
+            self._ensure_loaded()
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending.append(line)
+
+            while self._committed_seq < seq:
+                if self._flushing or self._compacting:
+                    self._cond.wait()
+                    continue
+                self._flush_pending()
+
+            ok = not any(lo <= seq <= hi for lo, hi in self._failed)
+            should_compact = self._should_compact()
+
+        if should_compact:
+            self._start_compaction()
+        return ok
+
+    def _flush_pending(self):
+        """كتابة الدفعة الحالية (القائد) - يُستدعى تحت القفل ويحرره أثناء الكتابة"""
+        batch = b''.join(self._pending)
+        self._pending = []
+        last_seq = self._next_seq - 1
+        first_seq = self._committed_seq + 1
+        self._flushing = True
+        self._cond.release()
+        error = None
+        try:
+            with open(self._lock_path, 'a') as lock_file:
+                # قفل مشترك: عدة workers يمكنهم الكتابة معاً، لكن ليس أثناء الضغط
+                fcntl.flock(lock_file, fcntl.LOCK_SH)
+                if os.stat(self.path).st_ino != self._inode:
+                    self._cond.acquire()
+                    try:
+                        self._reopen()
+                    finally:
+                        self._cond.release()
+                os.write(self._fd, batch)
+                if self._fsync:
+                    os.fsync(self._fd)
+        except Exception as e:
+            error = e
+        finally:
+            self._cond.acquire()
+            self._flushing = False
+            self._committed_seq = last_seq
+            if error is not None:
+                logger.error(f"❌ خطأ في حفظ الصفقات: {error}")
+                self._failed = (self._failed + [(first_seq, last_seq)])[-16:]
+            self._catch_up()
+            self._cond.notify_all()
+
+    # ───────────────────────────── ضغط ─────────────────────────────
+
+    def _should_compact(self) -> bool:
+        return (
+            not self._compacting
+            and self._events >= self._compact_min_events
+            and self._events > self._compact_ratio * max(1, len(self._trades))
+        )
+
+    def _start_compaction(self):
+        t = threading.Thread(target=self.compact, name="journal-compaction", daemon=True)
+        t.start()
+
+    def compact(self) -> bool:
+        """إعادة كتابة السجل بسطر واحد لكل صفقة (يحد من حجم الملف)"""
+        with self._cond:
+            self._ensure_loaded()
+            if self._compacting:
+                return False
+            while self._flushing:
+                self._cond.wait()
+            self._compacting = True
+        try:
+            with open(self._lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                with self._cond:
+                    self._catch_up()
+                    trades = {trade_id: dict(trade) for trade_id, trade in self._trades.items()}
+                    before = self._events
+                self._write_compacted(trades)
+                with self._cond:
+                    self._reopen()
+            logger.info(f"🗜️ تم ضغط سجل الصفقات: {before} → {len(trades)} سطر")
+            return True
+        except Exception as e:
+            logger.error(f"❌ فشل ضغط سجل الصفقات: {e}")
+            return False
+        finally:
+            with self._cond:
+                self._compacting = False
+                self._cond.notify_all()
+
+    def _write_compacted(self, trades: dict):
+        """كتابة ملف جديد ثم استبدال القديم بشكل ذري (rename)"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for trade in trades.values():
+                f.write(json.dumps({'op': 'put', 'trade': trade}, ensure_ascii=False,
+                                   separators=(',', ':')).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._ensure_loaded()
+            self._catch_up()
+            return {'trades': len(self._trades), 'events': self._events, 'bytes': self._offset}
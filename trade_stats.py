@@ -0,0 +1,108 @@
+"""
+Trade Stats - عدادات تراكمية للصفقات تُحدَّث مع كل انتقال حالة
+حتى تعود /trades/stats بزمن ثابت بدلاً من المرور على كل الصفقات عدة مرات
+"""
+import threading
+
+from position_index import normalize_timeframe
+
+# الحالات التي تظهر دائماً في الإحصائيات (حتى لو كانت صفراً)
+STATS_STATUSES = ('open', 'tp1', 'tp2', 'tp3', 'closed', 'sl')
+TP_STATUSES = ('tp1', 'tp2', 'tp3')
+
+
+def trade_outcome(trade: dict):
+    """
+    نتيجة الصفقة: win إذا ضربت TP1 على الأقل (حتى لو ضُرب SL بعدها)، loss إذا ضُرب SL بدون أي هدف
+
+    Returns:
+        'win' أو 'loss' أو None للصفقات الحية/المغلقة بدون نتيجة
+    """
+    status = trade.get('status')
+    if status in TP_STATUSES or trade.get('max_tp'):
+        return 'win'
+    if status == 'sl':
+        return 'loss'
+    return None
+
+
+def _new_bucket() -> dict:
+    return {'total': 0, 'wins': 0, 'losses': 0}
+
+
+class TradeStats:
+    """
+    عدادات: لكل حالة، لكل رمز، لكل إطار زمني + مجموع الأرباح والخسائر
+    كل تغيير = طرح مساهمة النسخة القديمة من الصفقة وإضافة مساهمة الجديدة
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._total = 0
+            self._wins = 0
+            self._losses = 0
+            self._by_status = {}
+            self._by_symbol = {}
+            self._by_timeframe = {}
+
+    def trade_changed(self, old, new: dict):
+        with self._lock:
+            if old is not None:
+                self._apply(old, -1)
+            self._apply(new, 1)
+
+    def add_group(self, symbol, timeframe, status, reached_tp: bool, count: int):
+        """إضافة مجموعة صفقات متطابقة دفعة واحدة (من استعلام GROUP BY)"""
+        outcome = trade_outcome({'status': status, 'max_tp': reached_tp})
+        with self._lock:
+            self._add(symbol, timeframe, status, outcome, count)
+
+    def _apply(self, trade: dict, sign: int):
+        self._add(trade.get('symbol'), trade.get('timeframe'), trade.get('status'), trade_outcome(trade), sign)
+
+    def _add(self, symbol, timeframe, status, outcome, n: int):
+        win = n if outcome == 'win' else 0
+        loss = n if outcome == 'loss' else 0
+
+        self._total += n
+        self._wins += win
+        self._losses += loss
+        self._by_status[status] = self._by_status.get(status, 0) + n
+
+        for buckets, key in ((self._by_symbol, symbol), (self._by_timeframe, normalize_timeframe(timeframe))):
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = _new_bucket()
+            bucket['total'] += n
+            bucket['wins'] += win
+            bucket['losses'] += loss
+            if bucket['total'] == 0:
+                del buckets[key]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = {"total": self._total}
+            for status in STATS_STATUSES:
+                stats[status] = self._by_status.get(status, 0)
+            decided = self._wins + self._losses
+            stats.update({
+                "wins": self._wins,
+                "losses": self._losses,
+                "win_rate": round(self._wins / decided * 100, 2) if decided else 0.0,
+                "by_status": {k: v for k, v in self._by_status.items() if v},
+                "by_symbol": {k: dict(v) for k, v in self._by_symbol.items()},
+                "by_timeframe": {k: dict(v) for k, v in self._by_timeframe.items()},
+            })
+            return stats
+
+    @classmethod
+    def from_trades(cls, trades) -> 'TradeStats':
+        """بناء العدادات من الصفر (للتحقق من التطابق)"""
+        stats = cls()
+        for trade in trades:
+            stats.trade_changed(None, trade)
+        return stats
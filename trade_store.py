@@ -0,0 +1,554 @@
+"""
+Trade Store - واجهة تخزين الصفقات مع أكثر من backend
+journal: سجل JSONL إلحاقي (trade_journal.py)
+sqlite: قاعدة SQLite (WAL) مع فهارس على (symbol, status) و entry_time و status
+        + سجل تغييرات (trade_changes) تطبقه workers الأخرى على فهارسها كفروقات
+
+ترحيل trades.json القديم (مرة واحدة):
+    python trade_store.py migrate trades.json --backend sqlite
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from trade_journal import TradeJournal
+from position_index import PositionIndex, LIVE_STATUSES, next_status
+from trade_stats import TradeStats
+
+logger = logging.getLogger(__name__)
+
+# الحالات التي تعتبر الصفقة فيها مغلقة
+CLOSED_STATUSES = ('closed', 'tp3', 'sl')
+# محاولات compare-and-set لحدث صفقة (كل فشل = worker آخر غيّر الصفقة بين البحث والتحديث)
+TRANSITION_ATTEMPTS = 5
+
+
+class TradeStore:
+    """
+    الواجهة المشتركة لجميع backends
+    كل backend يبلّغ عن كل تغيير عبر trade_changed(old, new) حتى تبقى الفهارس في الذاكرة محدثة
+    """
+
+    def __init__(self):
+        self.positions = PositionIndex()
+        self.counters = TradeStats()
+
+    def reset(self):
+        """إعادة بناء الفهارس المشتقة (تُستدعى قبل إعادة تطبيق كل الصفقات)"""
+        self.positions.reset()
+        self.counters.reset()
+
+    def trade_changed(self, old, new: dict):
+        self.positions.trade_changed(old, new)
+        self.counters.trade_changed(old, new)
+
+    def sync(self):
+        """التقاط التغييرات التي قامت بها عمليات أخرى قبل الاستعلام من الفهارس"""
+
+    def find_live_trade(self, symbol: str, timeframe=None, direction=None):
+        """أحدث صفقة حية (open/tp1/tp2) للرمز والإطار الزمني والاتجاه - بحث بزمن ثابت في الفهرس"""
+        self.sync()
+        trade_id = self.positions.find(symbol, timeframe, direction)
+        return self.get(trade_id) if trade_id else None
+
+    def apply_event(self, symbol: str, event: str, fields: dict, timeframe=None, direction=None) -> tuple:
+        """
+        تطبيق حدث TP1/TP2/TP3/SL على أحدث صفقة حية: البحث ثم next_status ثم compare-and-set على الحالة
+        إذا غيّر worker آخر الصفقة بين البحث والتحديث يُعاد البحث (فلا ترجع tp2 إلى tp1)
+
+        Returns:
+            (trade قبل التحديث، الحالة الجديدة) - trade = None إذا لم توجد صفقة حية،
+            والحالة = None إذا كان الانتقال غير مسموح
+        """
+        trade = None
+        for _ in range(TRANSITION_ATTEMPTS):
+            trade = self.find_live_trade(symbol, timeframe, direction)
+            if trade is None:
+                return None, None
+            new_status = next_status(trade['status'], event)
+            if new_status is None:
+                return trade, None
+            changes = dict(fields, status=new_status)
+            if new_status != 'sl':
+                changes['max_tp'] = new_status  # آخر هدف تحقق (SL بعده يبقى صفقة رابحة في الإحصائيات)
+            if self.update_if(trade['id'], trade['status'], changes):
+                return trade, new_status
+        logger.warning(f"⚠️ تعذر تطبيق {event} على {trade['id']} بعد {TRANSITION_ATTEMPTS} محاولات (تحديثات متزامنة)")
+        return trade, None
+
+    def stats(self) -> dict:
+        """الإحصائيات من العدادات التراكمية (بدون المرور على الصفقات)"""
+        self.sync()
+        return self.counters.snapshot()
+
+    def verify_stats(self) -> dict:
+        """
+        فحص التطابق: إعادة حساب العدادات من التخزين ومقارنتها بالعدادات الحالية
+        عند الاختلاف يتم استبدال العدادات بالقيم المحسوبة
+
+        Returns:
+            {'consistent': bool, 'diff': {key: {'counters': ..., 'storage': ...}}}
+        """
+        raise NotImplementedError
+
+    def _compare_stats(self, fresh: TradeStats) -> dict:
+        """مقارنة العدادات الحالية بعدادات محسوبة من الصفر - تحت القفل الذي يحمي trade_changed"""
+        current = self.counters.snapshot()
+        expected = fresh.snapshot()
+        diff = {
+            key: {'counters': current.get(key), 'storage': expected.get(key)}
+            for key in set(current) | set(expected)
+            if current.get(key) != expected.get(key)
+        }
+        if diff:
+            logger.warning(f"⚠️ عدادات الصفقات غير متطابقة مع التخزين ({', '.join(sorted(diff))}) - تمت إعادة البناء")
+            self.counters = fresh
+        return {'consistent': not diff, 'diff': diff}
+
+    def add(self, trade: dict) -> bool:
+        raise NotImplementedError
+
+    def update(self, trade_id: str, fields: dict) -> bool:
+        raise NotImplementedError
+
+    def update_if(self, trade_id: str, status: str, fields: dict) -> bool:
+        """compare-and-set: تحديث الصفقة فقط إذا كانت حالتها ما زالت status (ذرياً بين workers)"""
+        raise NotImplementedError
+
+    def get(self, trade_id: str):
+        raise NotImplementedError
+
+    def all(self) -> dict:
+        """جميع الصفقات {id: trade} بترتيب الإضافة"""
+        raise NotImplementedError
+
+    def by_status(self, statuses) -> dict:
+        """الصفقات التي حالتها ضمن statuses"""
+        raise NotImplementedError
+
+    def by_symbol(self, symbol: str, statuses=None) -> dict:
+        """صفقات رمز معين (مع تصفية اختيارية بالحالة)"""
+        raise NotImplementedError
+
+    def count_by_status(self) -> dict:
+        """{status: count}"""
+        raise NotImplementedError
+
+    def page(self, statuses=None, symbol: str = None, after: str = None, limit: int = 100) -> tuple:
+        """
+        صفحة من الصفقات بترتيب الإضافة (cursor pagination)
+
+        Args:
+            statuses: تصفية اختيارية بالحالة
+            symbol: تصفية اختيارية بالرمز
+            after: id آخر صفقة في الصفحة السابقة (None = من البداية)
+            limit: عدد الصفقات في الصفحة
+
+        Returns:
+            (trades, next_cursor) - next_cursor = None إذا كانت هذه آخر صفحة
+
+        Raises:
+            ValueError: إذا لم يكن after صفقة معروفة
+        """
+        trades = self._page(tuple(statuses) if statuses else None, symbol, after, limit + 1)
+        if len(trades) > limit:
+            return trades[:limit], trades[limit - 1]['id']
+        return trades, None
+
+    def _page(self, statuses, symbol, after, limit) -> list:
+        raise NotImplementedError
+
+    def add_many(self, trades) -> int:
+        """إضافة عدة صفقات (للترحيل)"""
+        count = 0
+        for trade in trades:
+            if self.add(trade):
+                count += 1
+        return count
+
+
+class JournalTradeStore(TradeStore):
+    """Backend السجل الإلحاقي - الحالة كاملة في الذاكرة والاستعلامات تتم عليها"""
+
+    def __init__(self, path: str, legacy_path: str = None, fsync: bool = True, compact_min_events: int = 1000):
+        super().__init__()
+        self.journal = TradeJournal(path, legacy_path=legacy_path, fsync=fsync,
+                                    compact_min_events=compact_min_events, listener=self)
+
+    def sync(self):
+        self.journal.refresh()
+
+    def verify_stats(self) -> dict:
+        return self.journal.with_trades(lambda trades: self._compare_stats(TradeStats.from_trades(trades)))
+
+    def add(self, trade: dict) -> bool:
+        return self.journal.put(trade)
+
+    def update(self, trade_id: str, fields: dict) -> bool:
+        return self.journal.update(trade_id, fields)
+
+    def update_if(self, trade_id: str, status: str, fields: dict) -> bool:
+        return self.journal.update_if(trade_id, {'status': status}, fields)
+
+    def get(self, trade_id: str):
+        return self.journal.get(trade_id)
+
+    def all(self) -> dict:
+        return self.journal.all()
+
+    def by_status(self, statuses) -> dict:
+        statuses = set(statuses)
+        return {k: v for k, v in self.journal.all().items() if v.get('status') in statuses}
+
+    def by_symbol(self, symbol: str, statuses=None) -> dict:
+        return {
+            k: v for k, v in self.journal.all().items()
+            if v.get('symbol') == symbol and (statuses is None or v.get('status') in statuses)
+        }
+
+    def count_by_status(self) -> dict:
+        counts = {}
+        for trade in self.journal.all().values():
+            status = trade.get('status')
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def _page(self, statuses, symbol, after, limit) -> list:
+        def predicate(trade):
+            return ((symbol is None or trade.get('symbol') == symbol)
+                    and (statuses is None or trade.get('status') in statuses))
+        try:
+            return self.journal.page(predicate, after=after, limit=limit)
+        except KeyError:
+            raise ValueError(f"Unknown cursor: {after}")
+
+
+class SQLiteTradeStore(TradeStore):
+    """
+    Backend SQLite: الأعمدة المستخدمة في الاستعلامات منفصلة ومفهرسة، والصفقة كاملة في عمود data (JSON)
+    اتصال لكل خيط، ووضع WAL حتى لا تحجب القراءة الكتابة بين workers
+    كل كتابة تضيف (old, new) إلى trade_changes في نفس المعاملة - باقي workers يطبقون ما بعد آخر seq رأوه
+    بدلاً من إعادة بناء الفهارس بالكامل
+
+    Args:
+        path: ملف القاعدة
+        change_log_size: عدد التغييرات المحتفظ بها (worker تأخر أكثر من ذلك يعيد البناء بالكامل)
+        cleanup_interval: حذف التغييرات القديمة كل N ثانية
+    """
+
+    _SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS trades (
+            id TEXT PRIMARY KEY,
+            symbol TEXT NOT NULL,
+            status TEXT NOT NULL,
+            timeframe TEXT,
+            entry_time TEXT,
+            data TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_trades_symbol_status ON trades (symbol, status)",
+        "CREATE INDEX IF NOT EXISTS idx_trades_entry_time ON trades (entry_time)",
+        "CREATE INDEX IF NOT EXISTS idx_trades_status ON trades (status)",
+        """CREATE TABLE IF NOT EXISTS trade_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            old TEXT,
+            new TEXT NOT NULL
+        )""",
+    )
+
+    def __init__(self, path: str, change_log_size: int = 10000, cleanup_interval: float = 600):
+        super().__init__()
+        self.path = path
+        self.change_log_size = change_log_size
+        self.cleanup_interval = cleanup_interval
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._writer_pid = None
+        self._data_version = None
+        self._last_seq = 0
+        self._next_cleanup = 0.0
+        with self._write_lock:
+            conn = self._writer_conn()
+            for statement in self._SCHEMA:
+                conn.execute(statement)
+            self._rebuild_views()
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=check_same_thread)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        """اتصال القراءة الخاص بالخيط الحالي"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _writer_conn(self) -> sqlite3.Connection:
+        """اتصال الكتابة الوحيد في العملية (تحت _write_lock)"""
+        if self._writer is None or self._writer_pid != os.getpid():
+            self._writer = self._connect(check_same_thread=False)
+            self._writer_pid = os.getpid()
+        return self._writer
+
+    def _rebuild_views(self):
+        """
+        إعادة بناء الفهارس من القاعدة - تحت _write_lock (عند البدء أو إذا حُذفت تغييرات لم تُطبق بعد)
+        فهرس الصفقات الحية: الصفقات الحية فقط عبر فهرس status
+        العدادات: استعلام تجميعي واحد بدلاً من تحميل كل الصفقات
+        """
+        conn = self._writer_conn()
+        # معاملة قراءة: الصفقات وآخر seq من نفس اللقطة
+        conn.execute("BEGIN")
+        try:
+            self._load_views(conn)
+        finally:
+            conn.execute("COMMIT")
+        self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load_views(self, conn: sqlite3.Connection):
+        self.reset()
+        placeholders = ','.join('?' * len(LIVE_STATUSES))
+        rows = conn.execute(f"SELECT data FROM trades WHERE status IN ({placeholders}) ORDER BY rowid", LIVE_STATUSES)
+        for (data,) in rows:
+            self.positions.trade_changed(None, json.loads(data))
+        # نفس الحقول التي تقرأها TradeStats من الصفقة (وليس الأعمدة ذات القيم الافتراضية)
+        rows = conn.execute(
+            "SELECT json_extract(data, '$.symbol'), json_extract(data, '$.timeframe'), "
+            "json_extract(data, '$.status'), json_extract(data, '$.max_tp') IS NOT NULL, COUNT(*) "
+            "FROM trades GROUP BY 1, 2, 3, 4"
+        )
+        for symbol, timeframe, status, reached_tp, count in rows:
+            self.counters.add_group(symbol, timeframe, status, bool(reached_tp), count)
+        self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM trade_changes").fetchone()[0]
+
+    def _apply_changes(self, conn: sqlite3.Connection):
+        """
+        تطبيق تغييرات workers الأخرى بعد آخر seq على الفهارس - تحت _write_lock
+        (استعلام مدى على المفتاح الأساسي، بدون المرور على الصفقات)
+        """
+        oldest = conn.execute("SELECT MIN(seq) FROM trade_changes").fetchone()[0]
+        if oldest is not None and oldest > self._last_seq + 1:
+            # حُذفت تغييرات لم نطبقها بعد (worker متأخر جداً)
+            logger.warning("⚠️ سجل تغييرات الصفقات تجاوز هذا الـ worker - إعادة بناء الفهارس")
+            self._load_views(conn)
+            return
+        rows = conn.execute("SELECT seq, old, new FROM trade_changes WHERE seq > ? ORDER BY seq", (self._last_seq,))
+        for seq, old, new in rows:
+            self.trade_changed(json.loads(old) if old else None, json.loads(new))
+            self._last_seq = seq
+
+    def sync(self):
+        with self._write_lock:
+            self.sync_locked()
+
+    @staticmethod
+    def _row(trade: dict) -> tuple:
+        return (
+            trade['id'],
+            trade.get('symbol', 'UNKNOWN'),
+            trade.get('status', 'open'),
+            str(trade.get('timeframe', 'N/A')),
+            trade.get('entry_time'),
+            json.dumps(trade, ensure_ascii=False),
+        )
+
+    def _query(self, where: str = '', params: tuple = ()) -> dict:
+        rows = self._conn().execute(f"SELECT data FROM trades {where} ORDER BY rowid", params)
+        trades = {}
+        for (data,) in rows:
+            trade = json.loads(data)
+            trades[trade['id']] = trade
+        return trades
+
+    def _write(self, trades, merge: bool = False, expected_status: str = None) -> list:
+        """
+        كتابة صفقة أو أكثر في معاملة واحدة وإبلاغ الفهارس
+        merge=True: trades = [(trade_id, fields)] لتحديث صفقات موجودة
+        expected_status: مع merge - التحديث فقط إذا كانت الحالة الحالية (داخل المعاملة) هي نفسها
+        """
+        changes = []
+        with self._write_lock:
+            conn = self._writer_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # بعد قفل الكتابة لا يكتب worker آخر - نطبق ما سبقنا ثم نضيف تغييراتنا بعده
+                self._apply_changes(conn)
+                for item in trades:
+                    trade_id = item[0] if merge else item['id']
+                    row = conn.execute("SELECT data FROM trades WHERE id = ?", (trade_id,)).fetchone()
+                    old = json.loads(row[0]) if row else None
+                    if merge:
+                        if old is None or (expected_status is not None and old.get('status') != expected_status):
+                            continue
+                        new = dict(old)
+                        new.update(item[1])
+                    else:
+                        new = item
+                    # upsert (وليس INSERT OR REPLACE) حتى يبقى rowid ثابتاً - الترتيب والصفحات تعتمد عليه
+                    conn.execute(
+                        "INSERT INTO trades (id, symbol, status, timeframe, entry_time, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (id) DO UPDATE SET symbol = excluded.symbol, status = excluded.status, "
+                        "timeframe = excluded.timeframe, entry_time = excluded.entry_time, data = excluded.data",
+                        self._row(new)
+                    )
+                    seq = conn.execute(
+                        "INSERT INTO trade_changes (old, new) VALUES (?, ?)",
+                        (json.dumps(old, ensure_ascii=False) if old else None, json.dumps(new, ensure_ascii=False))
+                    ).lastrowid
+                    changes.append((old, new))
+                now = time.time()
+                if changes and now >= self._next_cleanup:
+                    self._next_cleanup = now + self.cleanup_interval
+                    conn.execute("DELETE FROM trade_changes WHERE seq <= ?", (seq - self.change_log_size,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            for old, new in changes:
+                self.trade_changed(old, new)
+            if changes:
+                self._last_seq = seq
+        return changes
+
+    def verify_stats(self) -> dict:
+        with self._write_lock:
+            self.sync_locked()
+            rows = self._writer_conn().execute("SELECT data FROM trades")
+            fresh = TradeStats.from_trades(json.loads(data) for (data,) in rows)
+            return self._compare_stats(fresh)
+
+    def sync_locked(self):
+        """data_version يتغير فقط عندما يكتب اتصال آخر (worker آخر) - عندها نطبق تغييراته فقط"""
+        conn = self._writer_conn()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            conn.execute("BEGIN")
+            try:
+                self._apply_changes(conn)
+            finally:
+                conn.execute("COMMIT")
+            self._data_version = version
+
+    def add(self, trade: dict) -> bool:
+        try:
+            self._write([trade])
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"❌ خطأ في حفظ الصفقة: {e}")
+            return False
+
+    def add_many(self, trades) -> int:
+        return len(self._write(list(trades)))
+
+    def update(self, trade_id: str, fields: dict) -> bool:
+        try:
+            return bool(self._write([(trade_id, fields)], merge=True))
+        except sqlite3.Error as e:
+            logger.error(f"❌ خطأ في تحديث الصفقة: {e}")
+            return False
+
+    def update_if(self, trade_id: str, status: str, fields: dict) -> bool:
+        try:
+            return bool(self._write([(trade_id, fields)], merge=True, expected_status=status))
+        except sqlite3.Error as e:
+            logger.error(f"❌ خطأ في تحديث الصفقة: {e}")
+            return False
+
+    def get(self, trade_id: str):
+        row = self._conn().execute("SELECT data FROM trades WHERE id = ?", (trade_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all(self) -> dict:
+        return self._query()
+
+    def by_status(self, statuses) -> dict:
+        statuses = tuple(statuses)
+        placeholders = ','.join('?' * len(statuses))
+        return self._query(f"WHERE status IN ({placeholders})", statuses)
+
+    def by_symbol(self, symbol: str, statuses=None) -> dict:
+        if statuses is None:
+            return self._query("WHERE symbol = ?", (symbol,))
+        statuses = tuple(statuses)
+        placeholders = ','.join('?' * len(statuses))
+        return self._query(f"WHERE symbol = ? AND status IN ({placeholders})", (symbol,) + statuses)
+
+    def count_by_status(self) -> dict:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM trades GROUP BY status")
+        return {status: count for status, count in rows}
+
+    def _page(self, statuses, symbol, after, limit) -> list:
+        conn = self._conn()
+        conditions, params = [], []
+        if after is not None:
+            row = conn.execute("SELECT rowid FROM trades WHERE id = ?", (after,)).fetchone()
+            if row is None:
+                raise ValueError(f"Unknown cursor: {after}")
+            conditions.append("rowid > ?")
+            params.append(row[0])
+        if symbol is not None:
+            conditions.append("symbol = ?")
+            params.append(symbol)
+        if statuses is not None:
+            conditions.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = conn.execute(f"SELECT data FROM trades {where} ORDER BY rowid LIMIT ?", params + [limit])
+        return [json.loads(data) for (data,) in rows]
+
+
+def create_trade_store(backend: str, journal_path: str = 'trades.jsonl', db_path: str = 'trades.db',
+                       legacy_path: str = None, fsync: bool = True, compact_min_events: int = 1000) -> TradeStore:
+    """إنشاء backend حسب الإعدادات (TRADE_STORE_BACKEND)"""
+    backend = (backend or 'journal').lower()
+    if backend == 'sqlite':
+        logger.info(f"💾 تخزين الصفقات: SQLite ({db_path})")
+        return SQLiteTradeStore(db_path)
+    if backend != 'journal':
+        logger.warning(f"⚠️ Backend غير معروف: {backend} - سيتم استخدام journal")
+    return JournalTradeStore(journal_path, legacy_path=legacy_path, fsync=fsync,
+                             compact_min_events=compact_min_events)
+
+
+def load_trades_file(path: str) -> dict:
+    """قراءة ملف صفقات قديم: trades.json (dict) أو trades.jsonl (سجل)"""
+    if path.endswith('.jsonl'):
+        return TradeJournal(path).all()
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def migrate(source_path: str, store: TradeStore) -> int:
+    """ترحيل جميع الصفقات من ملف قديم إلى backend (مرة واحدة)"""
+    trades = load_trades_file(source_path)
+    count = store.add_many(trades.values())
+    logger.info(f"📦 تم ترحيل {count} صفقة من {source_path}")
+    return count
+
+
+if __name__ == '__main__':
+    import argparse
+    from config import TRADE_STORE_BACKEND, TRADES_JOURNAL_FILE, TRADES_DB_FILE
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Trade store tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = sub.add_parser('migrate', help="ترحيل trades.json (أو trades.jsonl) إلى backend")
+    migrate_parser.add_argument('source', help="trades.json أو trades.jsonl")
+    migrate_parser.add_argument('--backend', default=TRADE_STORE_BACKEND)
+    migrate_parser.add_argument('--db', default=TRADES_DB_FILE)
+    migrate_parser.add_argument('--journal', default=TRADES_JOURNAL_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        target = create_trade_store(args.backend, journal_path=args.journal, db_path=args.db)
+        migrate(args.source, target)